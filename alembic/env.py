@@ -16,7 +16,7 @@ settings = load_settings()
 config.set_main_option("sqlalchemy.url", settings.database_url)
 
 if config.config_file_name is not None:
-    fileConfig(config.config_file_name)
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
 logger = logging.getLogger("alembic.env")
 
 target_metadata = Base.metadata
@@ -41,6 +41,7 @@ def do_run_migrations(connection):
     context.configure(
         connection=connection,
         target_metadata=target_metadata,
+        render_as_batch=connection.dialect.name == "sqlite",
     )
 
     with context.begin_transaction():
@@ -4,7 +4,6 @@ from __future__ import annotations
 
 import sqlalchemy as sa
 from alembic import op
-from sqlalchemy.dialects import postgresql
 
 # revision identifiers, used by Alembic.
 revision = "0001_initial"
@@ -31,7 +30,7 @@ def upgrade() -> None:
 
     op.create_table(
         "vpn_keys",
-        sa.Column("id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("id", sa.Uuid(), nullable=False),
         sa.Column("user_id", sa.Integer(), nullable=False),
         sa.Column("name", sa.String(length=120), nullable=False),
         sa.Column("public_key", sa.String(length=512), nullable=True),
@@ -40,7 +39,7 @@ def upgrade() -> None:
         sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
         sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
         sa.Column("revoked_at", sa.DateTime(timezone=True), nullable=True),
-        sa.Column("rotated_from_id", postgresql.UUID(as_uuid=True), nullable=True),
+        sa.Column("rotated_from_id", sa.Uuid(), nullable=True),
         sa.ForeignKeyConstraint(["rotated_from_id"], ["vpn_keys.id"]),
         sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
         sa.PrimaryKeyConstraint("id"),
@@ -49,7 +48,7 @@ def upgrade() -> None:
 
     op.create_table(
         "alerts",
-        sa.Column("id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("id", sa.Uuid(), nullable=False),
         sa.Column("user_id", sa.Integer(), nullable=True),
         sa.Column("level", sa.String(length=32), nullable=False),
         sa.Column("message", sa.Text(), nullable=False),
@@ -60,7 +59,7 @@ def upgrade() -> None:
 
     op.create_table(
         "billing_events",
-        sa.Column("id", postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column("id", sa.Uuid(), nullable=False),
         sa.Column("user_id", sa.Integer(), nullable=False),
         sa.Column("amount", sa.Integer(), nullable=False),
         sa.Column("event_type", sa.String(length=64), nullable=False),
@@ -0,0 +1,45 @@
+"""servers pool and key placement"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0002_servers"
+down_revision = "0001_initial"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Таблица серверов и привязка ключа к серверу."""
+
+    op.create_table(
+        "servers",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("name", sa.String(length=64), nullable=False),
+        sa.Column("endpoint", sa.String(length=255), nullable=False),
+        sa.Column("public_key", sa.String(length=512), nullable=False),
+        sa.Column("address_cidr", sa.String(length=64), nullable=False),
+        sa.Column("interface", sa.String(length=32), nullable=False, server_default="wg0"),
+        sa.Column("capacity", sa.Integer(), nullable=True),
+        sa.Column("is_active", sa.Boolean(), nullable=False, server_default=sa.text("true")),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("name"),
+    )
+    with op.batch_alter_table("vpn_keys") as batch:
+        batch.add_column(sa.Column("server_id", sa.Integer(), nullable=True))
+        batch.create_foreign_key("fk_vpn_keys_server_id", "servers", ["server_id"], ["id"])
+        batch.create_index(op.f("ix_vpn_keys_server_id"), ["server_id"], unique=False)
+
+
+def downgrade() -> None:
+    """Откат миграции."""
+
+    with op.batch_alter_table("vpn_keys") as batch:
+        batch.drop_index(op.f("ix_vpn_keys_server_id"))
+        batch.drop_constraint("fk_vpn_keys_server_id", type_="foreignkey")
+        batch.drop_column("server_id")
+    op.drop_table("servers")
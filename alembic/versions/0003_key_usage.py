@@ -0,0 +1,39 @@
+"""peer traffic rollups and last handshake"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0003_key_usage"
+down_revision = "0002_servers"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Агрегаты трафика по ключам и время последнего handshake."""
+
+    op.create_table(
+        "key_usage",
+        sa.Column("key_id", sa.Uuid(), nullable=False),
+        sa.Column("resolution", sa.SmallInteger(), nullable=False),
+        sa.Column("bucket_start", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("rx_bytes", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("tx_bytes", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.ForeignKeyConstraint(["key_id"], ["vpn_keys.id"]),
+        sa.PrimaryKeyConstraint("key_id", "resolution", "bucket_start"),
+    )
+    with op.batch_alter_table("vpn_keys") as batch:
+        batch.add_column(sa.Column("last_handshake_at", sa.DateTime(timezone=True), nullable=True))
+        batch.create_index(op.f("ix_vpn_keys_last_handshake_at"), ["last_handshake_at"], unique=False)
+
+
+def downgrade() -> None:
+    """Откат миграции."""
+
+    with op.batch_alter_table("vpn_keys") as batch:
+        batch.drop_index(op.f("ix_vpn_keys_last_handshake_at"))
+        batch.drop_column("last_handshake_at")
+    op.drop_table("key_usage")
@@ -0,0 +1,30 @@
+"""per-user active key counter"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0004_active_key_count"
+down_revision = "0003_key_usage"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Счётчик неотозванных ключей пользователя, заполняется по текущим данным."""
+
+    with op.batch_alter_table("users") as batch:
+        batch.add_column(sa.Column("active_key_count", sa.Integer(), nullable=False, server_default="0"))
+    op.execute(
+        "UPDATE users SET active_key_count = ("
+        "SELECT count(*) FROM vpn_keys WHERE vpn_keys.user_id = users.id AND vpn_keys.revoked_at IS NULL)"
+    )
+
+
+def downgrade() -> None:
+    """Откат миграции."""
+
+    with op.batch_alter_table("users") as batch:
+        batch.drop_column("active_key_count")
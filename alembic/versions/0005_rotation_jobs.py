@@ -0,0 +1,35 @@
+"""scheduled key rotation progress"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0005_rotation_jobs"
+down_revision = "0004_active_key_count"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Таблица проходов плановой ротации."""
+
+    op.create_table(
+        "rotation_jobs",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("created_before", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("cursor", sa.Uuid(), nullable=True),
+        sa.Column("total", sa.Integer(), nullable=False),
+        sa.Column("rotated", sa.Integer(), nullable=False),
+        sa.Column("failed", sa.Integer(), nullable=False),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade() -> None:
+    """Откат миграции."""
+
+    op.drop_table("rotation_jobs")
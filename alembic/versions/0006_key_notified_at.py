@@ -0,0 +1,26 @@
+"""expiry reminder marker"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0006_key_notified_at"
+down_revision = "0005_rotation_jobs"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Отметка о напоминании об истечении ключа."""
+
+    with op.batch_alter_table("vpn_keys") as batch:
+        batch.add_column(sa.Column("notified_at", sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Откат миграции."""
+
+    with op.batch_alter_table("vpn_keys") as batch:
+        batch.drop_column("notified_at")
@@ -0,0 +1,41 @@
+"""admin broadcasts and blocked users"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0007_broadcasts"
+down_revision = "0006_key_notified_at"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Таблица рассылок и отметка о блокировке бота пользователем."""
+
+    op.create_table(
+        "broadcasts",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("text", sa.Text(), nullable=False),
+        sa.Column("created_by", sa.BigInteger(), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False),
+        sa.Column("cursor", sa.Integer(), nullable=False),
+        sa.Column("sent", sa.Integer(), nullable=False),
+        sa.Column("failed", sa.Integer(), nullable=False),
+        sa.Column("blocked", sa.Integer(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    with op.batch_alter_table("users") as batch:
+        batch.add_column(sa.Column("blocked_at", sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Откат миграции."""
+
+    with op.batch_alter_table("users") as batch:
+        batch.drop_column("blocked_at")
+    op.drop_table("broadcasts")
@@ -0,0 +1,29 @@
+"""admin dashboard counters"""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0008_dashboard_counters"
+down_revision = "0007_broadcasts"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Счётчики сводки админ-панели; заполняются сверкой при старте бота."""
+
+    op.create_table(
+        "dashboard_counters",
+        sa.Column("name", sa.String(length=64), nullable=False),
+        sa.Column("value", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade() -> None:
+    """Откат миграции."""
+
+    op.drop_table("dashboard_counters")
@@ -0,0 +1,42 @@
+"""indexes for admin search"""
+
+from __future__ import annotations
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0009_search_indexes"
+down_revision = "0008_dashboard_counters"
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ("ix_users_username_lower", "users", "lower(username)"),
+    ("ix_vpn_keys_user_id", "vpn_keys", "user_id"),
+    ("ix_vpn_keys_client_address", "vpn_keys", "client_address"),
+)
+
+
+def upgrade() -> None:
+    """Индексы поиска: начало username без учёта регистра, адрес клиента, владелец ключа.
+
+    В Postgres индексы строятся CONCURRENTLY, чтобы не блокировать запись в
+    большие таблицы; username индексируется с text_pattern_ops для LIKE 'abc%'.
+    """
+
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            for name, table, expression in INDEXES:
+                if name == "ix_users_username_lower":
+                    expression += " text_pattern_ops"
+                op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({expression})")
+        return
+    for name, table, expression in INDEXES:
+        op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({expression})")
+
+
+def downgrade() -> None:
+    """Откат миграции."""
+
+    for name, _, _ in INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
@@ -1,8 +1,20 @@
 from __future__ import annotations
 
+import re
+import secrets
+
 from aiogram.filters.callback_data import CallbackData
 
 
+def render_nonce() -> str:
+    """Nonce отрисовки меню для кнопок create/rotate (см. KeyActionGuard.keys_for).
+
+    :return: 8 hex-символов.
+    """
+
+    return secrets.token_hex(4)
+
+
 class MenuAction(CallbackData, prefix="menu"):
     """Действия из главного меню."""
 
@@ -13,6 +25,7 @@ class KeyCreateAction(CallbackData, prefix="key_create"):
     """Создание ключа с заданным TTL."""
 
     hours: int
+    nonce: str = ""
 
 
 class KeyRevokeAction(CallbackData, prefix="key_revoke"):
@@ -25,9 +38,68 @@ class KeyRotateAction(CallbackData, prefix="key_rotate"):
     """Ротация ключа."""
 
     key_id: str
+    nonce: str = ""
+
+
+class KeyRenewAction(CallbackData, prefix="key_renew"):
+    """Продление ключа на исходный срок."""
+
+    key_id: str
 
 
 class AdminAction(CallbackData, prefix="admin"):
     """Действия админ-панели."""
 
     action: str
+
+
+class BroadcastAction(CallbackData, prefix="broadcast"):
+    """Управление рассылкой: start, cancel, pause, resume."""
+
+    action: str
+    broadcast_id: int
+
+
+class AdminSearchPage(CallbackData, prefix="asearch", sep="|"):
+    """Страница результатов поиска админа (разделитель | — в IPv6 есть двоеточия)."""
+
+    query: str
+    page: int
+
+
+class AdminKeyAction(CallbackData, prefix="akey"):
+    """Действие админа над найденным ключом."""
+
+    action: str
+    key_id: str
+
+
+CALLBACK_TYPES = (
+    MenuAction,
+    KeyCreateAction,
+    KeyRevokeAction,
+    KeyRotateAction,
+    KeyRenewAction,
+    AdminAction,
+    BroadcastAction,
+    AdminSearchPage,
+    AdminKeyAction,
+)
+CALLBACK_PREFIXES = frozenset(callback_type.__prefix__ for callback_type in CALLBACK_TYPES)
+_PREFIX_END = re.compile(
+    "|".join(sorted({re.escape(callback_type.__separator__) for callback_type in CALLBACK_TYPES}))
+)
+
+
+def callback_prefix(data: str) -> str:
+    """Префикс CallbackData из строки коллбека (годится для метки метрики).
+
+    Разделители у типов разные (AdminSearchPage — «|»), а хвост может содержать
+    поисковые запросы админа, поэтому неизвестный префикс сводится к «other».
+
+    :param data: callback_query.data.
+    :return: префикс из CALLBACK_PREFIXES или «other».
+    """
+
+    prefix = _PREFIX_END.split(data, 1)[0]
+    return prefix if prefix in CALLBACK_PREFIXES else "other"
@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import io
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from aiogram.types import BufferedInputFile, FSInputFile, InputMediaDocument, Message
+
+from app.bot.outbound import OutboundQueue
+from app.config import Settings
+
+logger = logging.getLogger(__name__)
+
+MAX_QR_PAYLOAD_BYTES = 2048
+QR_BOX_SIZE = 6
+QR_BORDER = 2
+QR_RENDER_WORKERS = 2
+FILE_ID_CACHE_SIZE = 256
+QR_CAPTION = "QR-код для импорта в мобильное приложение WireGuard."
+
+
+def render_qr_png(payload: str) -> bytes:
+    """Рисует QR-код в PNG (чистый Python, без Pillow).
+
+    :param payload: кодируемый текст.
+    :return: PNG-байты.
+    :raises ValueError: если данные не влезают в ограничение MAX_QR_PAYLOAD_BYTES.
+    :raises ImportError: если пакет qrcode не установлен.
+    """
+
+    if len(payload.encode()) > MAX_QR_PAYLOAD_BYTES:
+        raise ValueError("Конфиг слишком большой для QR-кода")
+    import qrcode
+    from qrcode.image.pure import PyPNGImage
+
+    image = qrcode.make(
+        payload,
+        image_factory=PyPNGImage,
+        box_size=QR_BOX_SIZE,
+        border=QR_BORDER,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+    )
+    buffer = io.BytesIO()
+    image.save(buffer)
+    return buffer.getvalue()
+
+
+class FileIdCache:
+    """LRU-кэш file_id Telegram для повторной отправки одного и того же содержимого."""
+
+    def __init__(self, max_size: int = FILE_ID_CACHE_SIZE):
+        """Инициализация.
+
+        :param max_size: максимальное число записей.
+        """
+
+        self.max_size = max_size
+        self._items: OrderedDict[str, str] = OrderedDict()
+
+    def get(self, key: str) -> str | None:
+        """Возвращает file_id и помечает запись как свежую.
+
+        :param key: ключ содержимого.
+        :return: file_id или None.
+        """
+
+        file_id = self._items.get(key)
+        if file_id is not None:
+            self._items.move_to_end(key)
+        return file_id
+
+    def put(self, key: str, file_id: str) -> None:
+        """Сохраняет file_id, вытесняя самую старую запись.
+
+        :param key: ключ содержимого.
+        :param file_id: идентификатор файла на серверах Telegram.
+        :return: None.
+        """
+
+        self._items[key] = file_id
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+
+class ConfigDelivery:
+    """Выдача конфигов и статичных файлов пользователю.
+
+    QR-код рендерится в отдельном пуле потоков с ограничением параллельности, чтобы
+    не блокировать event loop и не раздувать память. В режиме bundle конфиг и QR уходят
+    одной медиагруппой (один вызов Bot API вместо двух). Статичные файлы загружаются
+    один раз, дальше переотправляются по file_id. Конфиги не кэшируются: в них приватный ключ.
+    """
+
+    def __init__(self, outbound: OutboundQueue, settings: Settings):
+        """Инициализация.
+
+        :param outbound: очередь исходящих сообщений.
+        :param settings: конфигурация приложения.
+        """
+
+        self.outbound = outbound
+        self.qr_enabled = settings.delivery_qr_enabled
+        self.bundle = settings.delivery_bundle
+        self.file_ids = FileIdCache()
+        self._executor = ThreadPoolExecutor(max_workers=QR_RENDER_WORKERS, thread_name_prefix="qr")
+        self._render_slots = asyncio.Semaphore(QR_RENDER_WORKERS * 2)
+
+    async def render_qr(self, payload: str) -> bytes | None:
+        """Рендерит QR вне event loop.
+
+        :param payload: текст конфига.
+        :return: PNG или None, если QR выключен/недоступен.
+        """
+
+        if not self.qr_enabled:
+            return None
+        async with self._render_slots:
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    self._executor, render_qr_png, payload
+                )
+            except (ImportError, ValueError) as exc:
+                logger.warning("QR rendering skipped: %s", exc)
+                return None
+
+    async def _config_files(
+        self, filename: str, config_text: str
+    ) -> tuple[BufferedInputFile, BufferedInputFile | None]:
+        """Файл конфига и (если включён) QR-код.
+
+        :param filename: имя файла конфига.
+        :param config_text: текст конфига WireGuard.
+        :return: (конфиг, QR или None).
+        """
+
+        config_file = BufferedInputFile(config_text.encode(), filename=filename)
+        qr_png = await self.render_qr(config_text)
+        if qr_png is None:
+            return config_file, None
+        return config_file, BufferedInputFile(qr_png, filename=f"{Path(filename).stem}-qr.png")
+
+    async def send_config(self, message: Message, filename: str, config_text: str, caption: str) -> None:
+        """Отправляет конфиг (и QR-код, если включён) в чат сообщения.
+
+        :param message: сообщение, в чат которого отправляем.
+        :param filename: имя файла конфига.
+        :param config_text: текст конфига WireGuard.
+        :param caption: подпись.
+        :return: None.
+        """
+
+        config_file, qr_file = await self._config_files(filename, config_text)
+        if qr_file is None:
+            await self.outbound.answer_document(message, config_file, caption=caption)
+            return
+        if self.bundle:
+            await self.outbound.answer_media_group(
+                message,
+                [
+                    InputMediaDocument(media=config_file),
+                    InputMediaDocument(media=qr_file, caption=f"{caption}\n{QR_CAPTION}"),
+                ],
+            )
+            return
+        await self.outbound.answer_document(message, config_file, caption=caption)
+        await self.outbound.answer_photo(message, qr_file, caption=QR_CAPTION)
+
+    async def send_config_to(self, bot, chat_id: int, filename: str, config_text: str, caption: str) -> None:
+        """Отправляет конфиг в чат по id — для фоновых задач, не отвечающих на апдейт.
+
+        :param bot: экземпляр aiogram Bot.
+        :param chat_id: чат-получатель.
+        :param filename: имя файла конфига.
+        :param config_text: текст конфига WireGuard.
+        :param caption: подпись.
+        :return: None.
+        """
+
+        config_file, qr_file = await self._config_files(filename, config_text)
+        if qr_file is None:
+            await self.outbound.send_document(bot, chat_id, config_file, caption=caption)
+            return
+        if self.bundle:
+            await self.outbound.send_media_group(
+                bot,
+                chat_id,
+                [
+                    InputMediaDocument(media=config_file),
+                    InputMediaDocument(media=qr_file, caption=f"{caption}\n{QR_CAPTION}"),
+                ],
+            )
+            return
+        await self.outbound.send_document(bot, chat_id, config_file, caption=caption)
+        await self.outbound.send_photo(bot, chat_id, qr_file, caption=QR_CAPTION)
+
+    async def send_static_photo(self, message: Message, path: str, caption: str | None = None) -> None:
+        """Отправляет статичную картинку, загружая её только один раз.
+
+        :param message: сообщение, в чат которого отправляем.
+        :param path: путь к файлу.
+        :param caption: подпись.
+        :return: None.
+        """
+
+        file_path = Path(path)
+        stat = file_path.stat()
+        key = hashlib.sha1(f"{file_path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+        file_id = self.file_ids.get(key)
+        if file_id is not None:
+            await self.outbound.answer_photo(message, file_id, caption=caption)
+            return
+        sent = await self.outbound.answer_photo(message, FSInputFile(file_path), caption=caption)
+        if sent is not None and getattr(sent, "photo", None):
+            self.file_ids.put(key, sent.photo[-1].file_id)
+
+    def close(self) -> None:
+        """Останавливает пул рендеринга.
+
+        :return: None.
+        """
+
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,47 +1,287 @@
 from __future__ import annotations
 
+import datetime as dt
+import uuid
+
 from aiogram import Router, F
-from aiogram.types import CallbackQuery
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.filters import Command, CommandObject
+from aiogram.types import BufferedInputFile, CallbackQuery, Message
 
-from app.bot.callbacks import AdminAction, MenuAction
-from app.bot.keyboards import admin_keyboard, main_menu
+from app.bot.callbacks import AdminAction, AdminKeyAction, AdminSearchPage, BroadcastAction, MenuAction
+from app.bot.keyboards import (
+    admin_keyboard,
+    broadcast_confirm_keyboard,
+    broadcasts_keyboard,
+    main_menu,
+    search_keyboard,
+)
+from app.bot.outbound import OutboundQueue
+from app.broadcast import BroadcastEngine
 from app.config import Settings
-from app.db import SessionMaker
+from app.dashboard import load_summary
+from app.db import SessionMaker, SessionRouter
+from app.profiler import MAX_PROFILE_SECONDS, ProfilerBusyError, profile_process
+from app.repositories import BroadcastRepository, VpnKeyRepository
+from app.search import KeyQuery
 from app.services import KeyService
 
 router = Router()
 
+SEARCH_PAGE_SIZE = 10
+SEARCH_HINT = "Поиск ключей: /find и Telegram ID, @username, IP или начало id ключа."
+
+BROADCAST_STATUS = {
+    "draft": "черновик",
+    "running": "идёт",
+    "paused": "пауза",
+    "done": "завершена",
+    "cancelled": "отменена",
+}
+
 
 @router.callback_query(MenuAction.filter(F.action == "admin"))
-async def admin_panel(callback: CallbackQuery, settings: Settings) -> None:
+async def admin_panel(
+    callback: CallbackQuery, settings: Settings, outbound: OutboundQueue
+) -> None:
     """Открывает админ-панель.
 
     :param callback: входящий CallbackQuery.
     :return: None.
     """
 
-    await callback.message.edit_text(
-        "Админ-панель: выбери фильтр.",
+    await outbound.edit_text(
+        callback.message,
+        f"Админ-панель: выбери фильтр.\n{SEARCH_HINT}",
         reply_markup=admin_keyboard(),
     )
     await callback.answer()
 
 
+@router.callback_query(AdminAction.filter(F.action == "profile"))
+async def admin_profile(
+    callback: CallbackQuery, settings: Settings, outbound: OutboundQueue
+) -> None:
+    """Снимает CPU-профиль процесса и отправляет его файлом.
+
+    :param callback: входящий CallbackQuery.
+    :return: None.
+    """
+
+    seconds = min(settings.profiler_seconds, MAX_PROFILE_SECONDS)
+    await callback.answer(f"Профилирую {seconds} с…")
+    try:
+        profile = await profile_process(seconds)
+    except ProfilerBusyError as exc:
+        await outbound.answer(callback.message, str(exc))
+        return
+    stamp = dt.datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    await outbound.answer_document(
+        callback.message,
+        BufferedInputFile(profile, filename=f"profile-{stamp}.collapsed.txt"),
+        caption=f"CPU-профиль за {seconds} с (collapsed stacks: flamegraph.pl / speedscope).",
+    )
+
+
+@router.message(Command("broadcast"))
+async def admin_broadcast_draft(
+    message: Message, command: CommandObject, session_maker: SessionMaker, outbound: OutboundQueue
+) -> None:
+    """Создаёт черновик рассылки и показывает админу превью с подтверждением.
+
+    :param message: входящее сообщение `/broadcast <текст>`.
+    :param command: разобранная команда.
+    :return: None.
+    """
+
+    text = (command.args or "").strip()
+    if not text or message.from_user is None:
+        await outbound.answer(
+            message, "Использование: /broadcast <текст сообщения для всех пользователей>", parse_mode=None
+        )
+        return
+    async with session_maker() as session:
+        broadcast = await BroadcastRepository(session).add(text, created_by=message.from_user.id)
+        await session.commit()
+    try:
+        # Превью в том же виде, что получат пользователи: ошибка разметки видна до отправки.
+        await outbound.answer(message, text, reply_markup=broadcast_confirm_keyboard(broadcast.id))
+    except TelegramBadRequest as exc:
+        await outbound.answer(message, f"Telegram не принял текст рассылки: {exc.message}", parse_mode=None)
+
+
+@router.callback_query(BroadcastAction.filter())
+async def admin_broadcast_control(
+    callback: CallbackQuery,
+    callback_data: BroadcastAction,
+    broadcasts: BroadcastEngine,
+    outbound: OutboundQueue,
+) -> None:
+    """Подтверждение, отмена, пауза и продолжение рассылки.
+
+    :param callback: входящий CallbackQuery.
+    :param callback_data: действие и id рассылки.
+    :return: None.
+    """
+
+    broadcast_id = callback_data.broadcast_id
+    handlers = {
+        "start": (broadcasts.start, "Рассылка #{id} запущена."),
+        "cancel": (broadcasts.cancel, "Рассылка #{id} отменена."),
+        "pause": (broadcasts.pause, "Рассылка #{id} остановится на ближайшей контрольной точке."),
+        "resume": (broadcasts.resume, "Рассылка #{id} продолжена."),
+    }
+    action = handlers.get(callback_data.action)
+    if action is None:
+        await callback.answer()
+        return
+    method, done_text = action
+    if not await method(broadcast_id):
+        await callback.answer("Статус рассылки уже изменился.", show_alert=True)
+        return
+    await callback.answer(done_text.format(id=broadcast_id))
+    if callback_data.action in ("start", "cancel"):
+        await outbound.edit_reply_markup(callback.message, reply_markup=None)
+
+
+async def _search_page(sessions: SessionRouter, text: str, page: int):
+    """Страница результатов поиска: текст сообщения и клавиатура."""
+
+    try:
+        query = KeyQuery.parse(text)
+    except ValueError as exc:
+        return f"{exc}.\n{SEARCH_HINT}", None
+    async with sessions.reader()() as session:
+        rows = await VpnKeyRepository(session).search(
+            query, limit=SEARCH_PAGE_SIZE + 1, offset=page * SEARCH_PAGE_SIZE
+        )
+    has_next = len(rows) > SEARCH_PAGE_SIZE
+    rows = rows[:SEARCH_PAGE_SIZE]
+    if not rows:
+        lines = ["Ничего не найдено."]
+    else:
+        lines = [
+            f"{'✅' if key.is_active else '⛔'} {key.name} · tg {telegram_id}"
+            f"{f' @{username}' if username else ''} · {key.client_address or '—'} · "
+            f"до {key.expires_at:%Y-%m-%d %H:%M UTC} · {key.id}"
+            for key, telegram_id, username in rows
+        ]
+    header = f"🔎 {text.strip()} — стр. {page + 1}"
+    return "\n".join([header, *lines]), search_keyboard(text.strip(), page, [row[0] for row in rows], has_next)
+
+
+@router.message(Command("find"))
+async def admin_search(
+    message: Message, command: CommandObject, sessions: SessionRouter, outbound: OutboundQueue
+) -> None:
+    """Ищет ключи по Telegram ID, началу username, адресу клиента или началу id ключа.
+
+    :param message: входящее сообщение `/find <запрос>`.
+    :param command: разобранная команда.
+    :return: None.
+    """
+
+    text, markup = await _search_page(sessions, command.args or "", page=0)
+    await outbound.answer(message, text, reply_markup=markup, parse_mode=None)
+
+
+@router.callback_query(AdminSearchPage.filter())
+async def admin_search_page(
+    callback: CallbackQuery,
+    callback_data: AdminSearchPage,
+    sessions: SessionRouter,
+    outbound: OutboundQueue,
+) -> None:
+    """Листает результаты поиска.
+
+    :param callback: входящий CallbackQuery.
+    :param callback_data: запрос и номер страницы.
+    :return: None.
+    """
+
+    text, markup = await _search_page(sessions, callback_data.query, max(callback_data.page, 0))
+    await outbound.edit_text(callback.message, text, reply_markup=markup, parse_mode=None)
+    await callback.answer()
+
+
+@router.callback_query(AdminKeyAction.filter(F.action == "revoke"))
+async def admin_revoke_key(
+    callback: CallbackQuery,
+    callback_data: AdminKeyAction,
+    settings: Settings,
+    session_maker: SessionMaker,
+) -> None:
+    """Отзывает найденный ключ любого пользователя.
+
+    :param callback: входящий CallbackQuery.
+    :param callback_data: id ключа.
+    :return: None.
+    """
+
+    async with session_maker() as session:
+        revoked = await KeyService(session=session, settings=settings).revoke_key(uuid.UUID(callback_data.key_id))
+        await session.commit()
+    await callback.answer("Ключ отозван." if revoked else "Ключ не найден.", show_alert=not revoked)
+
+
+@router.callback_query(AdminAction.filter(F.action == "summary"))
+async def admin_summary(
+    callback: CallbackQuery, settings: Settings, sessions: SessionRouter, outbound: OutboundQueue
+) -> None:
+    """Сводка по счётчикам: пользователи, ключи, сроки, пулы, списания.
+
+    :param callback: входящий CallbackQuery.
+    :return: None.
+    """
+
+    async with sessions.reader()() as session:
+        summary = await load_summary(session, settings)
+    await outbound.edit_text(callback.message, summary.render(), reply_markup=admin_keyboard())
+    await callback.answer()
+
+
+@router.callback_query(AdminAction.filter(F.action == "broadcasts"))
+async def admin_broadcasts(
+    callback: CallbackQuery, sessions: SessionRouter, outbound: OutboundQueue
+) -> None:
+    """Последние рассылки с прогрессом и кнопками паузы/продолжения.
+
+    :param callback: входящий CallbackQuery.
+    :return: None.
+    """
+
+    async with sessions.writer()() as session:
+        items = await BroadcastRepository(session).latest(limit=5)
+    if not items:
+        text = "Рассылок ещё не было. Новая: /broadcast <текст>"
+    else:
+        lines = [
+            f"#{b.id} {b.created_at:%Y-%m-%d %H:%M} — {BROADCAST_STATUS.get(b.status, b.status)}: "
+            f"доставлено {b.sent}, ошибок {b.failed}, заблокировали {b.blocked}\n"
+            f"   {b.text[:60]}"
+            for b in items
+        ]
+        text = "\n".join(["Рассылки (новая: /broadcast <текст>):", *lines])
+    await outbound.edit_text(callback.message, text, reply_markup=broadcasts_keyboard(items), parse_mode=None)
+    await callback.answer()
+
+
 @router.callback_query(AdminAction.filter())
 async def admin_lists(
     callback: CallbackQuery,
     callback_data: AdminAction,
     settings: Settings,
-    session_maker: SessionMaker,
+    sessions: SessionRouter,
+    outbound: OutboundQueue,
 ) -> None:
-    """Показывает ключи с фильтрами для админов.
+    """Показывает ключи с фильтрами для админов (читает с реплики, если она есть).
 
     :param callback: входящий CallbackQuery.
     :param callback_data: распарсенная команда панели.
     :return: None.
     """
 
-    async with session_maker() as session:
+    async with sessions.reader()() as session:
         service = KeyService(session=session, settings=settings)
         if callback_data.action == "alerts":
             alerts = await service.latest_alerts(limit=20)
@@ -54,7 +294,7 @@ async def admin_lists(
                     for a in alerts
                 ]
                 text = "\n".join(lines)
-            await callback.message.edit_text(text, reply_markup=admin_keyboard())
+            await outbound.edit_text(callback.message, text, reply_markup=admin_keyboard())
             await callback.answer()
             return
         keys = await service.list_all()
@@ -80,21 +320,25 @@ async def admin_lists(
             for k in filtered
         ]
 
-    await callback.message.edit_text(
+    await outbound.edit_text(
+        callback.message,
         "\n".join([title, *lines]),
         reply_markup=admin_keyboard(),
     )
 
 
 @router.callback_query(MenuAction.filter(F.action == "home"))
-async def back_to_menu(callback: CallbackQuery, settings: Settings) -> None:
+async def back_to_menu(
+    callback: CallbackQuery, settings: Settings, outbound: OutboundQueue
+) -> None:
     """Возвращает админа в главное меню.
 
     :param callback: входящий CallbackQuery.
     :return: None.
     """
 
-    await callback.message.edit_text(
+    await outbound.edit_text(
+        callback.message,
         "Меню действий:",
         reply_markup=main_menu(user_is_admin=True),
     )
@@ -5,7 +5,9 @@ from aiogram.filters import CommandStart
 from aiogram.types import CallbackQuery, Message
 
 from app.bot.callbacks import MenuAction
+from app.bot.delivery import ConfigDelivery
 from app.bot.keyboards import main_menu
+from app.bot.outbound import OutboundQueue
 from app.config import Settings
 from app.db import SessionMaker
 from app.services import KeyService
@@ -26,7 +28,10 @@ def _is_admin(settings: Settings, user_id: int) -> bool:
 
 @router.message(CommandStart())
 async def handle_start(
-    message: Message, settings: Settings, session_maker: SessionMaker
+    message: Message,
+    settings: Settings,
+    session_maker: SessionMaker,
+    outbound: OutboundQueue,
 ) -> None:
     """Обрабатывает /start и показывает главное меню.
 
@@ -39,7 +44,6 @@ async def handle_start(
 
     async with session_maker() as session:
         service = KeyService(session=session, settings=settings)
-        await service.set_admins(settings.admin_ids)
         await service.ensure_user(message.from_user.id, message.from_user.username)
         await session.commit()
 
@@ -47,7 +51,8 @@ async def handle_start(
         "Привет! Я помогу управлять VPN-ключами. "
         "Создавай временные ключи, смотри активные и отзывать ненужные."
     )
-    await message.answer(
+    await outbound.answer(
+        message,
         text,
         reply_markup=main_menu(user_is_admin=_is_admin(settings, message.from_user.id)),
     )
@@ -55,7 +60,11 @@ async def handle_start(
 
 @router.callback_query(MenuAction.filter(F.action.in_(("home", "help"))))
 async def handle_menu(
-    callback: CallbackQuery, callback_data: MenuAction, settings: Settings
+    callback: CallbackQuery,
+    callback_data: MenuAction,
+    settings: Settings,
+    outbound: OutboundQueue,
+    delivery: ConfigDelivery,
 ) -> None:
     """Навигация по меню (home/help).
 
@@ -70,7 +79,8 @@ async def handle_menu(
     action = callback_data.action
 
     if action == "home":
-        await callback.message.edit_text(
+        await outbound.edit_text(
+            callback.message,
             "Меню действий:",
             reply_markup=main_menu(
                 user_is_admin=_is_admin(settings, callback.from_user.id),
@@ -78,7 +88,10 @@ async def handle_menu(
         )
     elif action == "help":
         await callback.answer()
-        await callback.message.answer(
+        if settings.help_image_path:
+            await delivery.send_static_photo(callback.message, settings.help_image_path)
+        await outbound.answer(
+            callback.message,
             "🆘 Помощь:\n"
             "— \"Новый ключ\" создаёт временный доступ.\n"
             "— \"Мои ключи\" показывает активные/просроченные.\n"
@@ -3,26 +3,33 @@ from __future__ import annotations
 import uuid
 
 from aiogram import Router, F
-from aiogram.types import BufferedInputFile, CallbackQuery
+from aiogram.types import CallbackQuery
 
-from app.bot.callbacks import KeyCreateAction, KeyRevokeAction, KeyRotateAction, MenuAction
+from app.bot.callbacks import KeyCreateAction, KeyRenewAction, KeyRevokeAction, KeyRotateAction, MenuAction
+from app.bot.delivery import ConfigDelivery
 from app.bot.keyboards import key_create_keyboard, keys_keyboard, main_menu
+from app.bot.outbound import OutboundQueue
 from app.config import Settings
-from app.db import SessionMaker
+from app.db import SessionMaker, SessionRouter
+from app.locks import KeyActionGuard
 from app.services import KeyService
 
 router = Router()
 
+ALREADY_CREATED = "Ключ по этому нажатию уже создан — конфиг отправлен выше."
+ALREADY_ROTATED = "Ключ уже ротирован — новый конфиг отправлен выше."
+
 
 @router.callback_query(MenuAction.filter(F.action == "create"))
-async def show_create_menu(callback: CallbackQuery) -> None:
+async def show_create_menu(callback: CallbackQuery, outbound: OutboundQueue) -> None:
     """Показывает выбор длительности для нового ключа.
 
     :param callback: входящий CallbackQuery.
     :return: None.
     """
 
-    await callback.message.edit_text(
+    await outbound.edit_text(
+        callback.message,
         "Выбери срок действия временного ключа:",
         reply_markup=key_create_keyboard(),
     )
@@ -34,6 +41,10 @@ async def create_key(
     callback_data: KeyCreateAction,
     settings: Settings,
     session_maker: SessionMaker,
+    sessions: SessionRouter,
+    outbound: OutboundQueue,
+    delivery: ConfigDelivery,
+    guard: KeyActionGuard,
 ) -> None:
     """Создаёт временный ключ и показывает результат.
 
@@ -44,23 +55,39 @@ async def create_key(
 
     if callback.from_user is None:
         return
-    async with session_maker() as session:
-        service = KeyService(session=session, settings=settings)
-        user_id = await service.ensure_user(callback.from_user.id, callback.from_user.username)
-        await service.set_admins(settings.admin_ids)
-        try:
-            result = await service.create_key(
-                user_id=user_id,
-                name=f"key-{callback_data.hours}h",
-                ttl_hours=callback_data.hours,
-            )
-            await session.commit()
-        except ValueError as exc:
-            await session.rollback()
-            await callback.answer(str(exc), show_alert=True)
+    idempotency_keys = guard.keys_for(callback, callback_data.nonce)
+    if guard.results.get(idempotency_keys) is not None:
+        await callback.answer(ALREADY_CREATED, show_alert=True)
+        return
+    async with guard.hold(callback.from_user.id):
+        if guard.results.get(idempotency_keys) is not None:
+            await callback.answer(ALREADY_CREATED, show_alert=True)
             return
+        async with session_maker() as session:
+            service = KeyService(session=session, settings=settings)
+            user_id = await service.ensure_user(callback.from_user.id, callback.from_user.username)
+            # Короткие транзакции: upsert пользователя фиксируется до запуска wg,
+            # запись ключа идёт в отдельной транзакции после генерации.
+            await session.commit()
+            try:
+                keys = await service.generate_keys()
+                await guard.lock_transaction(session, callback.from_user.id)
+                result = await service.create_key(
+                    user_id=user_id,
+                    name=f"key-{callback_data.hours}h",
+                    ttl_hours=callback_data.hours,
+                    keys=keys,
+                )
+                await session.commit()
+            except ValueError as exc:
+                await session.rollback()
+                await callback.answer(str(exc), show_alert=True)
+                return
+            guard.results.put(idempotency_keys, result)
+    sessions.mark_write(callback.from_user.id)
 
-    await callback.message.edit_text(
+    await outbound.edit_text(
+        callback.message,
         (
             "✅ Ключ создан.\n"
             f"ID: {result.key.id}\n"
@@ -73,18 +100,22 @@ async def create_key(
             user_is_admin=callback.from_user.id in settings.admin_ids,
         ),
     )
-    config_bytes = result.credentials.config_text.encode()
-    await callback.message.answer_document(
-        BufferedInputFile(config_bytes, filename=f"wg-{result.key.id}.conf"),
+    await delivery.send_config(
+        callback.message,
+        filename=f"wg-{result.key.id}.conf",
+        config_text=result.credentials.config_text,
         caption="WireGuard конфиг. Сохрани файл, приватный ключ больше не выдаётся.",
     )
 
 
 @router.callback_query(MenuAction.filter(F.action == "list"))
 async def list_keys(
-    callback: CallbackQuery, settings: Settings, session_maker: SessionMaker
+    callback: CallbackQuery,
+    settings: Settings,
+    sessions: SessionRouter,
+    outbound: OutboundQueue,
 ) -> None:
-    """Показывает ключи пользователя.
+    """Показывает ключи пользователя (чтение с реплики, если она не отстаёт).
 
     :param callback: входящий CallbackQuery.
     :return: None.
@@ -92,11 +123,11 @@ async def list_keys(
 
     if callback.from_user is None:
         return
-    async with session_maker() as session:
+    reader = sessions.reader(callback.from_user.id)
+    async with reader() as session:
         service = KeyService(session=session, settings=settings)
-        user_id = await service.ensure_user(callback.from_user.id, callback.from_user.username)
-        keys = await service.list_keys(user_id)
-        await session.commit()
+        user_id = await service.find_user(callback.from_user.id)
+        keys = await service.list_keys(user_id, sessions.staleness(reader)) if user_id is not None else []
 
     if not keys:
         text = "Пока нет ключей. Создай новый."
@@ -110,7 +141,7 @@ async def list_keys(
             )
         text = "\n".join(lines)
 
-    await callback.message.edit_text(text, reply_markup=keys_keyboard(keys))
+    await outbound.edit_text(callback.message, text, reply_markup=keys_keyboard(keys))
 
 
 @router.callback_query(KeyRevokeAction.filter())
@@ -119,6 +150,8 @@ async def revoke_key(
     callback_data: KeyRevokeAction,
     settings: Settings,
     session_maker: SessionMaker,
+    sessions: SessionRouter,
+    outbound: OutboundQueue,
 ) -> None:
     """Отзывает выбранный ключ.
 
@@ -135,24 +168,27 @@ async def revoke_key(
         user_id = await service.ensure_user(callback.from_user.id, callback.from_user.username)
         success = await service.revoke_key(key_id, user_id=user_id)
         await session.commit()
+    sessions.mark_write(callback.from_user.id)
 
     if success:
         await callback.answer("Ключ отозван", show_alert=True)
     else:
         await callback.answer("Ключ не найден", show_alert=True)
-    await callback.message.edit_reply_markup(
+    await outbound.edit_reply_markup(
+        callback.message,
         reply_markup=main_menu(user_is_admin=callback.from_user.id in settings.admin_ids)
     )
 
 
-@router.callback_query(KeyRotateAction.filter())
-async def rotate_key(
+@router.callback_query(KeyRenewAction.filter())
+async def renew_key(
     callback: CallbackQuery,
-    callback_data: KeyRotateAction,
+    callback_data: KeyRenewAction,
     settings: Settings,
     session_maker: SessionMaker,
+    sessions: SessionRouter,
 ) -> None:
-    """Ротирует ключ и выдаёт новый конфиг.
+    """Продлевает ключ из напоминания об истечении.
 
     :param callback: входящий CallbackQuery.
     :param callback_data: данные с идентификатором ключа.
@@ -166,25 +202,79 @@ async def rotate_key(
         service = KeyService(session=session, settings=settings)
         user_id = await service.ensure_user(callback.from_user.id, callback.from_user.username)
         try:
-            result = await service.rotate_key(key_id=key_id, user_id=user_id)
+            key = await service.renew_key(key_id, user_id=user_id)
             await session.commit()
         except ValueError as exc:
             await session.rollback()
             await callback.answer(str(exc), show_alert=True)
             return
+    sessions.mark_write(callback.from_user.id)
+    await callback.answer(f"Ключ {key.name} продлён до {key.expires_at:%Y-%m-%d %H:%M UTC}", show_alert=True)
+
+
+@router.callback_query(KeyRotateAction.filter())
+async def rotate_key(
+    callback: CallbackQuery,
+    callback_data: KeyRotateAction,
+    settings: Settings,
+    session_maker: SessionMaker,
+    sessions: SessionRouter,
+    outbound: OutboundQueue,
+    delivery: ConfigDelivery,
+    guard: KeyActionGuard,
+) -> None:
+    """Ротирует ключ и выдаёт новый конфиг.
+
+    :param callback: входящий CallbackQuery.
+    :param callback_data: данные с идентификатором ключа.
+    :return: None.
+    """
+
+    if callback.from_user is None:
+        return
+    key_id = uuid.UUID(callback_data.key_id)
+    idempotency_keys = guard.keys_for(callback, callback_data.nonce)
+    if guard.results.get(idempotency_keys) is not None:
+        await callback.answer(ALREADY_ROTATED, show_alert=True)
+        return
+    async with guard.hold(callback.from_user.id):
+        if guard.results.get(idempotency_keys) is not None:
+            await callback.answer(ALREADY_ROTATED, show_alert=True)
+            return
+        async with session_maker() as session:
+            service = KeyService(session=session, settings=settings)
+            user_id = await service.ensure_user(callback.from_user.id, callback.from_user.username)
+            await session.commit()
+            try:
+                keys = await service.generate_keys()
+                await guard.lock_transaction(session, callback.from_user.id)
+                result = await service.rotate_key(key_id=key_id, user_id=user_id, keys=keys)
+                await session.commit()
+            except ValueError as exc:
+                await session.rollback()
+                await callback.answer(str(exc), show_alert=True)
+                return
+            guard.results.put(idempotency_keys, result)
+            # wg set — только после коммита и под блокировкой пользователя.
+            peer_applied = await service.apply_peer_swap(result)
+            await session.commit()
+    sessions.mark_write(callback.from_user.id)
 
-    await callback.message.answer(
+    await outbound.answer(
+        callback.message,
         (
             "♻️ Ключ ротирован.\n"
             f"ID: {result.key.id}\n"
             f"Адрес: {result.key.client_address}\n"
             f"Действует до: {result.key.expires_at:%Y-%m-%d %H:%M UTC}\n\n"
             "Сохрани новый конфиг, старый ключ отозван."
+            + ("" if peer_applied else "\n⚠️ Сервер ещё не принял новый ключ, администратор уведомлён.")
         )
     )
-    config_bytes = result.credentials.config_text.encode()
-    await callback.message.answer_document(
-        BufferedInputFile(config_bytes, filename=f"wg-{result.key.id}.conf"),
+    await delivery.send_config(
+        callback.message,
+        filename=f"wg-{result.key.id}.conf",
+        config_text=result.credentials.config_text,
         caption="Новый WireGuard конфиг. Старый ключ отозван.",
     )
     await callback.answer("Новый конфиг сгенерирован", show_alert=True)
@@ -1,17 +1,23 @@
 from __future__ import annotations
 
+import uuid
 from typing import Sequence
 
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
 from app.bot.callbacks import (
     AdminAction,
+    AdminKeyAction,
+    AdminSearchPage,
+    BroadcastAction,
     KeyCreateAction,
+    KeyRenewAction,
     KeyRevokeAction,
     KeyRotateAction,
     MenuAction,
+    render_nonce,
 )
-from app.models import VpnKey
+from app.models import Broadcast, VpnKey
 
 
 def main_menu(user_is_admin: bool) -> InlineKeyboardMarkup:
@@ -43,13 +49,14 @@ def key_create_keyboard() -> InlineKeyboardMarkup:
         ("90 дней", 24 * 90),
         ("Безлимит", 0),
     ]
+    nonce = render_nonce()
     rows = []
     for i in range(0, len(options), 2):
         chunk = options[i : i + 2]
         rows.append(
             [
                 InlineKeyboardButton(
-                    text=label, callback_data=KeyCreateAction(hours=hours).pack()
+                    text=label, callback_data=KeyCreateAction(hours=hours, nonce=nonce).pack()
                 )
                 for label, hours in chunk
             ]
@@ -65,6 +72,7 @@ def key_create_keyboard() -> InlineKeyboardMarkup:
 def keys_keyboard(keys: Sequence[VpnKey]) -> InlineKeyboardMarkup:
     """Клавиатура действий над активными ключами."""
 
+    nonce = render_nonce()
     rows: list[list[InlineKeyboardButton]] = []
     for key in keys:
         if not key.is_active:
@@ -73,7 +81,7 @@ def keys_keyboard(keys: Sequence[VpnKey]) -> InlineKeyboardMarkup:
             [
                 InlineKeyboardButton(
                     text=f"♻️ Ротировать {key.name}",
-                    callback_data=KeyRotateAction(key_id=str(key.id)).pack(),
+                    callback_data=KeyRotateAction(key_id=str(key.id), nonce=nonce).pack(),
                 ),
                 InlineKeyboardButton(
                     text=f"❌ Отозвать {key.name}",
@@ -85,6 +93,20 @@ def keys_keyboard(keys: Sequence[VpnKey]) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=rows)
 
 
+def renew_keyboard(keys: Sequence[tuple[uuid.UUID, str]]) -> InlineKeyboardMarkup:
+    """Кнопки продления для напоминания об истечении.
+
+    :param keys: пары (id ключа, имя).
+    """
+
+    rows = [
+        [InlineKeyboardButton(text=f"🔄 Продлить {name}", callback_data=KeyRenewAction(key_id=str(key_id)).pack())]
+        for key_id, name in keys
+    ]
+    rows.append([InlineKeyboardButton(text="🔑 Мои ключи", callback_data=MenuAction(action="list").pack())])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
 def admin_keyboard() -> InlineKeyboardMarkup:
     """Клавиатура админ-панели."""
 
@@ -110,7 +132,21 @@ def admin_keyboard() -> InlineKeyboardMarkup:
                 InlineKeyboardButton(
                     text="Алерты",
                     callback_data=AdminAction(action="alerts").pack(),
-                )
+                ),
+                InlineKeyboardButton(
+                    text="Профиль CPU",
+                    callback_data=AdminAction(action="profile").pack(),
+                ),
+            ],
+            [
+                InlineKeyboardButton(
+                    text="Сводка",
+                    callback_data=AdminAction(action="summary").pack(),
+                ),
+                InlineKeyboardButton(
+                    text="Рассылки",
+                    callback_data=AdminAction(action="broadcasts").pack(),
+                ),
             ],
             [
                 InlineKeyboardButton(
@@ -119,3 +155,77 @@ def admin_keyboard() -> InlineKeyboardMarkup:
             ],
         ]
     )
+
+
+def broadcast_confirm_keyboard(broadcast_id: int) -> InlineKeyboardMarkup:
+    """Подтверждение черновика рассылки."""
+
+    return InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(
+                    text="📣 Отправить всем",
+                    callback_data=BroadcastAction(action="start", broadcast_id=broadcast_id).pack(),
+                ),
+                InlineKeyboardButton(
+                    text="Отмена",
+                    callback_data=BroadcastAction(action="cancel", broadcast_id=broadcast_id).pack(),
+                ),
+            ]
+        ]
+    )
+
+
+def broadcasts_keyboard(broadcasts: Sequence[Broadcast]) -> InlineKeyboardMarkup:
+    """Пауза/продолжение идущих рассылок и возврат в админ-панель."""
+
+    rows = []
+    for broadcast in broadcasts:
+        if broadcast.status == "running":
+            text, action = f"⏸ Пауза #{broadcast.id}", "pause"
+        elif broadcast.status == "paused":
+            text, action = f"▶️ Продолжить #{broadcast.id}", "resume"
+        else:
+            continue
+        rows.append(
+            [
+                InlineKeyboardButton(
+                    text=text,
+                    callback_data=BroadcastAction(action=action, broadcast_id=broadcast.id).pack(),
+                )
+            ]
+        )
+    rows.append(
+        [InlineKeyboardButton(text="⬅️ Админ-панель", callback_data=MenuAction(action="admin").pack())]
+    )
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+def search_keyboard(query: str, page: int, keys: Sequence[VpnKey], has_next: bool) -> InlineKeyboardMarkup:
+    """Отзыв найденных активных ключей и листание результатов поиска."""
+
+    rows = [
+        [
+            InlineKeyboardButton(
+                text=f"⛔ Отозвать {key.name}",
+                callback_data=AdminKeyAction(action="revoke", key_id=key.id.hex).pack(),
+            )
+        ]
+        for key in keys
+        if key.is_active
+    ]
+    pager = []
+    if page > 0:
+        pager.append(
+            InlineKeyboardButton(text="◀️", callback_data=AdminSearchPage(query=query, page=page - 1).pack())
+        )
+    if has_next:
+        pager.append(
+            InlineKeyboardButton(text="▶️", callback_data=AdminSearchPage(query=query, page=page + 1).pack())
+        )
+    if pager:
+        rows.append(pager)
+    rows.append(
+        [InlineKeyboardButton(text="⬅️ Админ-панель", callback_data=MenuAction(action="admin").pack())]
+    )
+    return InlineKeyboardMarkup(inline_keyboard=rows)
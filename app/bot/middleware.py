@@ -1,26 +1,55 @@
 from __future__ import annotations
 
+import time
 from typing import Any, Awaitable, Callable, Dict
 
 from aiogram import BaseMiddleware
-from aiogram.types import TelegramObject
+from aiogram.types import CallbackQuery, TelegramObject, Update
 
+from app.bot.callbacks import KeyCreateAction, KeyRotateAction, callback_prefix
+from app.bot.delivery import ConfigDelivery
+from app.bot.outbound import OutboundQueue
+from app.broadcast import BroadcastEngine
 from app.config import Settings
-from app.db import SessionMaker
+from app.db import SessionMaker, SessionRouter, track_queries
+from app.locks import KeyActionGuard
+from app.metrics import QUERY_COUNT_BUCKETS, MetricsRegistry
+from app.ratelimit import BucketTable, TokenBucket
+
+EXPENSIVE_PREFIXES = frozenset({KeyCreateAction.__prefix__, KeyRotateAction.__prefix__})
 
 
 class ContextMiddleware(BaseMiddleware):
-    """Пробрасывает settings и session_maker в data для хэндлеров."""
+    """Пробрасывает settings, session_maker, sessions, outbound, delivery, guard и broadcasts в data для хэндлеров."""
 
-    def __init__(self, settings: Settings, session_maker: SessionMaker):
+    def __init__(
+        self,
+        settings: Settings,
+        session_maker: SessionMaker,
+        outbound: OutboundQueue,
+        delivery: ConfigDelivery,
+        guard: KeyActionGuard,
+        broadcasts: BroadcastEngine,
+        sessions: SessionRouter | None = None,
+    ):
         """Инициализация.
 
         :param settings: конфигурация приложения.
         :param session_maker: фабрика сессий.
+        :param outbound: очередь исходящих сообщений.
+        :param delivery: выдача конфигов и файлов.
+        :param guard: защита create/rotate от двойных нажатий.
+        :param broadcasts: движок рассылок админов.
+        :param sessions: роутер чтения/записи (по умолчанию — всё в session_maker).
         """
 
         self.settings = settings
         self.session_maker = session_maker
+        self.outbound = outbound
+        self.delivery = delivery
+        self.guard = guard
+        self.sessions = sessions or SessionRouter(session_maker)
+        self.broadcasts = broadcasts
 
     async def __call__(
         self,
@@ -38,4 +67,175 @@ class ContextMiddleware(BaseMiddleware):
 
         data["settings"] = self.settings
         data["session_maker"] = self.session_maker
+        data["outbound"] = self.outbound
+        data["delivery"] = self.delivery
+        data["guard"] = self.guard
+        data["sessions"] = self.sessions
+        data["broadcasts"] = self.broadcasts
         return await handler(event, data)
+
+
+class InstrumentationMiddleware(BaseMiddleware):
+    """Снимает латентность апдейтов/хэндлеров и статистику SQL-запросов.
+
+    На уровне Update меряет полное время обработки и число/время запросов к БД,
+    на уровне Message/CallbackQuery — время конкретного хэндлера и префикса CallbackData.
+    """
+
+    def __init__(self, registry: MetricsRegistry):
+        """Инициализация.
+
+        :param registry: реестр метрик.
+        """
+
+        self.update_duration = registry.histogram(
+            "bot_update_duration_seconds",
+            "Полное время обработки апдейта.",
+            labels=("event_type",),
+        )
+        self.update_queries = registry.histogram(
+            "bot_update_db_queries",
+            "Количество SQL-запросов на апдейт.",
+            labels=("event_type",),
+            buckets=QUERY_COUNT_BUCKETS,
+        )
+        self.update_db_time = registry.histogram(
+            "bot_update_db_seconds",
+            "Суммарное время SQL-запросов на апдейт.",
+            labels=("event_type",),
+        )
+        self.handler_duration = registry.histogram(
+            "bot_handler_duration_seconds",
+            "Время выполнения хэндлера.",
+            labels=("handler",),
+        )
+        self.callback_duration = registry.histogram(
+            "bot_callback_duration_seconds",
+            "Время обработки callback по префиксу CallbackData.",
+            labels=("prefix",),
+        )
+        self.errors = registry.counter(
+            "bot_handler_errors_total",
+            "Исключения, вылетевшие из хэндлеров.",
+            labels=("handler",),
+        )
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        """Оборачивает обработку события замерами.
+
+        :param handler: следующий обработчик.
+        :param event: входящее событие.
+        :param data: контекст данных.
+        :return: результат хэндлера.
+        """
+
+        if isinstance(event, Update):
+            return await self._observe_update(handler, event, data)
+        return await self._observe_handler(handler, event, data)
+
+    async def _observe_update(self, handler, event: Update, data: Dict[str, Any]) -> Any:
+        """Меряет апдейт целиком вместе с запросами к БД."""
+
+        event_type = event.event_type or "unknown"
+        started = time.perf_counter()
+        with track_queries() as stats:
+            try:
+                return await handler(event, data)
+            finally:
+                self.update_duration.observe(time.perf_counter() - started, event_type)
+                self.update_queries.observe(stats.count, event_type)
+                self.update_db_time.observe(stats.duration, event_type)
+
+    async def _observe_handler(self, handler, event: TelegramObject, data: Dict[str, Any]) -> Any:
+        """Меряет выбранный роутером хэндлер и префикс CallbackData."""
+
+        handler_object = data.get("handler")
+        callback = getattr(handler_object, "callback", None)
+        name = getattr(callback, "__name__", "unknown")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.errors.inc(1, name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.handler_duration.observe(elapsed, name)
+            if isinstance(event, CallbackQuery) and event.data:
+                self.callback_duration.observe(elapsed, callback_prefix(event.data))
+
+
+class RateLimitMiddleware(BaseMiddleware):
+    """Admission control входящих сообщений и коллбеков.
+
+    Регистрируется как outer middleware: отказ происходит до фильтров, сессии БД
+    и запуска wg. Лёгкие и тяжёлые (создание/ротация ключа) действия лимитируются
+    раздельными вёдрами на пользователя, тяжёлые — ещё и общим ведром на бот.
+    Отклонённый коллбек получает короткий ответ, лишние сообщения молча отбрасываются.
+    Админы не лимитируются.
+    """
+
+    def __init__(self, settings: Settings, registry: MetricsRegistry):
+        """Инициализация.
+
+        :param settings: конфигурация приложения.
+        :param registry: реестр метрик.
+        """
+
+        self.admin_ids = settings.admin_ids
+        self.cheap = BucketTable(settings.ratelimit_cheap_rate, settings.ratelimit_cheap_burst)
+        self.expensive = BucketTable(settings.ratelimit_expensive_rate, settings.ratelimit_expensive_burst)
+        self.global_expensive = TokenBucket(
+            settings.ratelimit_global_expensive_rate, max(settings.ratelimit_global_expensive_rate, 1.0)
+        )
+        self.rejected = registry.counter(
+            "bot_ratelimit_rejected_total",
+            "Апдейты, отклонённые admission control.",
+            labels=("kind",),
+        )
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        """Пропускает событие дальше или отвечает отказом.
+
+        :param handler: следующий обработчик.
+        :param event: входящее событие.
+        :param data: контекст данных.
+        :return: результат хэндлера или None при отказе.
+        """
+
+        user = getattr(event, "from_user", None)
+        if user is None or user.id in self.admin_ids:
+            return await handler(event, data)
+        if isinstance(event, CallbackQuery) and event.data:
+            expensive = callback_prefix(event.data) in EXPENSIVE_PREFIXES
+        else:
+            expensive = False
+        if expensive:
+            # Общее ведро проверяется первым и без списания: отказ по нему не должен
+            # сжигать токен пользователя, а между проверкой и списанием нет await.
+            kind, wait = "global", self.global_expensive.delay()
+            if wait == 0:
+                kind, wait = "expensive", self.expensive.take(user.id)
+                if wait == 0:
+                    self.global_expensive.try_acquire()
+        else:
+            kind, wait = "cheap", self.cheap.take(user.id)
+        if wait == 0:
+            return await handler(event, data)
+        self.rejected.inc(1, kind)
+        if isinstance(event, CallbackQuery):
+            if wait == float("inf"):
+                await event.answer("Действие временно недоступно.")
+            else:
+                await event.answer(f"Слишком часто. Попробуйте через {max(1, round(wait))} с.")
+        return None
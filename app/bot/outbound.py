@@ -0,0 +1,429 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Hashable
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.types import Message
+
+from app.metrics import registry
+from app.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+BUCKET_SWEEP_SECONDS = 60.0
+
+SendCall = Callable[[], Awaitable[Any]]
+
+
+@dataclass
+class _Outgoing:
+    """Исходящий вызов Bot API в очереди чата.
+
+    :param call: фабрика корутины, выполняющей вызов.
+    :param method: имя метода для метрик.
+    :param coalesce_key: ключ склейки (одинаковые ключи — отправляется последний вызов).
+    :param futures: ожидающие результата (включая склеенные вызовы).
+    :param enqueued_at: момент постановки в очередь.
+    :param attempts: сколько раз вызов уже получил TelegramRetryAfter.
+    """
+
+    call: SendCall
+    method: str
+    coalesce_key: Hashable | None
+    futures: list[asyncio.Future] = field(default_factory=list)
+    enqueued_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+
+
+class OutboundQueue:
+    """Очередь исходящих сообщений с учётом флуд-лимитов Telegram.
+
+    Глобальный и поканальный token bucket, склейка последовательных правок одного
+    сообщения (уходит только последняя), повтор после TelegramRetryAfter с паузой,
+    которую назвал сервер. Порядок вызовов внутри чата сохраняется.
+
+    Чат, которому ещё рано слать (пустое ведро или пауза RetryAfter), не занимает
+    воркер: он откладывается через loop.call_later до момента готовности, а воркер
+    берёт следующий готовый чат.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 25.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        max_retries: int = 3,
+        workers: int = 8,
+    ):
+        """Инициализация.
+
+        :param global_rate: вызовов в секунду на весь бот.
+        :param chat_rate: вызовов в секунду на один чат.
+        :param chat_burst: допустимый всплеск на чат.
+        :param max_retries: сколько раз повторять после RetryAfter.
+        :param workers: число параллельных отправителей.
+        """
+
+        self.global_bucket = TokenBucket(global_rate, max(global_rate, 1.0))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.worker_count = workers
+        self._pending: dict[int, deque[_Outgoing]] = {}
+        self._chat_buckets: dict[int, TokenBucket] = {}
+        self._paused_until: dict[int, float] = {}
+        self._ready: asyncio.Queue[int] | None = None
+        self._deferred: set[asyncio.TimerHandle] = set()
+        self._workers: list[asyncio.Task] = []
+        self._depth = 0
+        self._last_sweep = time.monotonic()
+
+        self.depth_gauge = registry.gauge("bot_outbound_queue_depth", "Вызовы Bot API, ждущие отправки.")
+        self.sent = registry.counter("bot_outbound_sent_total", "Выполненные вызовы Bot API.", labels=("method",))
+        self.coalesced = registry.counter("bot_outbound_coalesced_total", "Правки, заменённые более поздними.")
+        self.retries = registry.counter("bot_outbound_retry_after_total", "Повторы после TelegramRetryAfter.")
+        self.wait_time = registry.histogram(
+            "bot_outbound_wait_seconds", "Время от постановки в очередь до отправки."
+        )
+
+    @classmethod
+    def from_settings(cls, settings) -> "OutboundQueue":
+        """Создаёт очередь по конфигурации.
+
+        :param settings: конфигурация приложения.
+        :return: OutboundQueue.
+        """
+
+        return cls(
+            global_rate=settings.outbound_global_rate,
+            chat_rate=settings.outbound_chat_rate,
+            chat_burst=settings.outbound_chat_burst,
+        )
+
+    @property
+    def depth(self) -> int:
+        """Число вызовов, ждущих отправки."""
+
+        return self._depth
+
+    def _ensure_started(self) -> asyncio.Queue[int]:
+        """Запускает воркеры в текущем event loop при первом использовании."""
+
+        if self._ready is None:
+            self._ready = asyncio.Queue()
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+        return self._ready
+
+    async def close(self) -> None:
+        """Останавливает воркеры; неотправленные вызовы отменяются.
+
+        :return: None.
+        """
+
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for handle in self._deferred:
+            handle.cancel()
+        self._deferred.clear()
+        self._ready = None
+        for items in self._pending.values():
+            for item in items:
+                for future in item.futures:
+                    future.cancel()
+        self._pending.clear()
+        self._depth = 0
+        self.depth_gauge.set(0)
+
+    def submit(
+        self,
+        chat_id: int,
+        call: SendCall,
+        method: str,
+        coalesce_key: Hashable | None = None,
+    ) -> asyncio.Future:
+        """Ставит вызов в очередь чата.
+
+        :param chat_id: чат-получатель.
+        :param call: фабрика корутины вызова Bot API.
+        :param method: имя метода (для метрик).
+        :param coalesce_key: если последним в очереди чата ждёт вызов с тем же ключом,
+            он заменяется на месте (склейка только с хвостом сохраняет порядок в чате).
+        :return: future с результатом вызова.
+        """
+
+        ready = self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        items = self._pending.get(chat_id)
+        if items is None:
+            items = self._pending[chat_id] = deque()
+            ready.put_nowait(chat_id)
+        if coalesce_key is not None and items and items[-1].coalesce_key == coalesce_key:
+            tail = items[-1]
+            tail.call = call
+            tail.futures.append(future)
+            self.coalesced.inc()
+            return future
+        items.append(_Outgoing(call=call, method=method, coalesce_key=coalesce_key, futures=[future]))
+        self._depth += 1
+        self.depth_gauge.set(self._depth)
+        return future
+
+    def _take_chat_slot(self, chat_id: int) -> float:
+        """Списывает токен чата, если пауза RetryAfter снята.
+
+        :param chat_id: чат.
+        :return: 0, если можно отправлять, иначе сколько секунд ждать.
+        """
+
+        paused_until = self._paused_until.get(chat_id)
+        if paused_until is not None:
+            delay = paused_until - time.monotonic()
+            if delay > 0:
+                return delay
+            del self._paused_until[chat_id]
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        if bucket.try_acquire():
+            return 0.0
+        return bucket.delay()
+
+    def _defer(self, ready: asyncio.Queue[int], chat_id: int, delay: float) -> None:
+        """Возвращает чат в очередь готовых через delay секунд, не занимая воркер."""
+
+        def wake() -> None:
+            self._deferred.discard(handle)
+            ready.put_nowait(chat_id)
+
+        handle = asyncio.get_running_loop().call_later(delay, wake)
+        self._deferred.add(handle)
+
+    async def _deliver(self, chat_id: int, item: _Outgoing) -> None:
+        """Выполняет вызов и резолвит futures.
+
+        После TelegramRetryAfter вызов возвращается в голову очереди чата, а чат
+        ставится на паузу — повтор сделает тот воркер, который возьмёт чат позже.
+        """
+
+        try:
+            result = await item.call()
+        except TelegramRetryAfter as exc:
+            item.attempts += 1
+            self.retries.inc()
+            if item.attempts > self.max_retries:
+                self._resolve(item, exc=exc)
+                return
+            logger.warning("Flood limit for chat %s, retry in %ss", chat_id, exc.retry_after)
+            self._paused_until[chat_id] = time.monotonic() + exc.retry_after
+            self._pending[chat_id].appendleft(item)
+            self._depth += 1
+            self.depth_gauge.set(self._depth)
+        except Exception as exc:  # pylint: disable=broad-except
+            self._resolve(item, exc=exc)
+        else:
+            self.sent.inc(1, item.method)
+            self._resolve(item, result=result)
+
+    @staticmethod
+    def _resolve(item: _Outgoing, result: Any = None, exc: BaseException | None = None) -> None:
+        """Отдаёт результат всем ожидающим вызова."""
+
+        for future in item.futures:
+            if future.done():
+                continue
+            if exc is not None:
+                future.set_exception(exc)
+            else:
+                future.set_result(result)
+
+    async def _worker(self) -> None:
+        """Берёт чат из очереди готовых и отправляет его следующий вызов."""
+
+        assert self._ready is not None
+        ready = self._ready
+        while True:
+            chat_id = await ready.get()
+            delay = self._take_chat_slot(chat_id)
+            if delay > 0:
+                self._defer(ready, chat_id, delay)
+                continue
+            try:
+                await self.global_bucket.acquire()
+                items = self._pending[chat_id]
+                item = items.popleft()
+                self._depth -= 1
+                self.depth_gauge.set(self._depth)
+                if not item.attempts:
+                    self.wait_time.observe(time.monotonic() - item.enqueued_at)
+                await self._deliver(chat_id, item)
+            finally:
+                if self._pending.get(chat_id):
+                    ready.put_nowait(chat_id)
+                else:
+                    self._pending.pop(chat_id, None)
+                    self._sweep_buckets()
+
+    def _sweep_buckets(self) -> None:
+        """Раз в BUCKET_SWEEP_SECONDS выбрасывает вёдра простаивающих чатов (полное ведро = новое)."""
+
+        now = time.monotonic()
+        if now - self._last_sweep < BUCKET_SWEEP_SECONDS:
+            return
+        self._last_sweep = now
+        idle = [
+            chat_id
+            for chat_id, bucket in self._chat_buckets.items()
+            if chat_id not in self._pending and bucket.delay(bucket.capacity) == 0
+        ]
+        for chat_id in idle:
+            del self._chat_buckets[chat_id]
+
+    async def edit_text(self, message: Message, text: str, **kwargs: Any) -> Any:
+        """message.edit_text через очередь; правки одного сообщения склеиваются.
+
+        :param message: редактируемое сообщение.
+        :param text: новый текст.
+        :param kwargs: прочие параметры edit_text.
+        :return: результат Bot API.
+        """
+
+        return await self.submit(
+            message.chat.id,
+            lambda: message.edit_text(text, **kwargs),
+            method="editMessageText",
+            coalesce_key=("edit", message.message_id),
+        )
+
+    async def edit_reply_markup(self, message: Message, **kwargs: Any) -> Any:
+        """message.edit_reply_markup через очередь (со склейкой).
+
+        :param message: редактируемое сообщение.
+        :param kwargs: параметры edit_reply_markup.
+        :return: результат Bot API.
+        """
+
+        return await self.submit(
+            message.chat.id,
+            lambda: message.edit_reply_markup(**kwargs),
+            method="editMessageReplyMarkup",
+            coalesce_key=("markup", message.message_id),
+        )
+
+    async def send_message(self, bot: Any, chat_id: int, text: str, **kwargs: Any) -> Any:
+        """bot.send_message через очередь — для уведомлений не в ответ на апдейт.
+
+        :param bot: экземпляр aiogram Bot.
+        :param chat_id: чат-получатель.
+        :param text: текст.
+        :param kwargs: прочие параметры send_message.
+        :return: отправленное сообщение.
+        """
+
+        return await self.submit(
+            chat_id, lambda: bot.send_message(chat_id, text, **kwargs), method="sendMessage"
+        )
+
+    async def send_document(self, bot: Any, chat_id: int, document: Any, **kwargs: Any) -> Any:
+        """bot.send_document через очередь.
+
+        :param bot: экземпляр aiogram Bot.
+        :param chat_id: чат-получатель.
+        :param document: файл (InputFile или file_id).
+        :param kwargs: прочие параметры send_document.
+        :return: отправленное сообщение.
+        """
+
+        return await self.submit(
+            chat_id, lambda: bot.send_document(chat_id, document, **kwargs), method="sendDocument"
+        )
+
+    async def send_photo(self, bot: Any, chat_id: int, photo: Any, **kwargs: Any) -> Any:
+        """bot.send_photo через очередь.
+
+        :param bot: экземпляр aiogram Bot.
+        :param chat_id: чат-получатель.
+        :param photo: картинка (InputFile или file_id).
+        :param kwargs: прочие параметры send_photo.
+        :return: отправленное сообщение.
+        """
+
+        return await self.submit(chat_id, lambda: bot.send_photo(chat_id, photo, **kwargs), method="sendPhoto")
+
+    async def send_media_group(self, bot: Any, chat_id: int, media: list[Any], **kwargs: Any) -> Any:
+        """bot.send_media_group через очередь.
+
+        :param bot: экземпляр aiogram Bot.
+        :param chat_id: чат-получатель.
+        :param media: элементы медиагруппы.
+        :param kwargs: прочие параметры send_media_group.
+        :return: отправленные сообщения.
+        """
+
+        return await self.submit(
+            chat_id, lambda: bot.send_media_group(chat_id, media, **kwargs), method="sendMediaGroup"
+        )
+
+    async def answer(self, message: Message, text: str, **kwargs: Any) -> Any:
+        """message.answer через очередь.
+
+        :param message: сообщение, в чат которого отвечаем.
+        :param text: текст.
+        :param kwargs: прочие параметры answer.
+        :return: отправленное сообщение.
+        """
+
+        return await self.submit(
+            message.chat.id, lambda: message.answer(text, **kwargs), method="sendMessage"
+        )
+
+    async def answer_document(self, message: Message, document: Any, **kwargs: Any) -> Any:
+        """message.answer_document через очередь.
+
+        :param message: сообщение, в чат которого отвечаем.
+        :param document: файл (InputFile или file_id).
+        :param kwargs: прочие параметры answer_document.
+        :return: отправленное сообщение.
+        """
+
+        return await self.submit(
+            message.chat.id,
+            lambda: message.answer_document(document, **kwargs),
+            method="sendDocument",
+        )
+
+    async def answer_photo(self, message: Message, photo: Any, **kwargs: Any) -> Any:
+        """message.answer_photo через очередь.
+
+        :param message: сообщение, в чат которого отвечаем.
+        :param photo: картинка (InputFile или file_id).
+        :param kwargs: прочие параметры answer_photo.
+        :return: отправленное сообщение.
+        """
+
+        return await self.submit(
+            message.chat.id,
+            lambda: message.answer_photo(photo, **kwargs),
+            method="sendPhoto",
+        )
+
+    async def answer_media_group(self, message: Message, media: list[Any], **kwargs: Any) -> Any:
+        """message.answer_media_group через очередь (один вызов на всю группу).
+
+        :param message: сообщение, в чат которого отвечаем.
+        :param media: элементы медиагруппы.
+        :param kwargs: прочие параметры answer_media_group.
+        :return: отправленные сообщения.
+        """
+
+        return await self.submit(
+            message.chat.id,
+            lambda: message.answer_media_group(media, **kwargs),
+            method="sendMediaGroup",
+        )
@@ -0,0 +1,233 @@
+"""Рассылки админов всем пользователям.
+
+Получатели читаются серверным курсором (с реплики/читателя, если он есть)
+сегментами по SEGMENT_SIZE строк в порядке users.id, в памяти держится одна
+пачка CHECKPOINT_EVERY. Отправка идёт через очередь исходящих сообщений, темп
+задаёт отдельное ведро BROADCAST_RATE, чтобы ответы пользователям не ждали за
+рассылкой. После каждой пачки в broadcasts сохраняются курсор и счётчики, а
+заблокировавшие бота помечаются users.blocked_at и в следующие рассылки не
+попадают. Статус проверяется на каждой контрольной точке: пауза админом
+останавливает рассылку, после рестарта незавершённые рассылки продолжаются.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+
+from aiogram.exceptions import TelegramForbiddenError
+
+from app.config import Settings
+from app.db import SessionRouter
+from app.metrics import registry
+from app.ratelimit import TokenBucket
+from app.repositories import BroadcastRepository, UserRepository
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_SIZE = 5000
+CHECKPOINT_EVERY = 100
+
+
+class BroadcastEngine:
+    """Запускает, ставит на паузу и продолжает рассылки."""
+
+    def __init__(self, settings: Settings, sessions: SessionRouter, bot=None, outbound=None):
+        """Инициализация.
+
+        :param settings: конфигурация приложения.
+        :param sessions: роутер сессий (запись — primary, получатели — читатель).
+        :param bot: aiogram Bot.
+        :param outbound: очередь исходящих сообщений.
+        """
+
+        self.settings = settings
+        self.sessions = sessions
+        self.bot = bot
+        self.outbound = outbound
+        rate = max(settings.broadcast_rate, 0.1)
+        self.bucket = TokenBucket(rate, max(rate, 1.0))
+        self._tasks: dict[int, asyncio.Task] = {}
+        self.messages = registry.counter(
+            "bot_broadcast_messages_total", "Сообщения рассылок по результату.", labels=("result",)
+        )
+
+    def is_running(self, broadcast_id: int) -> bool:
+        """Идёт ли рассылка в этом процессе.
+
+        :param broadcast_id: идентификатор рассылки.
+        :return: True, если задача рассылки активна.
+        """
+
+        task = self._tasks.get(broadcast_id)
+        return task is not None and not task.done()
+
+    def _spawn(self, broadcast_id: int) -> None:
+        """Запускает задачу рассылки, если она ещё не идёт."""
+
+        if self.is_running(broadcast_id):
+            return
+        task = asyncio.create_task(self._run(broadcast_id))
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+
+    async def _transition(self, broadcast_id: int, status: str, expected: str) -> bool:
+        """Меняет статус рассылки в primary."""
+
+        async with self.sessions.writer()() as session:
+            changed = await BroadcastRepository(session).set_status(broadcast_id, status, expected)
+            await session.commit()
+        return changed
+
+    async def start(self, broadcast_id: int) -> bool:
+        """Подтверждает черновик и запускает рассылку.
+
+        :param broadcast_id: идентификатор рассылки.
+        :return: False, если рассылка уже не черновик.
+        """
+
+        if not await self._transition(broadcast_id, "running", expected="draft"):
+            return False
+        self._spawn(broadcast_id)
+        return True
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        """Отменяет неподтверждённый черновик.
+
+        :param broadcast_id: идентификатор рассылки.
+        :return: False, если рассылка уже не черновик.
+        """
+
+        return await self._transition(broadcast_id, "cancelled", expected="draft")
+
+    async def pause(self, broadcast_id: int) -> bool:
+        """Ставит рассылку на паузу (остановится на ближайшей контрольной точке).
+
+        :param broadcast_id: идентификатор рассылки.
+        :return: False, если рассылка не шла.
+        """
+
+        return await self._transition(broadcast_id, "paused", expected="running")
+
+    async def resume(self, broadcast_id: int) -> bool:
+        """Продолжает рассылку с сохранённого курсора.
+
+        :param broadcast_id: идентификатор рассылки.
+        :return: False, если рассылка не стояла на паузе.
+        """
+
+        if not await self._transition(broadcast_id, "running", expected="paused"):
+            return False
+        self._spawn(broadcast_id)
+        return True
+
+    async def on_startup(self, bot) -> None:
+        """Хук dp.startup: запоминает бота и продолжает прерванные рестартом рассылки.
+
+        :param bot: aiogram Bot, которым запущен polling.
+        :return: None.
+        """
+
+        self.bot = self.bot or bot
+        resumed = await self.resume_running()
+        if resumed:
+            logger.info("Resumed %s broadcasts", resumed)
+
+    async def resume_running(self) -> int:
+        """Продолжает рассылки в статусе running, которые не идут в этом процессе.
+
+        :return: число продолженных рассылок.
+        """
+
+        async with self.sessions.writer()() as session:
+            ids = await BroadcastRepository(session).running_ids()
+        for broadcast_id in ids:
+            self._spawn(broadcast_id)
+        return len(ids)
+
+    async def close(self) -> None:
+        """Останавливает задачи рассылок (прогресс сохранён до последней контрольной точки).
+
+        :return: None.
+        """
+
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _deliver(self, telegram_id: int, text: str) -> str:
+        """Отправляет одно сообщение; RetryAfter повторяет очередь исходящих.
+
+        :return: sent, blocked или failed.
+        """
+
+        try:
+            await self.outbound.send_message(self.bot, telegram_id, text)
+        except TelegramForbiddenError:
+            return "blocked"
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning("Broadcast message to %s failed: %s", telegram_id, exc)
+            return "failed"
+        return "sent"
+
+    async def _send_batch(self, text: str, rows) -> tuple[int, int, list[int]]:
+        """Отправляет пачку в темпе ведра рассылок.
+
+        :param text: текст рассылки.
+        :param rows: строки (users.id, telegram_id).
+        :return: (доставлено, ошибок, users.id заблокировавших бота).
+        """
+
+        tasks = []
+        for _, telegram_id in rows:
+            await self.bucket.acquire()
+            tasks.append(asyncio.create_task(self._deliver(telegram_id, text)))
+        results = await asyncio.gather(*tasks)
+        blocked = [user_id for (user_id, _), result in zip(rows, results) if result == "blocked"]
+        sent = results.count("sent")
+        failed = results.count("failed")
+        self.messages.inc(sent, "sent")
+        self.messages.inc(failed, "failed")
+        self.messages.inc(len(blocked), "blocked")
+        return sent, failed, blocked
+
+    async def _run(self, broadcast_id: int) -> None:
+        """Ведёт рассылку до конца, паузы или отмены."""
+
+        try:
+            async with self.sessions.writer()() as session:
+                broadcast = await BroadcastRepository(session).get(broadcast_id)
+            if broadcast is None or broadcast.status != "running":
+                return
+            text, cursor = broadcast.text, broadcast.cursor
+            logger.info("Broadcast %s running from user id %s", broadcast_id, cursor)
+            while True:
+                segment = 0
+                async with self.sessions.reader()() as reader:
+                    result = await UserRepository(reader).stream_recipients(cursor, SEGMENT_SIZE)
+                    async for rows in result.partitions(CHECKPOINT_EVERY):
+                        segment += len(rows)
+                        sent, failed, blocked = await self._send_batch(text, rows)
+                        cursor = rows[-1][0]
+                        async with self.sessions.writer()() as session:
+                            status = await BroadcastRepository(session).checkpoint(
+                                broadcast_id, cursor, sent, failed, blocked
+                            )
+                            await session.commit()
+                        if status != "running":
+                            logger.info("Broadcast %s stopped at user id %s: %s", broadcast_id, cursor, status)
+                            return
+                if segment < SEGMENT_SIZE:
+                    break
+            await self._transition(broadcast_id, "done", expected="running")
+            logger.info("Broadcast %s finished", broadcast_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:  # pylint: disable=broad-except
+            # Пауза вместо running: админ продолжит рассылку с контрольной точки, когда БД/сеть оживут.
+            logger.exception("Broadcast %s failed, pausing: %s", broadcast_id, exc)
+            try:
+                await self._transition(broadcast_id, "paused", expected="running")
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Broadcast %s: could not pause after failure", broadcast_id)
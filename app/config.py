@@ -16,13 +16,54 @@ class Settings:
     :param bot_token: токен Telegram-бота.
     :param admin_ids: набор Telegram ID, имеющих доступ к админ-панели.
     :param database_url: строка подключения к базе данных.
+    :param database_replica_urls: строки подключения к read-репликам (пусто — только primary).
+    :param replica_max_lag_seconds: допустимое отставание реплики; при большем чтение идёт в primary.
+    :param db_statement_cache_size: подготовленных операторов на соединение asyncpg (0 — для PgBouncer в режиме transaction).
     :param max_keys_per_user: максимально допустимое количество ключей у пользователя.
     :param default_key_ttl_hours: срок жизни временного ключа в часах по умолчанию.
+    :param metrics_port: порт HTTP-эндпоинта /metrics (0 — отключён).
+    :param metrics_file: путь для периодической выгрузки метрик в файл (None — отключено).
+    :param slow_query_ms: порог логирования медленных запросов в мс (0 — отключено).
+    :param repeated_query_threshold: сколько одинаковых запросов в апдейте считать N+1 (0 — отключено).
+    :param profiler_seconds: длительность профилирования из админ-панели.
+    :param outbound_global_rate: лимит исходящих вызовов Bot API в секунду на весь бот.
+    :param outbound_chat_rate: лимит исходящих вызовов в секунду на один чат.
+    :param outbound_chat_burst: допустимый всплеск вызовов в один чат.
+    :param delivery_qr_enabled: прикладывать QR-код к выдаваемым конфигам.
+    :param delivery_bundle: отправлять конфиг и QR одной медиагруппой.
+    :param help_image_path: картинка-инструкция для раздела «Помощь» (None — без картинки).
+    :param user_lock_backend: блокировка create/rotate на пользователя: local или postgres (advisory lock).
+    :param idempotency_ttl_seconds: сколько помнить результат create/rotate для повторных нажатий.
+    :param ratelimit_cheap_rate: лёгких действий (меню, помощь) в секунду на пользователя.
+    :param ratelimit_cheap_burst: допустимый всплеск лёгких действий.
+    :param ratelimit_expensive_rate: тяжёлых действий (создание/ротация) в секунду на пользователя.
+    :param ratelimit_expensive_burst: допустимый всплеск тяжёлых действий.
+    :param ratelimit_global_expensive_rate: тяжёлых действий в секунду на весь бот.
+    :param keygen_concurrency: сколько генераций ключей wg может идти одновременно.
+    :param stats_interval_seconds: период сбора статистики пиров (0 — сбор выключен).
+    :param wg_dump_file: файл в формате `wg show all dump` вместо вызова wg (для тестов).
+    :param stats_minute_retention_hours: сколько часов хранить минутные агрегаты трафика.
+    :param idle_reclaim_days: отзывать ключи без подключений дольше стольких дней (0 — не отзывать).
+    :param idle_reclaim_batch: сколько простаивающих ключей отзывать за одну транзакцию.
+    :param wg_interface: интерфейс WireGuard сервера из WG_* (для `wg set`).
+    :param wg_manage_peers: применять ротацию к интерфейсу через `wg set` (нужен доступ к wg хоста).
+    :param rotation_max_age_days: плановая ротация ключей старше стольких дней (0 — выключена).
+    :param rotation_window_minutes: на сколько минут растягивать проход плановой ротации.
+    :param rotation_batch: ключей в одной пачке плановой ротации.
+    :param expiry_reminder_hours: за сколько часов до истечения напоминать о ключе (0 — не напоминать).
+    :param expiry_reminder_batch: ключей в одной выборке напоминаний.
+    :param broadcast_rate: сообщений рассылки в секунду (часть OUTBOUND_GLOBAL_RATE).
+    :param dashboard_reconcile_minutes: период сверки счётчиков сводки с таблицами.
+    :param cache_ttl_seconds: время жизни записей кэшей пользователей и списков ключей (0 — кэш выключен).
+    :param cache_fallback_ttl_seconds: время жизни записей, пока не работает LISTEN инвалидации (Postgres).
     """
 
     bot_token: str
     admin_ids: Set[int]
     database_url: str
+    database_replica_urls: tuple[str, ...]
+    replica_max_lag_seconds: float
+    db_statement_cache_size: int
     max_keys_per_user: int
     default_key_ttl_hours: int
     wg_endpoint: str
@@ -36,6 +77,43 @@ class Settings:
     billing_enabled: bool
     cleanup_interval_minutes: int
     log_level: str
+    metrics_host: str
+    metrics_port: int
+    metrics_file: str | None
+    metrics_dump_interval_seconds: int
+    slow_query_ms: int
+    repeated_query_threshold: int
+    profiler_seconds: int
+    outbound_global_rate: float
+    outbound_chat_rate: float
+    outbound_chat_burst: float
+    delivery_qr_enabled: bool
+    delivery_bundle: bool
+    help_image_path: str | None
+    user_lock_backend: str
+    idempotency_ttl_seconds: int
+    ratelimit_cheap_rate: float
+    ratelimit_cheap_burst: float
+    ratelimit_expensive_rate: float
+    ratelimit_expensive_burst: float
+    ratelimit_global_expensive_rate: float
+    keygen_concurrency: int
+    stats_interval_seconds: int
+    wg_dump_file: str | None
+    stats_minute_retention_hours: int
+    idle_reclaim_days: int
+    idle_reclaim_batch: int
+    wg_interface: str
+    wg_manage_peers: bool
+    rotation_max_age_days: int
+    rotation_window_minutes: int
+    rotation_batch: int
+    expiry_reminder_hours: int
+    expiry_reminder_batch: int
+    broadcast_rate: float
+    dashboard_reconcile_minutes: int
+    cache_ttl_seconds: float
+    cache_fallback_ttl_seconds: float
 
 
 def load_settings() -> Settings:
@@ -52,6 +130,11 @@ def load_settings() -> Settings:
         database_url=os.getenv(
             "DATABASE_URL", "postgresql+asyncpg://vpn:vpn@db:5432/vpn"
         ),
+        database_replica_urls=tuple(
+            item.strip() for item in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if item.strip()
+        ),
+        replica_max_lag_seconds=float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5")),
+        db_statement_cache_size=int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500")),
         max_keys_per_user=int(os.getenv("MAX_KEYS_PER_USER", "3")),
         default_key_ttl_hours=int(os.getenv("DEFAULT_KEY_TTL_HOURS", "24")),
         wg_endpoint=os.getenv("WG_ENDPOINT", "vpn.example.com:51820"),
@@ -65,4 +148,41 @@ def load_settings() -> Settings:
         billing_enabled=os.getenv("BILLING_ENABLED", "false").lower() == "true",
         cleanup_interval_minutes=int(os.getenv("CLEANUP_INTERVAL_MINUTES", "10")),
         log_level=os.getenv("LOG_LEVEL", "INFO"),
+        metrics_host=os.getenv("METRICS_HOST", "0.0.0.0"),
+        metrics_port=int(os.getenv("METRICS_PORT", "0")),
+        metrics_file=os.getenv("METRICS_FILE") or None,
+        metrics_dump_interval_seconds=int(os.getenv("METRICS_DUMP_INTERVAL_SECONDS", "30")),
+        slow_query_ms=int(os.getenv("SLOW_QUERY_MS", "200")),
+        repeated_query_threshold=int(os.getenv("REPEATED_QUERY_THRESHOLD", "3")),
+        profiler_seconds=int(os.getenv("PROFILER_SECONDS", "10")),
+        outbound_global_rate=float(os.getenv("OUTBOUND_GLOBAL_RATE", "25")),
+        outbound_chat_rate=float(os.getenv("OUTBOUND_CHAT_RATE", "1")),
+        outbound_chat_burst=float(os.getenv("OUTBOUND_CHAT_BURST", "3")),
+        delivery_qr_enabled=os.getenv("DELIVERY_QR_ENABLED", "true").lower() == "true",
+        delivery_bundle=os.getenv("DELIVERY_BUNDLE", "true").lower() == "true",
+        help_image_path=os.getenv("HELP_IMAGE_PATH") or None,
+        user_lock_backend=os.getenv("USER_LOCK_BACKEND", "local").lower(),
+        idempotency_ttl_seconds=int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "120")),
+        ratelimit_cheap_rate=float(os.getenv("RATELIMIT_CHEAP_RATE", "2")),
+        ratelimit_cheap_burst=float(os.getenv("RATELIMIT_CHEAP_BURST", "5")),
+        ratelimit_expensive_rate=float(os.getenv("RATELIMIT_EXPENSIVE_RATE", "0.2")),
+        ratelimit_expensive_burst=float(os.getenv("RATELIMIT_EXPENSIVE_BURST", "2")),
+        ratelimit_global_expensive_rate=float(os.getenv("RATELIMIT_GLOBAL_EXPENSIVE_RATE", "10")),
+        keygen_concurrency=int(os.getenv("KEYGEN_CONCURRENCY", "2")),
+        stats_interval_seconds=int(os.getenv("STATS_INTERVAL_SECONDS", "60")),
+        wg_dump_file=os.getenv("WG_DUMP_FILE") or None,
+        stats_minute_retention_hours=int(os.getenv("STATS_MINUTE_RETENTION_HOURS", "48")),
+        idle_reclaim_days=int(os.getenv("IDLE_RECLAIM_DAYS", "0")),
+        idle_reclaim_batch=int(os.getenv("IDLE_RECLAIM_BATCH", "100")),
+        wg_interface=os.getenv("WG_INTERFACE", "wg0"),
+        wg_manage_peers=os.getenv("WG_MANAGE_PEERS", "false").lower() == "true",
+        rotation_max_age_days=int(os.getenv("ROTATION_MAX_AGE_DAYS", "0")),
+        rotation_window_minutes=int(os.getenv("ROTATION_WINDOW_MINUTES", "60")),
+        rotation_batch=int(os.getenv("ROTATION_BATCH", "10")),
+        expiry_reminder_hours=int(os.getenv("EXPIRY_REMINDER_HOURS", "24")),
+        expiry_reminder_batch=int(os.getenv("EXPIRY_REMINDER_BATCH", "1000")),
+        broadcast_rate=float(os.getenv("BROADCAST_RATE", "10")),
+        dashboard_reconcile_minutes=int(os.getenv("DASHBOARD_RECONCILE_MINUTES", "60")),
+        cache_ttl_seconds=float(os.getenv("CACHE_TTL_SECONDS", "300")),
+        cache_fallback_ttl_seconds=float(os.getenv("CACHE_FALLBACK_TTL_SECONDS", "5")),
     )
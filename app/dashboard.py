@@ -0,0 +1,206 @@
+"""Сводка админ-панели на инкрементальных счётчиках.
+
+Репозитории меняют счётчики dashboard_counters в той же транзакции, что и
+данные (выдача/отзыв/продление ключей, новые пользователи, списания), поэтому
+сводка читает пару десятков строк по первичному ключу независимо от размера
+таблиц. Раз в DASHBOARD_RECONCILE_MINUTES (и при старте) счётчики
+пересчитываются агрегатами по таблицам, расхождения пишутся в лог и метрику.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import logging
+from dataclasses import dataclass
+
+from app.config import Settings
+from app.metrics import registry
+from app.repositories import (
+    BillingRepository,
+    CounterRepository,
+    ServerRepository,
+    UserRepository,
+    VpnKeyRepository,
+)
+from app.servers import ServerTarget
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_HORIZONS = ((1, "сегодня"), (7, "за 7 дней"), (30, "за 30 дней"))
+
+
+@dataclass(frozen=True)
+class PoolUsage:
+    """Занятость пула адресов сервера.
+
+    :param name: имя сервера.
+    :param used: занятые адреса (неотозванные ключи).
+    :param size: размер пула.
+    """
+
+    name: str
+    used: int
+    size: int
+
+    @property
+    def free(self) -> int:
+        """Свободные адреса."""
+
+        return max(self.size - self.used, 0)
+
+
+@dataclass(frozen=True)
+class DashboardSummary:
+    """Сводка для админ-панели.
+
+    :param users: всего пользователей.
+    :param active_keys: неотозванные ключи.
+    :param expiring: (подпись, число ключей, истекающих в этот горизонт) по нарастанию горизонта.
+    :param pools: занятость пулов.
+    :param spend_today: списано кредитов за сегодня (UTC).
+    """
+
+    users: int
+    active_keys: int
+    expiring: list[tuple[str, int]]
+    pools: list[PoolUsage]
+    spend_today: int
+
+    def render(self) -> str:
+        """Текст сводки для сообщения.
+
+        :return: многострочный текст.
+        """
+
+        lines = [
+            "📊 Сводка",
+            f"Пользователей: {self.users}",
+            f"Активных ключей: {self.active_keys}",
+            "Истекают: " + ", ".join(f"{label} — {count}" for label, count in self.expiring),
+        ]
+        lines.extend(f"Пул {pool.name}: занято {pool.used}/{pool.size}, свободно {pool.free}" for pool in self.pools)
+        lines.append(f"Списано сегодня: {self.spend_today}")
+        return "\n".join(lines)
+
+
+async def load_summary(session, settings: Settings, now: dt.datetime | None = None) -> DashboardSummary:
+    """Собирает сводку одним чтением счётчиков по именам.
+
+    :param session: AsyncSession (подойдёт реплика).
+    :param settings: конфигурация приложения.
+    :param now: текущее время (UTC).
+    :return: DashboardSummary.
+    """
+
+    now = now or dt.datetime.now(dt.timezone.utc)
+    servers = await ServerRepository(session).list_active()
+    targets = [ServerTarget.from_model(server) for server in servers]
+    default = ServerTarget.from_settings(settings)
+    days = [CounterRepository.expiring(now + dt.timedelta(days=offset)) for offset in range(EXPIRY_HORIZONS[-1][0])]
+    names = [
+        CounterRepository.USERS,
+        CounterRepository.KEYS_ACTIVE,
+        CounterRepository.spend(now),
+        CounterRepository.pool_used(None),
+        *(CounterRepository.pool_used(target.id) for target in targets),
+        *days,
+    ]
+    values = await CounterRepository(session).get_many(names)
+
+    expiring = []
+    for horizon, label in EXPIRY_HORIZONS:
+        # До сверки счётчик дня может уйти в минус, если ключ правили мимо репозиториев.
+        expiring.append((label, max(sum(values.get(day, 0) for day in days[:horizon]), 0)))
+    active = values.get(CounterRepository.KEYS_ACTIVE, 0)
+    expiring.append(("позже", max(active - expiring[-1][1], 0)))
+
+    default_used = values.get(CounterRepository.pool_used(None), 0)
+    if not targets or default_used:
+        targets.insert(0, default)
+    pools = [
+        PoolUsage(target.name, values.get(CounterRepository.pool_used(target.id), 0), target.pool_size)
+        for target in targets
+    ]
+    return DashboardSummary(
+        users=values.get(CounterRepository.USERS, 0),
+        active_keys=active,
+        expiring=expiring,
+        pools=pools,
+        spend_today=values.get(CounterRepository.spend(now), 0),
+    )
+
+
+class DashboardReconciler:
+    """Пересчитывает счётчики сводки по таблицам."""
+
+    def __init__(self, settings: Settings, session_maker):
+        """Инициализация.
+
+        :param settings: конфигурация приложения.
+        :param session_maker: фабрика сессий primary.
+        """
+
+        self.settings = settings
+        self.session_maker = session_maker
+        self.corrections = registry.counter(
+            "bot_dashboard_corrections_total", "Счётчики сводки, исправленные сверкой.", labels=("counter",)
+        )
+
+    async def run_once(self, now: dt.datetime | None = None) -> int:
+        """Одна сверка в одной транзакции.
+
+        Приращения из транзакций, закоммиченных во время сверки, могут
+        потеряться или учесться дважды — это исправит следующая сверка.
+
+        :param now: текущее время (UTC).
+        :return: число исправленных счётчиков.
+        """
+
+        now = now or dt.datetime.now(dt.timezone.utc)
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        async with self.session_maker() as session:
+            keys = VpnKeyRepository(session)
+            by_server = await keys.unrevoked_by_server()
+            actual = {
+                CounterRepository.USERS: await UserRepository(session).count(),
+                CounterRepository.KEYS_ACTIVE: sum(by_server.values()),
+                CounterRepository.spend(now): await BillingRepository(session).spend_since(today),
+            }
+            for server_id, count in by_server.items():
+                actual[CounterRepository.pool_used(server_id)] = count
+            for day, count in (await keys.unrevoked_by_expiry_day()).items():
+                actual[CounterRepository.EXPIRING + day] = count
+
+            counters = CounterRepository(session)
+            current = await counters.all()
+            drift = {
+                name: (current.get(name, 0), value)
+                for name, value in actual.items()
+                if current.get(name, 0) != value
+            }
+            drift.update(
+                (name, (value, 0))
+                for name, value in current.items()
+                if name not in actual and name.startswith(CounterRepository.FAMILIES) and value
+            )
+            await counters.replace(actual)
+            await session.commit()
+        for name, (was, fixed) in drift.items():
+            self.corrections.inc(1, name.split(":", 1)[0])
+            logger.info("Dashboard counter %s corrected: %s -> %s", name, was, fixed)
+        return len(drift)
+
+    async def run(self, interval: int) -> None:
+        """Бесконечный цикл сверки (первая — сразу при старте).
+
+        :param interval: пауза между сверками, секунды.
+        :return: None.
+        """
+
+        while True:
+            try:
+                await self.run_once()
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.exception("Dashboard reconcile failed: %s", exc)
+            await asyncio.sleep(interval)
@@ -1,21 +1,335 @@
 from __future__ import annotations
 
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+import asyncio
+import itertools
+import logging
+import re
+import time
+from abc import ABC, abstractmethod
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Hashable, Iterable, Iterator, Sequence
+
+from sqlalchemy import event, func, make_url, select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 
 from app.config import Settings
+from app.metrics import registry
 from app.models import Base
 
+logger = logging.getLogger(__name__)
+
 SessionMaker = async_sessionmaker[AsyncSession]
 
 
-def get_engine(settings: Settings):
+@dataclass
+class QueryStats:
+    """Счётчики SQL-запросов в рамках одного апдейта.
+
+    :param count: количество выполненных запросов.
+    :param duration: суммарное время выполнения в секундах.
+    :param shapes: сколько раз встретилась каждая форма запроса.
+    """
+
+    count: int = 0
+    duration: float = 0.0
+    shapes: Counter[str] = field(default_factory=Counter)
+
+    def merge(self, other: "QueryStats") -> None:
+        """Добавляет к себе статистику вложенной области.
+
+        :param other: статистика вложенной области.
+        :return: None.
+        """
+
+        self.count += other.count
+        self.duration += other.duration
+        self.shapes.update(other.shapes)
+
+    def repeated(self, threshold: int = 2) -> dict[str, int]:
+        """Возвращает формы запросов, повторившиеся не меньше threshold раз.
+
+        :param threshold: минимальное число повторов.
+        :return: словарь форма -> количество.
+        """
+
+        return {shape: n for shape, n in self.shapes.items() if n >= threshold}
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Область выполнила больше запросов, чем разрешено бюджетом."""
+
+
+class QueryHook(ABC):
+    """Расширение движка: вызывается после каждого выполненного запроса."""
+
+    @abstractmethod
+    def on_query(
+        self,
+        shape: str,
+        parameters: Any,
+        duration: float,
+        stats: QueryStats | None,
+    ) -> None:
+        """Обрабатывает выполненный запрос.
+
+        :param shape: нормализованный текст запроса.
+        :param parameters: параметры запроса (не логировать как есть!).
+        :param duration: время выполнения в секундах.
+        :param stats: статистика текущего апдейта или None вне track_queries.
+        :return: None.
+        """
+
+
+class SlowQueryLogger(QueryHook):
+    """Логирует запросы медленнее порога, скрывая значения параметров."""
+
+    def __init__(self, threshold_ms: int):
+        """Инициализация.
+
+        :param threshold_ms: порог в миллисекундах.
+        """
+
+        self.threshold = threshold_ms / 1000
+
+    def on_query(self, shape, parameters, duration, stats) -> None:
+        """Пишет warning для медленного запроса."""
+
+        if duration < self.threshold:
+            return
+        logger.warning(
+            "Slow query %.1f ms: %s params=%s",
+            duration * 1000,
+            shape,
+            redact_parameters(parameters),
+        )
+
+
+class RepeatedQueryDetector(QueryHook):
+    """Ищет N+1: одинаковые формы запросов, повторяющиеся в одном апдейте."""
+
+    def __init__(self, threshold: int):
+        """Инициализация.
+
+        :param threshold: с какого повтора формы сообщать о проблеме.
+        """
+
+        self.threshold = threshold
+
+    def on_query(self, shape, parameters, duration, stats) -> None:
+        """Сообщает о форме ровно один раз — когда она достигает порога."""
+
+        if stats is None or stats.shapes[shape] != self.threshold:
+            return
+        logger.warning("Possible N+1: query repeated %s times in one update: %s", self.threshold, shape)
+
+
+_query_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+_PLACEHOLDER_LIST_RE = re.compile(r"\(\s*(?:\?|%s|\$\d+|:\w+)(?:\s*,\s*(?:\?|%s|\$\d+|:\w+))*\s*\)")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """Нормализует SQL: схлопывает пробелы и списки плейсхолдеров IN (...).
+
+    :param statement: исходный текст запроса.
+    :return: форма запроса, одинаковая для вызовов с разными параметрами.
+    """
+
+    shape = _WHITESPACE_RE.sub(" ", statement).strip()
+    return _PLACEHOLDER_LIST_RE.sub("(?)", shape)
+
+
+def redact_parameters(parameters: Any) -> Any:
+    """Заменяет значения параметров на имена их типов.
+
+    :param parameters: параметры запроса (dict, tuple или список наборов).
+    :return: структура того же вида без значений.
+    """
+
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return f"<{len(parameters)} rows>"
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+@contextmanager
+def track_queries() -> Iterator[QueryStats]:
+    """Считает запросы, выполненные в текущем контексте (апдейте).
+
+    Вложенные области дополнительно учитываются во внешней.
+
+    :return: контекстный менеджер, отдающий накапливаемый QueryStats.
+    """
+
+    parent = _query_stats.get()
+    stats = QueryStats()
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+        if parent is not None:
+            parent.merge(stats)
+
+
+@contextmanager
+def query_budget(max_queries: int) -> Iterator[QueryStats]:
+    """Проверяет, что блок укладывается в бюджет запросов (для тестов и CI).
+
+    :param max_queries: максимально допустимое число запросов.
+    :return: контекстный менеджер, отдающий QueryStats блока.
+    :raises QueryBudgetExceeded: если запросов больше бюджета.
+    """
+
+    with track_queries() as stats:
+        yield stats
+    if stats.count > max_queries:
+        repeated = "; ".join(f"{n}x {shape}" for shape, n in stats.repeated().items())
+        raise QueryBudgetExceeded(
+            f"Выполнено {stats.count} запросов при бюджете {max_queries}"
+            + (f" (повторы: {repeated})" if repeated else "")
+        )
+
+
+def instrument_engine(engine: AsyncEngine, hooks: Sequence[QueryHook] = ()) -> AsyncEngine:
+    """Подключает к движку подсчёт запросов и хуки.
+
+    :param engine: асинхронный движок.
+    :param hooks: хуки, вызываемые после каждого запроса.
+    :return: тот же движок.
+    """
+
+    query_hooks = list(hooks)
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        context._query_started_at = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+        stats = _query_stats.get()
+        if stats is None and not query_hooks:
+            return
+        duration = time.perf_counter() - context._query_started_at
+        shape = statement_shape(statement)
+        if stats is not None:
+            stats.count += 1
+            stats.duration += duration
+            stats.shapes[shape] += 1
+        for hook in query_hooks:
+            hook.on_query(shape, parameters, duration, stats)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+    return engine
+
+
+def default_query_hooks(settings: Settings) -> list[QueryHook]:
+    """Собирает хуки движка согласно конфигурации.
+
+    :param settings: конфигурация приложения.
+    :return: список хуков.
+    """
+
+    hooks: list[QueryHook] = []
+    if settings.slow_query_ms > 0:
+        hooks.append(SlowQueryLogger(settings.slow_query_ms))
+    if settings.repeated_query_threshold > 0:
+        hooks.append(RepeatedQueryDetector(settings.repeated_query_threshold))
+    return hooks
+
+
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+)
+SQLITE_READ_POOL_SIZE = 4
+
+
+def is_sqlite(url: str) -> bool:
+    """Проверяет, что строка подключения указывает на SQLite.
+
+    :param url: строка подключения.
+    :return: True для sqlite/sqlite+aiosqlite.
+    """
+
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def _is_sqlite_memory(url: str) -> bool:
+    """SQLite в памяти: у каждого соединения своя база, пул и читатели не применимы."""
+
+    database = make_url(url).database
+    return not database or database == ":memory:"
+
+
+def create_engine_for_url(
+    url: str, readonly: bool = False, statement_cache_size: int | None = None
+) -> AsyncEngine:
+    """Создаёт движок с настройками под диалект.
+
+    Для файлового SQLite: WAL и pragmas на каждом соединении; движок записи держит
+    ровно одно соединение, так что пишущие сессии ждут своей очереди в пуле вместо
+    «database is locked». Движок чтения (readonly) — небольшой пул с query_only.
+    Для asyncpg: каждое соединение держит LRU подготовленных операторов, повторный
+    запрос той же формы не проходит Parse/Describe на сервере.
+
+    :param url: строка подключения.
+    :param readonly: движок только для чтения (имеет смысл для SQLite).
+    :param statement_cache_size: подготовленных операторов на соединение asyncpg (0 — не кэшировать,
+        None — умолчание SQLAlchemy).
+    :return: асинхронный движок.
+    """
+
+    if not is_sqlite(url) or _is_sqlite_memory(url):
+        connect_args = {}
+        if statement_cache_size is not None and make_url(url).get_driver_name() == "asyncpg":
+            connect_args["prepared_statement_cache_size"] = statement_cache_size
+        return create_async_engine(url, future=True, echo=False, connect_args=connect_args)
+    engine = create_async_engine(
+        url,
+        future=True,
+        echo=False,
+        poolclass=AsyncAdaptedQueuePool,
+        pool_size=SQLITE_READ_POOL_SIZE if readonly else 1,
+        max_overflow=0,
+    )
+    pragmas = SQLITE_PRAGMAS + (("PRAGMA query_only=ON",) if readonly else ())
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):  # pylint: disable=unused-argument
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return engine
+
+
+def get_engine(settings: Settings, url: str | None = None, readonly: bool = False):
     """Создаёт асинхронный движок SQLAlchemy.
 
     :param settings: конфигурация приложения.
+    :param url: строка подключения (по умолчанию settings.database_url).
+    :param readonly: движок только для чтения.
     :return: асинхронный движок для работы с БД.
     """
 
-    return create_async_engine(settings.database_url, future=True, echo=False)
+    engine = create_engine_for_url(
+        url or settings.database_url, readonly=readonly, statement_cache_size=settings.db_statement_cache_size
+    )
+    return instrument_engine(engine, default_query_hooks(settings))
 
 
 def get_session_maker(settings: Settings) -> SessionMaker:
@@ -39,3 +353,500 @@ async def init_models(session_maker: SessionMaker) -> None:
     async with session_maker() as session:
         async with session.bind.begin() as conn:
             await conn.run_sync(Base.metadata.create_all)
+
+
+REPLICA_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+STICKY_MAX_ENTRIES = 10_000
+
+
+class SessionRouter:
+    """Выбирает фабрику сессий: запись — в primary, чтение — в реплику.
+
+    Реплика используется, только если её отставание измерено и не больше max_lag_seconds;
+    иначе (нет реплик, не проверена, недоступна, отстаёт) чтение идёт в primary.
+    Для read-your-writes ключ (обычно Telegram ID), после записи которого прошло
+    меньше max_lag_seconds, читает из primary.
+    """
+
+    def __init__(
+        self,
+        primary: SessionMaker,
+        replicas: Sequence[SessionMaker] = (),
+        max_lag_seconds: float = 5.0,
+        replicas_in_sync: bool = False,
+    ):
+        """Инициализация.
+
+        :param primary: фабрика сессий основной БД.
+        :param replicas: фабрики сессий реплик.
+        :param max_lag_seconds: допустимое отставание реплики.
+        :param replicas_in_sync: реплики без отставания (читатели того же файла SQLite).
+        """
+
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.max_lag_seconds = max_lag_seconds
+        self.replicas_in_sync = replicas_in_sync
+        initial_lag = 0.0 if replicas_in_sync else None
+        self.lag: dict[int, float | None] = {index: initial_lag for index in range(len(self.replicas))}
+        self._round_robin = itertools.count()
+        self._recent_writes: OrderedDict[Hashable, float] = OrderedDict()
+
+    def writer(self) -> SessionMaker:
+        """Фабрика сессий для записи.
+
+        :return: primary.
+        """
+
+        return self.primary
+
+    def reader(self, sticky_key: Hashable | None = None) -> SessionMaker:
+        """Фабрика сессий для чтения.
+
+        :param sticky_key: ключ read-your-writes (см. mark_write).
+        :return: здоровая реплика или primary.
+        """
+
+        if sticky_key is not None and self._wrote_recently(sticky_key):
+            return self.primary
+        healthy = [
+            index
+            for index, lag in self.lag.items()
+            if lag is not None and lag <= self.max_lag_seconds
+        ]
+        if not healthy:
+            return self.primary
+        return self.replicas[healthy[next(self._round_robin) % len(healthy)]]
+
+    def staleness(self, session_maker: SessionMaker) -> float:
+        """На сколько секунд могут отставать данные, прочитанные через фабрику.
+
+        :param session_maker: фабрика, которую вернул reader() или writer().
+        :return: 0 для primary и синхронных читателей, иначе max_lag_seconds.
+        """
+
+        if session_maker is self.primary or self.replicas_in_sync:
+            return 0.0
+        return self.max_lag_seconds
+
+    def mark_write(self, sticky_key: Hashable) -> None:
+        """Запоминает запись, чтобы ближайшие чтения по ключу шли в primary.
+
+        :param sticky_key: ключ (обычно Telegram ID).
+        :return: None.
+        """
+
+        self._recent_writes[sticky_key] = time.monotonic()
+        self._recent_writes.move_to_end(sticky_key)
+        while len(self._recent_writes) > STICKY_MAX_ENTRIES:
+            self._recent_writes.popitem(last=False)
+
+    def _wrote_recently(self, sticky_key: Hashable) -> bool:
+        """Была ли запись по ключу в пределах окна max_lag_seconds."""
+
+        horizon = time.monotonic() - self.max_lag_seconds
+        while self._recent_writes:
+            oldest_key, written_at = next(iter(self._recent_writes.items()))
+            if written_at > horizon:
+                break
+            del self._recent_writes[oldest_key]
+        return sticky_key in self._recent_writes
+
+    async def refresh_lag(self) -> None:
+        """Измеряет отставание реплик (None — недоступна).
+
+        :return: None.
+        """
+
+        for index, replica in enumerate(self.replicas):
+            try:
+                async with replica() as session:
+                    if session.bind.dialect.name == "postgresql":
+                        self.lag[index] = float((await session.execute(REPLICA_LAG_SQL)).scalar() or 0.0)
+                    else:
+                        await session.execute(text("SELECT 1"))
+                        self.lag[index] = 0.0
+            except Exception as exc:  # pylint: disable=broad-except
+                if self.lag[index] is not None:
+                    logger.warning("Replica %s unavailable, reading from primary: %s", index, exc)
+                self.lag[index] = None
+
+    async def monitor(self, interval: float = 5.0) -> None:
+        """Периодически обновляет отставание реплик.
+
+        :param interval: период проверки в секундах.
+        :return: None (работает до отмены).
+        """
+
+        while True:
+            await self.refresh_lag()
+            await asyncio.sleep(interval)
+
+    async def close(self) -> None:
+        """Закрывает пулы соединений реплик.
+
+        :return: None.
+        """
+
+        for replica in self.replicas:
+            await replica.kw["bind"].dispose()
+
+
+def get_session_router(settings: Settings) -> SessionRouter:
+    """Создаёт роутер сессий: primary из DATABASE_URL и реплики из DATABASE_REPLICA_URLS.
+
+    Для файлового SQLite «репликой» служит пул читателей того же файла: в WAL чтение
+    не блокируется единственным писателем.
+
+    :param settings: конфигурация приложения.
+    :return: SessionRouter.
+    """
+
+    url = settings.database_url
+    if is_sqlite(url) and not _is_sqlite_memory(url):
+        reader = async_sessionmaker(get_engine(settings, url, readonly=True), expire_on_commit=False)
+        return SessionRouter(get_session_maker(settings), [reader], replicas_in_sync=True)
+    replicas = [
+        async_sessionmaker(get_engine(settings, replica_url), expire_on_commit=False)
+        for replica_url in settings.database_replica_urls
+    ]
+    return SessionRouter(
+        get_session_maker(settings),
+        replicas,
+        max_lag_seconds=settings.replica_max_lag_seconds,
+    )
+
+
+INVALIDATION_CHANNEL = "vpnbot_cache_invalidate"
+PENDING_INVALIDATIONS = "cache_pending_invalidations"
+PENDING_FILLS = "cache_pending_fills"
+NOTIFY_PAYLOAD_LIMIT = 7900
+NOTIFY_FLUSH_THRESHOLD = 1000
+FLUSH_ALL = "*"
+EVICTION_HISTORY = 4096
+_MISSING = object()
+
+
+class TTLCache:
+    """Кэш процесса (LRU с TTL), записи которого вытесняет InvalidationBus.
+
+    Заполнение идёт по схеме «версия до чтения → put(версия)»: если ключ
+    вытеснили, пока значение читалось из БД, устаревшее значение не сохраняется.
+    """
+
+    def __init__(self, bus: "InvalidationBus", name: str, max_entries: int):
+        """Инициализация (создавать через InvalidationBus.cache).
+
+        :param bus: шина инвалидации.
+        :param name: имя кэша для метрик.
+        :param max_entries: максимальное число записей.
+        """
+
+        self.bus = bus
+        self.name = name
+        self.max_entries = max_entries
+        self._items: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._evicted: OrderedDict[str, tuple[int, float]] = OrderedDict()
+        self._forgotten: tuple[int, float] = (0, 0.0)
+        self.requests = registry.counter(
+            "bot_cache_requests_total", "Обращения к кэшам процесса.", labels=("cache", "result")
+        )
+
+    @property
+    def version(self) -> int:
+        """Версия шины; берётся до чтения из БД и передаётся в put.
+
+        :return: номер последнего вытеснения.
+        """
+
+        return self.bus.sequence
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Значение, если оно есть и не старше текущего TTL шины.
+
+        :param key: ключ кэша.
+        :param default: что вернуть при промахе.
+        :return: значение или default.
+        """
+
+        item = self._items.get(key, _MISSING)
+        if item is not _MISSING:
+            stored_at, value = item
+            if time.monotonic() - stored_at < self.bus.ttl:
+                self._items.move_to_end(key)
+                self.requests.inc(1, self.name, "hit")
+                return value
+            del self._items[key]
+        self.requests.inc(1, self.name, "miss")
+        return default
+
+    def put(self, key: str, value: Any, version: int, staleness: float = 0.0) -> bool:
+        """Сохраняет значение, прочитанное после получения version.
+
+        :param key: ключ кэша.
+        :param value: значение.
+        :param version: self.version, взятая до чтения.
+        :param staleness: на сколько секунд может отставать источник (реплика).
+        :return: False, если ключ вытесняли после version (или в пределах staleness) и значение не сохранено.
+        """
+
+        horizon = time.monotonic() - staleness
+        evicted = self._evicted.get(key)
+        if evicted is not None and (evicted[0] > version or evicted[1] > horizon):
+            return False
+        if self._forgotten[0] > version or self._forgotten[1] > horizon:
+            return False
+        self._items[key] = (time.monotonic(), value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+        return True
+
+    def put_after_commit(self, session: AsyncSession | Session, key: str, value: Any, version: int) -> None:
+        """Сохраняет значение после коммита сессии (откат его выбрасывает).
+
+        Для значений, прочитанных или созданных внутри пишущей транзакции.
+
+        :param session: сессия, в транзакции которой получено значение.
+        :param key: ключ кэша.
+        :param value: значение.
+        :param version: self.version, взятая до чтения.
+        :return: None.
+        """
+
+        session.info.setdefault(PENDING_FILLS, []).append((self, key, value, version))
+
+    def evict(self, keys: Iterable[str], sequence: int) -> None:
+        """Удаляет записи и запоминает, когда ключи вытеснялись.
+
+        :param keys: ключи кэша.
+        :param sequence: номер вытеснения в шине.
+        :return: None.
+        """
+
+        now = time.monotonic()
+        for key in keys:
+            self._items.pop(key, None)
+            self._evicted[key] = (sequence, now)
+            self._evicted.move_to_end(key)
+        while len(self._evicted) > EVICTION_HISTORY:
+            _, forgotten = self._evicted.popitem(last=False)
+            self._forgotten = max(self._forgotten, forgotten)
+
+    def clear(self, sequence: int) -> None:
+        """Сбрасывает кэш целиком.
+
+        :param sequence: номер вытеснения в шине.
+        :return: None.
+        """
+
+        self._items.clear()
+        self._evicted.clear()
+        self._forgotten = (sequence, time.monotonic())
+
+
+class InvalidationBus:
+    """Инвалидация кэшей процессов, работающих с одной БД.
+
+    Репозитории отмечают изменённые ключи кэша через invalidate(); при COMMIT
+    Postgres они уходят в NOTIFY той же транзакцией (откат — без уведомления),
+    а после коммита вытесняются и в своём процессе. Каждый процесс слушает
+    канал (listen) и вытесняет ключи из чужих уведомлений. Пока слушатель
+    не подключён, записи живут fallback_ttl_seconds вместо ttl_seconds.
+    С SQLite (один процесс бота) достаточно локального вытеснения.
+    """
+
+    def __init__(self, ttl_seconds: float = 300.0, fallback_ttl_seconds: float = 5.0):
+        """Инициализация.
+
+        :param ttl_seconds: время жизни записей при работающей инвалидации.
+        :param fallback_ttl_seconds: время жизни записей, пока слушатель отключён.
+        """
+
+        self.ttl_seconds = ttl_seconds
+        self.fallback_ttl_seconds = fallback_ttl_seconds
+        self.shared = False
+        self.listening = False
+        self.sequence = 0
+        self._caches: dict[str, TTLCache] = {}
+        self.evictions = registry.counter(
+            "bot_cache_invalidations_total", "Вытесненные ключи кэшей по источнику.", labels=("source",)
+        )
+        self.listener_up = registry.gauge(
+            "bot_cache_listener_up", "Подключён ли слушатель инвалидации кэшей (LISTEN)."
+        )
+
+    def configure(self, settings: Settings) -> None:
+        """Применяет TTL из конфигурации.
+
+        :param settings: конфигурация приложения.
+        :return: None.
+        """
+
+        self.ttl_seconds = settings.cache_ttl_seconds
+        self.fallback_ttl_seconds = settings.cache_fallback_ttl_seconds
+
+    @property
+    def ttl(self) -> float:
+        """Текущее время жизни записей.
+
+        :return: ttl_seconds или fallback_ttl_seconds, если чужие изменения сейчас не доходят.
+        """
+
+        if self.shared and not self.listening:
+            return min(self.fallback_ttl_seconds, self.ttl_seconds)
+        return self.ttl_seconds
+
+    def cache(self, name: str, max_entries: int) -> TTLCache:
+        """Возвращает кэш, создавая его при первом обращении.
+
+        :param name: имя кэша.
+        :param max_entries: максимальное число записей.
+        :return: TTLCache.
+        """
+
+        if name not in self._caches:
+            self._caches[name] = TTLCache(self, name, max_entries)
+        return self._caches[name]
+
+    def evict(self, keys: Iterable[str], source: str = "local") -> None:
+        """Вытесняет ключи из всех кэшей процесса (FLUSH_ALL — сбросить всё).
+
+        :param keys: ключи кэша.
+        :param source: local (своя транзакция) или remote (уведомление).
+        :return: None.
+        """
+
+        keys = [key for key in keys if key]
+        if not keys:
+            return
+        self.sequence += 1
+        if FLUSH_ALL in keys:
+            self.clear()
+        else:
+            for cache in self._caches.values():
+                cache.evict(keys, self.sequence)
+        self.evictions.inc(len(keys), source)
+
+    def clear(self) -> None:
+        """Сбрасывает все кэши процесса.
+
+        :return: None.
+        """
+
+        self.sequence += 1
+        for cache in self._caches.values():
+            cache.clear(self.sequence)
+
+    def _on_notify(self, connection, pid, channel, payload: str) -> None:  # pylint: disable=unused-argument
+        """Колбэк asyncpg на NOTIFY."""
+
+        self.evict(payload.split(" "), source="remote")
+
+    async def listen(self, engine: AsyncEngine, health_interval: float = 30.0, retry_seconds: float = 5.0) -> None:
+        """Слушает канал инвалидации на отдельном соединении Postgres (asyncpg).
+
+        Обрыв замечается по закрытию соединения или неответу на SELECT 1 раз в
+        health_interval; до переподключения записи живут fallback TTL, после —
+        кэши сбрасываются, так как уведомления за время обрыва потеряны.
+
+        :param engine: движок primary.
+        :param health_interval: период проверки соединения, секунды.
+        :param retry_seconds: пауза перед переподключением.
+        :return: None (работает до отмены).
+        """
+
+        self.shared = True
+        while True:
+            try:
+                async with engine.connect() as conn:
+                    driver = (await conn.get_raw_connection()).driver_connection
+                    lost = asyncio.Event()
+                    driver.add_termination_listener(lambda _: lost.set())
+                    await driver.add_listener(INVALIDATION_CHANNEL, self._on_notify)
+                    self.clear()
+                    self.listening = True
+                    self.listener_up.set(1)
+                    logger.info("Cache invalidation listener connected")
+                    try:
+                        while not lost.is_set():
+                            try:
+                                await asyncio.wait_for(lost.wait(), health_interval)
+                            except asyncio.TimeoutError:
+                                await asyncio.wait_for(driver.fetchval("SELECT 1"), health_interval)
+                    finally:
+                        self.listening = False
+                        self.listener_up.set(0)
+                        # Соединение с LISTEN не возвращается в пул.
+                        await conn.invalidate()
+                logger.warning("Cache invalidation listener disconnected, short TTL until reconnect")
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.warning("Cache invalidation listener lost, short TTL until reconnect: %s", exc)
+            await asyncio.sleep(retry_seconds)
+
+
+invalidation_bus = InvalidationBus()
+
+
+def invalidate(session: AsyncSession | Session, *keys: str) -> None:
+    """Отмечает ключи кэша, которые устареют после коммита транзакции сессии.
+
+    :param session: сессия, в транзакции которой изменены данные.
+    :param keys: ключи кэша.
+    :return: None.
+    """
+
+    session.info.setdefault(PENDING_INVALIDATIONS, set()).update(keys)
+
+
+def _notify_payloads(keys: Sequence[str]) -> Iterator[str]:
+    """Режет список ключей на payload'ы NOTIFY (лимит Postgres — 8000 байт)."""
+
+    if len(keys) > NOTIFY_FLUSH_THRESHOLD:
+        yield FLUSH_ALL
+        return
+    chunk: list[str] = []
+    size = 0
+    for key in keys:
+        if chunk and size + len(key) + 1 > NOTIFY_PAYLOAD_LIMIT:
+            yield " ".join(chunk)
+            chunk, size = [], 0
+        chunk.append(key)
+        size += len(key) + 1
+    if chunk:
+        yield " ".join(chunk)
+
+
+@event.listens_for(Session, "before_commit")
+def _notify_invalidations(session: Session) -> None:
+    """NOTIFY в той же транзакции: уведомление уйдёт, только если она закоммитится."""
+
+    pending = session.info.get(PENDING_INVALIDATIONS)
+    if not pending or session.bind.dialect.name != "postgresql":
+        return
+    for payload in _notify_payloads(sorted(pending)):
+        session.execute(select(func.pg_notify(INVALIDATION_CHANNEL, payload)))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_invalidations(session: Session) -> None:
+    """После коммита вытесняет ключи в своём процессе и сохраняет отложенные значения."""
+
+    pending = session.info.pop(PENDING_INVALIDATIONS, None)
+    if pending:
+        invalidation_bus.evict(pending)
+    for cache, key, value, version in session.info.pop(PENDING_FILLS, ()):
+        cache.put(key, value, version)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_invalidations(session: Session, previous_transaction) -> None:  # pylint: disable=unused-argument
+    """Откат: изменений не было, отложенные значения недействительны."""
+
+    session.info.pop(PENDING_INVALIDATIONS, None)
+    session.info.pop(PENDING_FILLS, None)
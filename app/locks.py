@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Iterable
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import Settings
+
+ADVISORY_NAMESPACE = 0x5650  # "VP": первая половина ключа pg_advisory_xact_lock(int, int)
+ADVISORY_KEY_MODULUS = 2**31 - 1  # Telegram ID не влезает в int4; коллизия лишь сериализует двух пользователей
+IDEMPOTENCY_MAX_ENTRIES = 10_000
+
+
+@dataclass
+class _LockEntry:
+    """Блокировка пользователя и число её держателей/ожидающих."""
+
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    waiters: int = 0
+
+
+class UserLocks:
+    """Блокировки «один тяжёлый запрос на пользователя за раз».
+
+    Внутри процесса — asyncio.Lock на пользователя (удаляется, когда никто не ждёт).
+    Он берётся до открытия сессии: ожидающий не держит соединение пула (на SQLite
+    с одним writer'ом иначе взаимная блокировка). Для нескольких процессов поверх
+    берётся транзакционный advisory lock Postgres первой инструкцией транзакции;
+    он снимается сам при commit/rollback.
+    """
+
+    def __init__(self, advisory: bool = False):
+        """Инициализация.
+
+        :param advisory: дополнительно брать pg_advisory_xact_lock в сессии.
+        """
+
+        self.advisory = advisory
+        self._locks: dict[int, _LockEntry] = {}
+
+    @asynccontextmanager
+    async def hold(self, telegram_id: int) -> AsyncIterator[None]:
+        """Держит блокировку пользователя в процессе на время блока (сессию открывать внутри).
+
+        :param telegram_id: Telegram ID пользователя.
+        :return: асинхронный контекстный менеджер.
+        """
+
+        entry = self._locks.get(telegram_id)
+        if entry is None:
+            entry = self._locks[telegram_id] = _LockEntry()
+        entry.waiters += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.waiters -= 1
+            if entry.waiters == 0:
+                self._locks.pop(telegram_id, None)
+
+    async def lock_transaction(self, session: AsyncSession, telegram_id: int) -> None:
+        """Берёт advisory lock пользователя в транзакции сессии (при backend=postgres).
+
+        Вызывать первой инструкцией транзакции, пока в ней ничего не записано.
+
+        :param session: сессия, транзакция которой держит блокировку.
+        :param telegram_id: Telegram ID пользователя.
+        :return: None.
+        """
+
+        if self.advisory:
+            await session.execute(
+                select(func.pg_advisory_xact_lock(ADVISORY_NAMESPACE, telegram_id % ADVISORY_KEY_MODULUS))
+            )
+
+
+class IdempotencyCache:
+    """Результаты недавних запросов по ключу идемпотентности (с TTL и ограничением размера)."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int = IDEMPOTENCY_MAX_ENTRIES):
+        """Инициализация.
+
+        :param ttl_seconds: сколько помнить результат.
+        :param max_entries: максимальное число ключей.
+        """
+
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._items: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def _evict(self, now: float) -> None:
+        """Выбрасывает протухшие и лишние записи (самые старые — в начале)."""
+
+        while self._items:
+            key, (expires_at, _) = next(iter(self._items.items()))
+            if expires_at > now and len(self._items) <= self.max_entries:
+                break
+            del self._items[key]
+
+    def get(self, keys: Iterable[str]) -> Any | None:
+        """Возвращает сохранённый результат по любому из ключей.
+
+        :param keys: ключи идемпотентности запроса.
+        :return: результат или None.
+        """
+
+        now = time.monotonic()
+        self._evict(now)
+        for key in keys:
+            item = self._items.get(key)
+            if item is not None and item[0] > now:
+                return item[1]
+        return None
+
+    def put(self, keys: Iterable[str], value: Any) -> None:
+        """Запоминает результат под всеми ключами запроса.
+
+        :param keys: ключи идемпотентности.
+        :param value: результат.
+        :return: None.
+        """
+
+        expires_at = time.monotonic() + self.ttl
+        for key in keys:
+            self._items[key] = (expires_at, value)
+            self._items.move_to_end(key)
+        self._evict(time.monotonic())
+
+
+class KeyActionGuard:
+    """Защита create/rotate от двойных нажатий: блокировка пользователя + идемпотентность."""
+
+    def __init__(self, settings: Settings):
+        """Инициализация.
+
+        :param settings: конфигурация приложения.
+        """
+
+        self.locks = UserLocks(advisory=settings.user_lock_backend == "postgres")
+        self.results = IdempotencyCache(ttl_seconds=settings.idempotency_ttl_seconds)
+
+    @staticmethod
+    def keys_for(callback, nonce: str) -> tuple[str, ...]:
+        """Ключи идемпотентности коллбека.
+
+        id коллбека ловит повторную доставку того же апдейта, а отпечаток
+        «пользователь + данные кнопки» — двойное нажатие одной кнопки. Данные
+        содержат nonce, новый при каждой отрисовке меню (render_nonce), поэтому
+        то же действие из заново открытого меню не считается повтором.
+
+        :param callback: входящий CallbackQuery.
+        :param nonce: nonce из данных кнопки (пустой — только id коллбека).
+        :return: кортеж ключей.
+        """
+
+        keys = [f"cb:{callback.id}"]
+        if nonce and callback.from_user is not None:
+            keys.append(f"tap:{callback.from_user.id}:{callback.data}")
+        return tuple(keys)
+
+    def hold(self, telegram_id: int):
+        """Блокировка пользователя в процессе (см. UserLocks.hold).
+
+        :param telegram_id: Telegram ID пользователя.
+        :return: асинхронный контекстный менеджер.
+        """
+
+        return self.locks.hold(telegram_id)
+
+    async def lock_transaction(self, session: AsyncSession, telegram_id: int) -> None:
+        """Advisory lock пользователя в транзакции (см. UserLocks.lock_transaction).
+
+        :param session: сессия.
+        :param telegram_id: Telegram ID пользователя.
+        :return: None.
+        """
+
+        await self.locks.lock_transaction(session, telegram_id)
@@ -1,20 +1,20 @@
 from __future__ import annotations
 
+import time
+
+PROCESS_STARTED = time.perf_counter()
+
 import asyncio
 import logging
+import sys
+from typing import TYPE_CHECKING
 
-from aiogram import Bot, Dispatcher
-from aiogram.client.default import DefaultBotProperties
-from aiogram.enums import ParseMode
-
-from app.bot.filters import AdminFilter
-from app.bot.handlers import admin, common, user_keys
-from app.bot.middleware import ContextMiddleware
 from app.config import Settings, load_settings
-from app.db import get_session_maker
 from app.logging import configure_logging
-from app.migrations_runner import run_migrations
-from app.services import KeyService
+from app.metrics import StartupTimer
+
+if TYPE_CHECKING:
+    from aiogram import Dispatcher
 
 
 async def cleanup_worker(settings: Settings, session_maker) -> None:
@@ -25,6 +25,8 @@ async def cleanup_worker(settings: Settings, session_maker) -> None:
     :return: None.
     """
 
+    from app.services import KeyService
+
     interval = settings.cleanup_interval_minutes * 60
     while True:
         try:
@@ -39,24 +41,61 @@ async def cleanup_worker(settings: Settings, session_maker) -> None:
         await asyncio.sleep(interval)
 
 
-async def main(settings: Settings) -> None:
-    """Точка входа для бота и инициализации БД.
+def build_dispatcher(
+    settings: Settings, session_maker, outbound=None, sessions=None, delivery=None, broadcasts=None
+) -> Dispatcher:
+    """Собирает Dispatcher со всеми middleware и роутерами.
 
     :param settings: конфигурация приложения.
-    :return: None.
+    :param session_maker: фабрика сессий.
+    :param outbound: очередь исходящих сообщений (по умолчанию — из settings).
+    :param sessions: роутер чтения по репликам (по умолчанию — без реплик).
+    :param delivery: выдача конфигов (по умолчанию — поверх outbound).
+    :param broadcasts: движок рассылок (по умолчанию — поверх outbound, бот берётся на старте polling).
+    :return: готовый Dispatcher.
     """
 
-    session_maker = get_session_maker(settings)
-
-    bot = Bot(
-        token=settings.bot_token,
-        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    from aiogram import Dispatcher
+
+    from app.bot.delivery import ConfigDelivery
+    from app.bot.filters import AdminFilter
+    from app.bot.handlers import admin, common, user_keys
+    from app.bot.middleware import ContextMiddleware, InstrumentationMiddleware, RateLimitMiddleware
+    from app.bot.outbound import OutboundQueue
+    from app.broadcast import BroadcastEngine
+    from app.db import SessionRouter
+    from app.locks import KeyActionGuard
+    from app.metrics import registry
+
+    outbound = outbound or OutboundQueue.from_settings(settings)
+    delivery = delivery or ConfigDelivery(outbound, settings)
+    sessions = sessions or SessionRouter(session_maker)
+    broadcasts = broadcasts or BroadcastEngine(settings, sessions, outbound=outbound)
+    context = ContextMiddleware(
+        settings=settings,
+        session_maker=session_maker,
+        outbound=outbound,
+        delivery=delivery,
+        guard=KeyActionGuard(settings),
+        broadcasts=broadcasts,
+        sessions=sessions,
     )
 
     dp = Dispatcher()
-    dp.update.middleware(ContextMiddleware(settings=settings, session_maker=session_maker))
-    dp.callback_query.middleware(ContextMiddleware(settings=settings, session_maker=session_maker))
-    dp.message.middleware(ContextMiddleware(settings=settings, session_maker=session_maker))
+    instrumentation = InstrumentationMiddleware(registry)
+    dp.update.middleware(instrumentation)
+    dp.callback_query.middleware(instrumentation)
+    dp.message.middleware(instrumentation)
+    dp.update.middleware(context)
+    dp.callback_query.middleware(context)
+    dp.message.middleware(context)
+    rate_limit = RateLimitMiddleware(settings, registry)
+    dp.callback_query.outer_middleware(rate_limit)
+    dp.message.outer_middleware(rate_limit)
+    dp.shutdown.register(outbound.close)
+    dp.shutdown.register(delivery.close)
+    dp.startup.register(broadcasts.on_startup)
+    dp.shutdown.register(broadcasts.close)
 
     admin.router.callback_query.filter(AdminFilter(settings.admin_ids))
     admin.router.message.filter(AdminFilter(settings.admin_ids))
@@ -64,24 +103,120 @@ async def main(settings: Settings) -> None:
     dp.include_router(common.router)
     dp.include_router(user_keys.router)
     dp.include_router(admin.router)
+    return dp
+
+
+async def main(settings: Settings, timer: StartupTimer | None = None) -> None:
+    """Точка входа для бота и инициализации БД.
 
-    cleanup_task = asyncio.create_task(cleanup_worker(settings, session_maker))
+    :param settings: конфигурация приложения.
+    :param timer: замер фаз старта (создаётся, если не передан).
+    :return: None.
+    """
+
+    timer = timer or StartupTimer()
+    with timer.phase("imports"):
+        from aiogram import Bot
+        from aiogram.client.default import DefaultBotProperties
+        from aiogram.enums import ParseMode
+
+        from app.db import get_session_router, invalidation_bus, is_sqlite
+        from app.metrics import dump_metrics, monitor_loop_lag, serve_metrics
+        from app.migrations_runner import ensure_schema
+        from app.bot.delivery import ConfigDelivery
+        from app.bot.outbound import OutboundQueue
+        from app.dashboard import DashboardReconciler
+        from app.reclaim import IdleKeyReclaimer
+        from app.reminders import ExpiryNotifier
+        from app.rotation import RotationScheduler
+        from app.services import KeyService
+        from app.stats import PeerStatsCollector
+
+    invalidation_bus.configure(settings)
+    sessions = get_session_router(settings)
+    session_maker = sessions.primary
+    with timer.phase("schema"):
+        await ensure_schema(session_maker.kw["bind"], settings)
+    if settings.admin_ids:
+        async with session_maker() as session:
+            await KeyService(session=session, settings=settings).set_admins(settings.admin_ids)
+            await session.commit()
+
+    with timer.phase("dispatcher"):
+        bot = Bot(
+            token=settings.bot_token,
+            default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+        )
+        outbound = OutboundQueue.from_settings(settings)
+        delivery = ConfigDelivery(outbound, settings)
+        dp = build_dispatcher(settings, session_maker, outbound=outbound, sessions=sessions, delivery=delivery)
+    dp.startup.register(timer.report)
+    dp.shutdown.register(sessions.close)
+
+    background = [
+        asyncio.create_task(cleanup_worker(settings, session_maker)),
+        asyncio.create_task(monitor_loop_lag()),
+    ]
+    if sessions.replicas:
+        background.append(asyncio.create_task(sessions.monitor()))
+    if not is_sqlite(settings.database_url):
+        background.append(asyncio.create_task(invalidation_bus.listen(session_maker.kw["bind"])))
+    reconciler = DashboardReconciler(settings, session_maker)
+    background.append(asyncio.create_task(reconciler.run(settings.dashboard_reconcile_minutes * 60)))
+    if settings.stats_interval_seconds > 0:
+        background.append(asyncio.create_task(PeerStatsCollector(settings, session_maker).run()))
+        if settings.idle_reclaim_days > 0:
+            reclaimer = IdleKeyReclaimer(settings, session_maker, bot=bot, outbound=outbound)
+            background.append(asyncio.create_task(reclaimer.run(settings.cleanup_interval_minutes * 60)))
+    elif settings.idle_reclaim_days > 0:
+        logging.warning("IDLE_RECLAIM_DAYS is set but STATS_INTERVAL_SECONDS=0: idle reclaim disabled")
+    if settings.expiry_reminder_hours > 0:
+        notifier = ExpiryNotifier(settings, session_maker, bot=bot, outbound=outbound)
+        background.append(asyncio.create_task(notifier.run(settings.cleanup_interval_minutes * 60)))
+    if settings.rotation_max_age_days > 0:
+        rotation = RotationScheduler(settings, session_maker, bot=bot, delivery=delivery)
+        background.append(asyncio.create_task(rotation.run(settings.cleanup_interval_minutes * 60)))
+    if settings.metrics_port:
+        background.append(
+            asyncio.create_task(serve_metrics(settings.metrics_host, settings.metrics_port))
+        )
+    if settings.metrics_file:
+        background.append(
+            asyncio.create_task(
+                dump_metrics(settings.metrics_file, settings.metrics_dump_interval_seconds)
+            )
+        )
     try:
         await dp.start_polling(bot)
     finally:
-        cleanup_task.cancel()
+        for task in background:
+            task.cancel()
 
 
 def run() -> None:
-    """Запускает миграции и бот."""
+    """Запускает бот; Alembic вызывается, только если схема отстаёт от head."""
 
-    settings = load_settings()
-    configure_logging(settings.log_level)
+    timer = StartupTimer(started=PROCESS_STARTED)
+    with timer.phase("settings"):
+        settings = load_settings()
+        configure_logging(settings.log_level)
     if not settings.bot_token or ":" not in settings.bot_token:
         raise SystemExit("BOT_TOKEN не задан или неверный. Укажи корректный токен в .env")
+    asyncio.run(main(settings, timer))
+
+
+def migrate() -> None:
+    """Применяет миграции (alembic upgrade head) без запуска бота."""
+
+    from app.migrations_runner import run_migrations
+
+    settings = load_settings()
+    configure_logging(settings.log_level)
     run_migrations(settings)
-    asyncio.run(main(settings))
 
 
 if __name__ == "__main__":
-    run()
+    if sys.argv[1:] == ["migrate"]:
+        migrate()
+    else:
+        run()
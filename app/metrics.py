@@ -0,0 +1,417 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import logging
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Iterator, Sequence
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUERY_COUNT_BUCKETS: tuple[float, ...] = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+LOOP_LAG_BUCKETS: tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _escape(value: str) -> str:
+    """Экранирует значение метки.
+
+    :param value: исходное значение.
+    :return: значение с экранированными \\, " и переводами строк.
+    """
+
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    """Формирует блок меток в формате Prometheus.
+
+    :param names: имена меток.
+    :param values: значения меток.
+    :param extra: дополнительная метка (например, le="0.1").
+    :return: строка вида {a="1",b="2"} или пустая строка.
+    """
+
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    """Форматирует число для текстового формата Prometheus.
+
+    :param value: значение.
+    :return: строковое представление.
+    """
+
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+@dataclass
+class _HistogramState:
+    """Накопленные значения гистограммы для одного набора меток."""
+
+    counts: list[int]
+    total: float = 0.0
+    count: int = 0
+
+
+@dataclass
+class Histogram:
+    """Гистограмма с фиксированными границами корзин.
+
+    :param name: имя метрики.
+    :param help: описание.
+    :param labels: имена меток.
+    :param buckets: верхние границы корзин (по возрастанию).
+    """
+
+    name: str
+    help: str
+    labels: tuple[str, ...] = ()
+    buckets: tuple[float, ...] = LATENCY_BUCKETS
+    _series: dict[tuple[str, ...], _HistogramState] = field(default_factory=dict)
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """Добавляет наблюдение.
+
+        :param value: значение (секунды, штуки и т.п.).
+        :param label_values: значения меток в порядке labels.
+        :return: None.
+        """
+
+        state = self._series.get(label_values)
+        if state is None:
+            state = _HistogramState(counts=[0] * len(self.buckets))
+            self._series[label_values] = state
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            state.counts[index] += 1
+        state.total += value
+        state.count += 1
+
+    def render(self) -> Iterable[str]:
+        """Выдаёт строки метрики в текстовом формате Prometheus.
+
+        :return: итератор строк.
+        """
+
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for label_values, state in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, state.counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, label_values, f'le="{_format_value(bound)}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labels, label_values, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {state.count}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {_format_value(state.total)}"
+            yield f"{self.name}_count{labels} {state.count}"
+
+
+@dataclass
+class Counter:
+    """Монотонно растущий счётчик.
+
+    :param name: имя метрики.
+    :param help: описание.
+    :param labels: имена меток.
+    """
+
+    name: str
+    help: str
+    labels: tuple[str, ...] = ()
+    _series: dict[tuple[str, ...], float] = field(default_factory=dict)
+
+    def inc(self, amount: float = 1.0, *label_values: str) -> None:
+        """Увеличивает счётчик.
+
+        :param amount: приращение (>= 0).
+        :param label_values: значения меток.
+        :return: None.
+        """
+
+        self._series[label_values] = self._series.get(label_values, 0.0) + amount
+
+    def value(self, *label_values: str) -> float:
+        """Текущее значение серии.
+
+        :param label_values: значения меток.
+        :return: значение (0, если серии ещё нет).
+        """
+
+        return self._series.get(label_values, 0.0)
+
+    def render(self) -> Iterable[str]:
+        """Выдаёт строки метрики в текстовом формате Prometheus.
+
+        :return: итератор строк.
+        """
+
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in sorted(self._series.items()):
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+@dataclass
+class Gauge:
+    """Мгновенное значение.
+
+    :param name: имя метрики.
+    :param help: описание.
+    :param labels: имена меток.
+    """
+
+    name: str
+    help: str
+    labels: tuple[str, ...] = ()
+    _series: dict[tuple[str, ...], float] = field(default_factory=dict)
+
+    def set(self, value: float, *label_values: str) -> None:
+        """Устанавливает значение.
+
+        :param value: новое значение.
+        :param label_values: значения меток.
+        :return: None.
+        """
+
+        self._series[label_values] = value
+
+    def render(self) -> Iterable[str]:
+        """Выдаёт строки метрики в текстовом формате Prometheus.
+
+        :return: итератор строк.
+        """
+
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for label_values, value in sorted(self._series.items()):
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class MetricsRegistry:
+    """Набор метрик процесса с выгрузкой в формате Prometheus."""
+
+    def __init__(self) -> None:
+        """Инициализация пустого реестра."""
+
+        self._metrics: dict[str, Histogram | Counter | Gauge] = {}
+
+    def _register(self, metric):
+        """Регистрирует метрику или возвращает уже существующую с тем же именем.
+
+        :param metric: новая метрика.
+        :return: зарегистрированная метрика.
+        """
+
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        """Возвращает гистограмму, создавая её при первом обращении.
+
+        :param name: имя метрики.
+        :param help: описание.
+        :param labels: имена меток.
+        :param buckets: границы корзин.
+        :return: Histogram.
+        """
+
+        return self._register(Histogram(name, help, tuple(labels), tuple(buckets)))
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        """Возвращает счётчик, создавая его при первом обращении.
+
+        :param name: имя метрики.
+        :param help: описание.
+        :param labels: имена меток.
+        :return: Counter.
+        """
+
+        return self._register(Counter(name, help, tuple(labels)))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        """Возвращает gauge, создавая его при первом обращении.
+
+        :param name: имя метрики.
+        :param help: описание.
+        :param labels: имена меток.
+        :return: Gauge.
+        """
+
+        return self._register(Gauge(name, help, tuple(labels)))
+
+    def render(self) -> str:
+        """Собирает все метрики в текст для /metrics.
+
+        :return: текст в формате Prometheus exposition.
+        """
+
+        lines: list[str] = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class StartupTimer:
+    """Меряет фазы старта процесса и печатает сводку."""
+
+    def __init__(self, started: float | None = None):
+        """Инициализация.
+
+        :param started: момент старта по time.perf_counter() (по умолчанию — сейчас).
+        """
+
+        self.started = started if started is not None else time.perf_counter()
+        self.phases: dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Меряет одну фазу.
+
+        :param name: имя фазы.
+        :return: контекстный менеджер.
+        """
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def report(self) -> str:
+        """Логирует сводку и публикует её как метрики.
+
+        :return: строка сводки.
+        """
+
+        total = time.perf_counter() - self.started
+        phase_gauge = registry.gauge(
+            "bot_startup_phase_seconds", "Длительность фаз старта процесса.", labels=("phase",)
+        )
+        for name, seconds in self.phases.items():
+            phase_gauge.set(seconds, name)
+        phase_gauge.set(total, "total")
+        summary = ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.phases.items())
+        line = f"Startup in {total * 1000:.0f}ms: {summary}"
+        logger.info(line)
+        return line
+
+
+async def monitor_loop_lag(interval: float = 0.5) -> None:
+    """Измеряет задержку event loop: насколько позже запланированного просыпается sleep.
+
+    :param interval: период измерения в секундах.
+    :return: None.
+    """
+
+    lag_histogram = registry.histogram(
+        "bot_event_loop_lag_seconds",
+        "Задержка пробуждения event loop относительно запланированного.",
+        buckets=LOOP_LAG_BUCKETS,
+    )
+    lag_gauge = registry.gauge("bot_event_loop_lag_last_seconds", "Последняя измеренная задержка event loop.")
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        lag_histogram.observe(lag)
+        lag_gauge.set(lag)
+
+
+async def _handle_metrics_request(
+    reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+) -> None:
+    """Отвечает на HTTP-запрос: GET /metrics отдаёт реестр, остальное — 404.
+
+    :param reader: поток чтения.
+    :param writer: поток записи.
+    :return: None.
+    """
+
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout=5)
+            if not line or line in (b"\r\n", b"\n"):
+                break
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", registry.render().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            (
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n"
+            ).encode()
+            + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve_metrics(host: str, port: int) -> None:
+    """Поднимает минимальный HTTP-сервер с эндпоинтом /metrics.
+
+    :param host: адрес для прослушивания.
+    :param port: порт.
+    :return: None.
+    """
+
+    server = await asyncio.start_server(_handle_metrics_request, host, port)
+    logger.info("Metrics endpoint listening on %s:%s/metrics", host, port)
+    async with server:
+        await server.serve_forever()
+
+
+async def dump_metrics(path: str, interval: float) -> None:
+    """Периодически сохраняет метрики в файл (атомарной заменой).
+
+    :param path: путь к файлу.
+    :param interval: период записи в секундах.
+    :return: None.
+    """
+
+    target = Path(path)
+    tmp = target.with_suffix(target.suffix + ".tmp")
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            tmp.write_text(registry.render(), encoding="utf-8")
+            os.replace(tmp, target)
+        except OSError as exc:
+            logger.warning("Failed to dump metrics to %s: %s", path, exc)
+
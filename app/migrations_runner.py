@@ -1,12 +1,20 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+import re
 from pathlib import Path
 
-from alembic import command
-from alembic.config import Config
-
 from app.config import Settings
 
+logger = logging.getLogger(__name__)
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+VERSIONS_DIR = PROJECT_ROOT / "alembic" / "versions"
+
+_REVISION_RE = re.compile(r"^revision\s*=\s*['\"]([^'\"]+)['\"]", re.MULTILINE)
+_DOWN_REVISION_RE = re.compile(r"^down_revision\s*=\s*(.+)$", re.MULTILINE)
+
 
 def run_migrations(settings: Settings) -> None:
     """Выполняет alembic upgrade head.
@@ -15,7 +23,67 @@ def run_migrations(settings: Settings) -> None:
     :return: None.
     """
 
-    config_path = Path(__file__).resolve().parent.parent / "alembic.ini"
+    from alembic import command
+    from alembic.config import Config
+
+    config_path = PROJECT_ROOT / "alembic.ini"
     alembic_cfg = Config(str(config_path))
     alembic_cfg.set_main_option("sqlalchemy.url", settings.database_url)
     command.upgrade(alembic_cfg, "head")
+
+
+def packaged_head(versions_dir: Path = VERSIONS_DIR) -> str | None:
+    """Находит head-ревизию по файлам миграций, не загружая Alembic.
+
+    :param versions_dir: каталог alembic/versions.
+    :return: ревизия или None, если head не единственный/не найден.
+    """
+
+    revisions: set[str] = set()
+    parents: set[str] = set()
+    for path in versions_dir.glob("*.py"):
+        source = path.read_text(encoding="utf-8")
+        revision = _REVISION_RE.search(source)
+        if revision is None:
+            continue
+        revisions.add(revision.group(1))
+        down = _DOWN_REVISION_RE.search(source)
+        if down is not None:
+            parents.update(re.findall(r"['\"]([^'\"]+)['\"]", down.group(1)))
+    heads = revisions - parents
+    return heads.pop() if len(heads) == 1 else None
+
+
+async def current_revision(engine) -> str | None:
+    """Читает ревизию схемы одним запросом к alembic_version.
+
+    :param engine: асинхронный движок приложения.
+    :return: ревизия или None, если таблицы ещё нет.
+    """
+
+    from sqlalchemy import text
+    from sqlalchemy.exc import DBAPIError
+
+    try:
+        async with engine.connect() as conn:
+            result = await conn.execute(text("SELECT version_num FROM alembic_version"))
+            return result.scalar_one_or_none()
+    except DBAPIError:
+        return None
+
+
+async def ensure_schema(engine, settings: Settings) -> bool:
+    """Запускает Alembic только если схема отстаёт от упакованной head-ревизии.
+
+    :param engine: асинхронный движок приложения.
+    :param settings: конфигурация приложения.
+    :return: True, если понадобился upgrade.
+    """
+
+    head = packaged_head()
+    if head is not None and await current_revision(engine) == head:
+        logger.debug("Schema is at head %s, skipping Alembic", head)
+        return False
+    logger.info("Schema is behind head %s, running Alembic upgrade", head or "?")
+    await asyncio.to_thread(run_migrations, settings)
+    return True
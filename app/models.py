@@ -3,8 +3,8 @@ from __future__ import annotations
 import datetime as dt
 import uuid
 
-from sqlalchemy import BigInteger, Boolean, DateTime, ForeignKey, Integer, String, Text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import BigInteger, Boolean, DateTime, ForeignKey, Index, Integer, SmallInteger, String, Text, Uuid, func
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -23,6 +23,31 @@ def utcnow() -> dt.datetime:
     return dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc)
 
 
+class UTCDateTime(TypeDecorator):
+    """DateTime(timezone=True), всегда возвращающий aware-значения в UTC.
+
+    Postgres отдаёт timestamptz с tzinfo, а SQLite — «наивные» значения; без
+    нормализации сравнения с utcnow() падают.
+    """
+
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        """Приводит значение к UTC перед записью."""
+
+        if value is not None and value.tzinfo is not None:
+            return value.astimezone(dt.timezone.utc)
+        return value
+
+    def process_result_value(self, value, dialect):
+        """Добавляет tzinfo=UTC к наивным значениям."""
+
+        if value is not None and value.tzinfo is None:
+            return value.replace(tzinfo=dt.timezone.utc)
+        return value
+
+
 class User(Base):
     """Пользователь Telegram."""
 
@@ -33,33 +58,58 @@ class User(Base):
     username: Mapped[str | None] = mapped_column(String(255))
     is_admin: Mapped[bool] = mapped_column(Boolean, default=False)
     balance: Mapped[int] = mapped_column(Integer, default=0)
-    created_at: Mapped[dt.datetime] = mapped_column(
-        DateTime(timezone=True), default=utcnow
-    )
+    active_key_count: Mapped[int] = mapped_column(Integer, default=0)
+    blocked_at: Mapped[dt.datetime | None] = mapped_column(UTCDateTime())
+    created_at: Mapped[dt.datetime] = mapped_column(UTCDateTime(), default=utcnow)
 
     keys: Mapped[list["VpnKey"]] = relationship(back_populates="user")
 
 
+# Поиск по началу username без учёта регистра; text_pattern_ops нужен Postgres для LIKE 'abc%'.
+Index(
+    "ix_users_username_lower",
+    func.lower(User.username).label("username_lower"),
+    postgresql_ops={"username_lower": "text_pattern_ops"},
+)
+
+
+class Server(Base):
+    """WireGuard-сервер (интерфейс) из пула для размещения пиров."""
+
+    __tablename__ = "servers"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(String(64), unique=True)
+    endpoint: Mapped[str] = mapped_column(String(255))
+    public_key: Mapped[str] = mapped_column(String(512))
+    address_cidr: Mapped[str] = mapped_column(String(64))
+    interface: Mapped[str] = mapped_column(String(32), default="wg0")
+    capacity: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    is_active: Mapped[bool] = mapped_column(Boolean, default=True)
+    created_at: Mapped[dt.datetime] = mapped_column(UTCDateTime(), default=utcnow)
+
+
 class VpnKey(Base):
     """Временный VPN-ключ (WireGuard-пир)."""
 
     __tablename__ = "vpn_keys"
 
     id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
+        Uuid(), primary_key=True, default=uuid.uuid4
     )
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+    server_id: Mapped[int | None] = mapped_column(ForeignKey("servers.id"), index=True, nullable=True)
     name: Mapped[str] = mapped_column(String(120))
     public_key: Mapped[str | None] = mapped_column(String(512))
-    client_address: Mapped[str | None] = mapped_column(String(64))
+    client_address: Mapped[str | None] = mapped_column(String(64), index=True)
     preshared_key: Mapped[str | None] = mapped_column(String(128))
-    expires_at: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), index=True)
-    created_at: Mapped[dt.datetime] = mapped_column(
-        DateTime(timezone=True), default=utcnow
-    )
-    revoked_at: Mapped[dt.datetime | None] = mapped_column(DateTime(timezone=True))
+    expires_at: Mapped[dt.datetime] = mapped_column(UTCDateTime(), index=True)
+    created_at: Mapped[dt.datetime] = mapped_column(UTCDateTime(), default=utcnow)
+    revoked_at: Mapped[dt.datetime | None] = mapped_column(UTCDateTime())
+    last_handshake_at: Mapped[dt.datetime | None] = mapped_column(UTCDateTime(), index=True)
+    notified_at: Mapped[dt.datetime | None] = mapped_column(UTCDateTime())
     rotated_from_id: Mapped[uuid.UUID | None] = mapped_column(
-        UUID(as_uuid=True), ForeignKey("vpn_keys.id"), nullable=True
+        Uuid(), ForeignKey("vpn_keys.id"), nullable=True
     )
 
     user: Mapped["User"] = relationship(back_populates="keys")
@@ -76,21 +126,87 @@ class VpnKey(Base):
         return self.revoked_at is None and self.expires_at > now
 
 
+class KeyUsage(Base):
+    """Трафик ключа за интервал (минутные и часовые агрегаты).
+
+    :param resolution: длина интервала в секундах (60 или 3600).
+    :param bucket_start: начало интервала (UTC).
+    """
+
+    __tablename__ = "key_usage"
+
+    key_id: Mapped[uuid.UUID] = mapped_column(Uuid(), ForeignKey("vpn_keys.id"), primary_key=True)
+    resolution: Mapped[int] = mapped_column(SmallInteger, primary_key=True)
+    bucket_start: Mapped[dt.datetime] = mapped_column(UTCDateTime(), primary_key=True)
+    rx_bytes: Mapped[int] = mapped_column(BigInteger, default=0)
+    tx_bytes: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
+class RotationJob(Base):
+    """Проход плановой ротации ключей; курсор позволяет продолжить после рестарта.
+
+    :param created_before: ротируются ключи, созданные раньше этого момента.
+    :param cursor: id последнего обработанного ключа (keyset-итерация).
+    :param total: сколько ключей было к ротации на старте прохода.
+    """
+
+    __tablename__ = "rotation_jobs"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    created_before: Mapped[dt.datetime] = mapped_column(UTCDateTime())
+    cursor: Mapped[uuid.UUID | None] = mapped_column(Uuid(), nullable=True)
+    total: Mapped[int] = mapped_column(Integer, default=0)
+    rotated: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    started_at: Mapped[dt.datetime] = mapped_column(UTCDateTime(), default=utcnow)
+    finished_at: Mapped[dt.datetime | None] = mapped_column(UTCDateTime(), nullable=True)
+
+
+class Broadcast(Base):
+    """Рассылка админа всем пользователям; cursor — последний обработанный users.id.
+
+    :param status: draft, running, paused, done или cancelled.
+    """
+
+    __tablename__ = "broadcasts"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+    text: Mapped[str] = mapped_column(Text)
+    created_by: Mapped[int] = mapped_column(BigInteger)
+    status: Mapped[str] = mapped_column(String(16), default="draft")
+    cursor: Mapped[int] = mapped_column(Integer, default=0)
+    sent: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    blocked: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[dt.datetime] = mapped_column(UTCDateTime(), default=utcnow)
+    finished_at: Mapped[dt.datetime | None] = mapped_column(UTCDateTime(), nullable=True)
+
+
+class DashboardCounter(Base):
+    """Счётчик сводки админ-панели; меняется инкрементально и периодически сверяется с таблицами.
+
+    :param name: имя счётчика (см. CounterRepository).
+    """
+
+    __tablename__ = "dashboard_counters"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    value: Mapped[int] = mapped_column(BigInteger, default=0)
+
+
 class BillingEvent(Base):
     """Фиксация биллинговых операций."""
 
     __tablename__ = "billing_events"
 
     id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
+        Uuid(), primary_key=True, default=uuid.uuid4
     )
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     amount: Mapped[int] = mapped_column(Integer)
     event_type: Mapped[str] = mapped_column(String(64))
     description: Mapped[str | None] = mapped_column(Text)
-    created_at: Mapped[dt.datetime] = mapped_column(
-        DateTime(timezone=True), default=utcnow
-    )
+    created_at: Mapped[dt.datetime] = mapped_column(UTCDateTime(), default=utcnow)
 
 
 class Alert(Base):
@@ -99,11 +215,9 @@ class Alert(Base):
     __tablename__ = "alerts"
 
     id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
+        Uuid(), primary_key=True, default=uuid.uuid4
     )
     user_id: Mapped[int | None] = mapped_column(ForeignKey("users.id"))
     level: Mapped[str] = mapped_column(String(32))
     message: Mapped[str] = mapped_column(Text)
-    created_at: Mapped[dt.datetime] = mapped_column(
-        DateTime(timezone=True), default=utcnow
-    )
+    created_at: Mapped[dt.datetime] = mapped_column(UTCDateTime(), default=utcnow)
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter
+
+MAX_PROFILE_SECONDS = 60.0
+MIN_SAMPLE_INTERVAL = 0.005
+MAX_STACK_DEPTH = 64
+MAX_DISTINCT_STACKS = 20_000
+
+
+class ProfilerBusyError(RuntimeError):
+    """Профилирование уже запущено."""
+
+
+class StackSampler:
+    """Сэмплирующий профайлер на stdlib: периодически снимает стеки всех потоков.
+
+    Накладные расходы ограничены частотой (не чаще MIN_SAMPLE_INTERVAL),
+    глубиной стека и числом уникальных стеков; длительность — MAX_PROFILE_SECONDS.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, interval: float = 0.01):
+        """Инициализация.
+
+        :param interval: период сэмплирования в секундах.
+        """
+
+        self.interval = max(interval, MIN_SAMPLE_INTERVAL)
+        self.samples: Counter[str] = Counter()
+        self.dropped = 0
+
+    def _collapse(self, frame) -> str:
+        """Сворачивает стек в строку формата flamegraph (корень;...;лист).
+
+        :param frame: верхний кадр потока.
+        :return: свёрнутый стек.
+        """
+
+        parts: list[str] = []
+        while frame is not None and len(parts) < MAX_STACK_DEPTH:
+            code = frame.f_code
+            parts.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ";".join(reversed(parts))
+
+    def run(self, duration: float) -> Counter[str]:
+        """Сэмплирует процесс в текущем потоке заданное время.
+
+        :param duration: длительность в секундах (обрезается до MAX_PROFILE_SECONDS).
+        :return: счётчик свёрнутых стеков.
+        :raises ProfilerBusyError: если профилирование уже идёт.
+        """
+
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusyError("Профилирование уже запущено")
+        try:
+            own_id = threading.get_ident()
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            deadline = time.monotonic() + min(max(duration, 0.0), MAX_PROFILE_SECONDS)
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    if thread_id not in thread_names:
+                        thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+                    stack = f"{thread_names.get(thread_id, thread_id)};{self._collapse(frame)}"
+                    if stack in self.samples or len(self.samples) < MAX_DISTINCT_STACKS:
+                        self.samples[stack] += 1
+                    else:
+                        self.dropped += 1
+                time.sleep(self.interval)
+            return self.samples
+        finally:
+            self._lock.release()
+
+    def render(self) -> bytes:
+        """Выгружает результат в collapsed-stack формате (для flamegraph.pl/speedscope).
+
+        :return: содержимое файла.
+        """
+
+        lines = [f"{stack} {count}" for stack, count in self.samples.most_common()]
+        if self.dropped:
+            lines.append(f"[dropped] {self.dropped}")
+        return ("\n".join(lines) + "\n").encode()
+
+
+async def profile_process(duration: float, interval: float = 0.01) -> bytes:
+    """Снимает профиль работающего процесса, не блокируя event loop.
+
+    :param duration: длительность в секундах.
+    :param interval: период сэмплирования.
+    :return: collapsed-stack файл.
+    :raises ProfilerBusyError: если профилирование уже идёт.
+    """
+
+    sampler = StackSampler(interval=interval)
+    await asyncio.to_thread(sampler.run, duration)
+    return sampler.render()
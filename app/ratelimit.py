@@ -0,0 +1,131 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Hashable
+
+
+class TokenBucket:
+    """Классический token bucket: rate токенов в секунду, не больше capacity."""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        """Инициализация (ведро создаётся полным).
+
+        :param rate: скорость пополнения, токенов/с.
+        :param capacity: ёмкость (допустимый всплеск).
+        """
+
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        """Добавляет накопившиеся токены.
+
+        :param now: текущее время по time.monotonic().
+        :return: None.
+        """
+
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Забирает токены, если они есть.
+
+        :param tokens: сколько токенов нужно.
+        :return: True, если токены списаны.
+        """
+
+        self._refill(time.monotonic())
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    def delay(self, tokens: float = 1.0) -> float:
+        """Сколько ждать, пока накопится нужное число токенов.
+
+        :param tokens: сколько токенов нужно.
+        :return: секунды (0, если уже доступно; inf при нулевой скорости).
+        """
+
+        self._refill(time.monotonic())
+        missing = tokens - self.tokens
+        if missing <= 0:
+            return 0.0
+        return missing / self.rate if self.rate > 0 else float("inf")
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Ждёт и забирает токены.
+
+        :param tokens: сколько токенов нужно.
+        :return: None.
+        """
+
+        while not self.try_acquire(tokens):
+            await asyncio.sleep(self.delay(tokens))
+
+
+class BucketTable:
+    """Набор token bucket'ов с общими rate/capacity, по одному на ключ (пользователь, чат).
+
+    Ведро хранится как пара (токены, время обновления) без отдельного объекта.
+    Ведро, простоявшее дольше времени полного пополнения, эквивалентно новому,
+    поэтому такие записи периодически выбрасываются.
+    """
+
+    __slots__ = ("rate", "capacity", "idle_seconds", "_buckets", "_next_sweep")
+
+    def __init__(self, rate: float, capacity: float):
+        """Инициализация.
+
+        :param rate: скорость пополнения, токенов/с.
+        :param capacity: ёмкость ведра.
+        """
+
+        self.rate = rate
+        self.capacity = capacity
+        self.idle_seconds = capacity / rate if rate > 0 else float("inf")
+        self._buckets: dict[Hashable, tuple[float, float]] = {}
+        self._next_sweep = time.monotonic() + max(self.idle_seconds, 1.0)
+
+    def __len__(self) -> int:
+        """Число хранимых вёдер."""
+
+        return len(self._buckets)
+
+    def take(self, key: Hashable, tokens: float = 1.0) -> float:
+        """Пытается списать токены из ведра ключа.
+
+        :param key: ключ ведра.
+        :param tokens: сколько токенов нужно.
+        :return: 0, если токены списаны, иначе сколько секунд ждать.
+        """
+
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+        available, updated = self._buckets.get(key, (self.capacity, now))
+        available = min(self.capacity, available + (now - updated) * self.rate)
+        if available >= tokens:
+            self._buckets[key] = (available - tokens, now)
+            return 0.0
+        self._buckets[key] = (available, now)
+        return (tokens - available) / self.rate if self.rate > 0 else float("inf")
+
+    def _sweep(self, now: float) -> None:
+        """Выбрасывает вёдра, которые успели пополниться до краёв.
+
+        :param now: текущее время по time.monotonic().
+        :return: None.
+        """
+
+        horizon = now - self.idle_seconds
+        idle = [key for key, (_, updated) in self._buckets.items() if updated <= horizon]
+        for key in idle:
+            del self._buckets[key]
+        self._next_sweep = now + max(self.idle_seconds, 1.0)
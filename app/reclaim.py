@@ -0,0 +1,171 @@
+"""Отзыв простаивающих ключей: освобождает адреса и слоты пиров.
+
+Ключ без handshake дольше IDLE_RECLAIM_DAYS (или ни разу не подключавшийся
+столько же дней с момента создания) отзывается, владелец получает уведомление
+через очередь исходящих сообщений. Данные о handshake даёт app.stats, поэтому
+без сборщика статистики отзыв не запускается.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import logging
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+
+from app.config import Settings
+from app.metrics import registry
+from app.repositories import AlertRepository, VpnKeyRepository
+
+logger = logging.getLogger(__name__)
+
+IDLE_NOTICE = (
+    "Ключи, к которым не подключались {days} дн., отозваны, чтобы освободить адреса: {names}.\n"
+    "Если устройство снова понадобится — создайте новый ключ в меню «Мои ключи»."
+)
+
+
+@dataclass(frozen=True)
+class ReclaimPolicy:
+    """Правила отзыва простаивающих ключей.
+
+    :param idle_days: сколько дней без handshake ключ считается брошенным (0 — отзыв выключен).
+    :param batch_size: ключей за одну транзакцию.
+    """
+
+    idle_days: int
+    batch_size: int = 100
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "ReclaimPolicy":
+        """Политика из конфигурации.
+
+        :param settings: конфигурация приложения.
+        :return: ReclaimPolicy.
+        """
+
+        return cls(idle_days=settings.idle_reclaim_days, batch_size=max(settings.idle_reclaim_batch, 1))
+
+    @property
+    def enabled(self) -> bool:
+        """Включён ли отзыв."""
+
+        return self.idle_days > 0
+
+    def idle_before(self, now: dt.datetime) -> dt.datetime:
+        """Граница простоя.
+
+        :param now: текущее время (UTC).
+        :return: ключи без handshake после этого момента — кандидаты на отзыв.
+        """
+
+        return now - dt.timedelta(days=self.idle_days)
+
+
+class IdleKeyReclaimer:
+    """Пачками отзывает простаивающие ключи и уведомляет владельцев."""
+
+    def __init__(self, settings: Settings, session_maker, bot=None, outbound=None):
+        """Инициализация.
+
+        :param settings: конфигурация приложения.
+        :param session_maker: фабрика сессий primary.
+        :param bot: aiogram Bot для уведомлений (None — без уведомлений).
+        :param outbound: очередь исходящих сообщений.
+        """
+
+        self.settings = settings
+        self.session_maker = session_maker
+        self.bot = bot
+        self.outbound = outbound
+        self.policy = ReclaimPolicy.from_settings(settings)
+        self.reclaimed = registry.counter("bot_idle_keys_reclaimed_total", "Отозванные простаивающие ключи.")
+
+    async def _stats_are_fresh(self, idle_before: dt.datetime) -> bool:
+        """Проверяет, что статистика handshake вообще собирается.
+
+        Если свежих handshake нет ни у одного ключа, скорее всего сломан сбор
+        статистики, а не все пользователи разом перестали подключаться.
+        """
+
+        async with self.session_maker() as session:
+            latest = await VpnKeyRepository(session).latest_handshake()
+        return latest is not None and latest >= idle_before
+
+    async def run_once(self, now: dt.datetime | None = None) -> int:
+        """Отзывает все простаивающие ключи, по batch_size за транзакцию.
+
+        :param now: текущее время (UTC).
+        :return: число отозванных ключей.
+        """
+
+        if not self.policy.enabled:
+            return 0
+        now = now or dt.datetime.now(dt.timezone.utc)
+        idle_before = self.policy.idle_before(now)
+        if not await self._stats_are_fresh(idle_before):
+            logger.warning("Idle reclaim skipped: no recent handshakes recorded, check peer stats collection")
+            return 0
+
+        reclaimed: list[tuple[uuid.UUID, str, int]] = []
+        while True:
+            async with self.session_maker() as session:
+                repo = VpnKeyRepository(session)
+                candidates = await repo.find_idle(idle_before, self.policy.batch_size)
+                if not candidates:
+                    break
+                revoked = await repo.revoke_many(key_id for key_id, _, _ in candidates)
+                if revoked:
+                    await AlertRepository(session).add(
+                        level="info",
+                        message=f"Отозваны простаивающие ключи ({self.policy.idle_days} дн. без подключений): {len(revoked)} шт.",
+                        user_id=None,
+                    )
+                await session.commit()
+            self.reclaimed.inc(len(revoked))
+            reclaimed.extend(row for row in candidates if row[0] in revoked)
+            if len(candidates) < self.policy.batch_size:
+                break
+        await self._notify(reclaimed)
+        return len(reclaimed)
+
+    async def _notify(self, rows: list[tuple[uuid.UUID, str, int]]) -> None:
+        """Одно уведомление на владельца со списком его отозванных ключей."""
+
+        if self.bot is None or self.outbound is None or not rows:
+            return
+        names: dict[int, list[str]] = defaultdict(list)
+        for _, name, telegram_id in rows:
+            names[telegram_id].append(name)
+        results = await asyncio.gather(
+            *(
+                self.outbound.send_message(
+                    self.bot, telegram_id, IDLE_NOTICE.format(days=self.policy.idle_days, names=", ".join(key_names))
+                )
+                for telegram_id, key_names in names.items()
+            ),
+            return_exceptions=True,
+        )
+        for telegram_id, result in zip(names, results):
+            if isinstance(result, Exception):
+                # Пользователь мог заблокировать бота — ключи всё равно отозваны.
+                logger.warning("Idle reclaim notice to %s failed: %s", telegram_id, result)
+
+    async def run(self, interval: int) -> None:
+        """Бесконечный цикл отзыва.
+
+        :param interval: пауза между проходами, секунды.
+        :return: None.
+        """
+
+        while True:
+            try:
+                count = await self.run_once()
+                if count:
+                    logger.info("Idle reclaim: revoked %s keys", count)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.exception("Idle reclaim failed: %s", exc)
+            await asyncio.sleep(interval)
+
@@ -0,0 +1,136 @@
+"""Напоминания об истечении ключей.
+
+Раз в CLEANUP_INTERVAL_MINUTES выбираются ключи, истекающие в ближайшие
+EXPIRY_REMINDER_HOURS (по индексу expires_at, пачками по EXPIRY_REMINDER_BATCH).
+Каждый ключ помечается notified_at и напоминается один раз; владелец получает
+одно сообщение со всеми своими ключами пачки и кнопками продления. Пачка
+рассылается сразу после захвата, так что в полёте не больше одной пачки;
+отметка с недоставленных напоминаний снимается, и следующий проход их повторит
+(кроме заблокировавших бота).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import logging
+import uuid
+from collections import defaultdict
+
+from aiogram.exceptions import TelegramForbiddenError
+
+from app.bot.keyboards import renew_keyboard
+from app.config import Settings
+from app.metrics import registry
+from app.repositories import VpnKeyRepository
+
+logger = logging.getLogger(__name__)
+
+MAX_RENEW_BUTTONS = 10
+
+# (id ключа, имя, expires_at)
+Reminder = tuple[uuid.UUID, str, dt.datetime]
+
+
+class ExpiryNotifier:
+    """Рассылает напоминания о скором истечении ключей."""
+
+    def __init__(self, settings: Settings, session_maker, bot=None, outbound=None):
+        """Инициализация.
+
+        :param settings: конфигурация приложения.
+        :param session_maker: фабрика сессий primary.
+        :param bot: aiogram Bot (None — только отметка без отправки).
+        :param outbound: очередь исходящих сообщений.
+        """
+
+        self.settings = settings
+        self.session_maker = session_maker
+        self.bot = bot
+        self.outbound = outbound
+        self.batch_size = max(settings.expiry_reminder_batch, 1)
+        self.sent = registry.counter("bot_expiry_reminders_total", "Напоминания об истечении ключей (по ключам).")
+
+    async def run_once(self, now: dt.datetime | None = None) -> int:
+        """Забирает ключи из окна напоминаний пачками и рассылает каждую пачку сразу.
+
+        :param now: текущее время (UTC).
+        :return: число ключей, о которых напомнили.
+        """
+
+        window = dt.timedelta(hours=self.settings.expiry_reminder_hours)
+        if window <= dt.timedelta(0):
+            return 0
+        now = now or dt.datetime.now(dt.timezone.utc)
+        reminded = 0
+        undelivered: list[uuid.UUID] = []
+        try:
+            while True:
+                async with self.session_maker() as session:
+                    rows = await VpnKeyRepository(session).claim_expiring(
+                        until=now + window, created_before=now - window, limit=self.batch_size
+                    )
+                    await session.commit()
+                by_user: dict[int, list[Reminder]] = defaultdict(list)
+                for key_id, name, expires_at, telegram_id in rows:
+                    by_user[telegram_id].append((key_id, name, expires_at))
+                delivered, failed = await self._send(by_user)
+                self.sent.inc(delivered)
+                reminded += delivered
+                undelivered.extend(failed)
+                if len(rows) < self.batch_size:
+                    break
+        finally:
+            # Отметка снимается после прохода, чтобы этот же проход не забрал ключи снова.
+            if undelivered:
+                async with self.session_maker() as session:
+                    await VpnKeyRepository(session).release_expiring(undelivered)
+                    await session.commit()
+        return reminded
+
+    async def _send(self, by_user: dict[int, list[Reminder]]) -> tuple[int, list[uuid.UUID]]:
+        """Одно сообщение на пользователя через очередь исходящих (флуд-лимиты учитывает она).
+
+        Без бота ключи только отмечаются и считаются напомненными.
+
+        :param by_user: telegram_id -> ключи пачки.
+        :return: (число ключей в доставленных сообщениях, id ключей для повтора).
+        """
+
+        if self.bot is None or self.outbound is None or not by_user:
+            return sum(len(keys) for keys in by_user.values()), []
+
+        async def send(telegram_id: int, keys: list[Reminder]) -> tuple[int, list[uuid.UUID]]:
+            lines = ["⏳ Скоро истекают ключи:"]
+            lines.extend(f"• {name} — до {expires_at:%Y-%m-%d %H:%M UTC}" for _, name, expires_at in keys)
+            lines.append("Продлите ключ кнопкой ниже, иначе VPN на устройстве перестанет работать.")
+            markup = renew_keyboard([(key_id, name) for key_id, name, _ in keys[:MAX_RENEW_BUTTONS]])
+            try:
+                await self.outbound.send_message(self.bot, telegram_id, "\n".join(lines), reply_markup=markup)
+            except TelegramForbiddenError:
+                # Бот заблокирован: повтор бесполезен, ключ остаётся отмеченным.
+                logger.info("Expiry reminder to %s skipped: bot blocked", telegram_id)
+                return 0, []
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.warning("Expiry reminder to %s failed: %s", telegram_id, exc)
+                return 0, [key_id for key_id, _, _ in keys]
+            return len(keys), []
+
+        results = await asyncio.gather(*(send(telegram_id, keys) for telegram_id, keys in by_user.items()))
+        return sum(delivered for delivered, _ in results), [key_id for _, failed in results for key_id in failed]
+
+    async def run(self, interval: int) -> None:
+        """Бесконечный цикл напоминаний.
+
+        :param interval: пауза между проходами, секунды.
+        :return: None.
+        """
+
+        while True:
+            try:
+                count = await self.run_once()
+                if count:
+                    logger.info("Expiry reminders: %s keys", count)
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.exception("Expiry notifier failed: %s", exc)
+            await asyncio.sleep(interval)
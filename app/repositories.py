@@ -2,12 +2,178 @@ from __future__ import annotations
 
 import datetime as dt
 import uuid
-from typing import Iterable, Sequence
+from collections import Counter
+from typing import Iterable, Mapping, Sequence
 
-from sqlalchemy import select
+from sqlalchemy import and_, bindparam, delete, event, func, lambda_stmt, or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.lambdas import StatementLambdaElement
 
-from app.models import Alert, BillingEvent, User, VpnKey
+from app.db import invalidate
+from app.models import (
+    Alert,
+    BillingEvent,
+    Broadcast,
+    DashboardCounter,
+    KeyUsage,
+    RotationJob,
+    Server,
+    User,
+    VpnKey,
+)
+from app.search import KeyQuery
+
+COUNTER_DELTAS = "dashboard_counter_deltas"
+
+
+def _insert_for(dialect: str):
+    """Конструктор insert диалекта с ON CONFLICT.
+
+    :param dialect: имя диалекта.
+    :return: функция insert(table) диалекта.
+    :raises NotImplementedError: для диалектов без ON CONFLICT.
+    """
+
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise NotImplementedError(f"ON CONFLICT не поддержан для {dialect}")
+    return insert
+
+
+def dialect_insert(session: AsyncSession, table):
+    """INSERT с поддержкой ON CONFLICT для диалекта сессии (Postgres/SQLite).
+
+    :param session: активная AsyncSession.
+    :param table: модель или таблица.
+    :return: конструкция insert с методом on_conflict_do_update.
+    :raises NotImplementedError: для диалектов без ON CONFLICT.
+    """
+
+    return _insert_for(session.bind.dialect.name)(table)
+
+
+def cached_upsert(session: AsyncSession | Session, build) -> StatementLambdaElement:
+    """INSERT ... ON CONFLICT горячего пути, собранный один раз и попадающий в кэш компиляции.
+
+    У insert диалектов Postgres/SQLite (SQLAlchemy 2.0.27) нет ключа кэша, и такой
+    оператор компилируется заново при каждом выполнении. lambda_stmt даёт ключ по
+    коду лямбды и track_on, поэтому build вызывается один раз на диалект, а
+    скомпилированный SQL берётся из кэша движка.
+
+    :param session: активная сессия (AsyncSession или Session в событиях).
+    :param build: функция insert(table) диалекта -> оператор над Core-таблицей; значения
+        передаются параметрами execute, а не литералами в build.
+    :return: оператор для session.execute(stmt, params).
+    """
+
+    insert = _insert_for(session.bind.dialect.name)
+    return lambda_stmt(lambda: build(insert), track_on=[build, insert], track_closure_variables=False)
+
+
+def track_counters(session: AsyncSession | Session, deltas: Mapping[str, int]) -> None:
+    """Копит изменения счётчиков сводки до коммита транзакции.
+
+    Запись идёт одним upsert прямо перед COMMIT (см. _flush_counters), поэтому
+    горячие строки вроде keys_active блокируются только на время коммита, а при
+    откате изменения просто выбрасываются.
+
+    :param session: сессия, в транзакции которой произошли изменения.
+    :param deltas: имя счётчика -> приращение.
+    :return: None.
+    """
+
+    pending = session.info.setdefault(COUNTER_DELTAS, Counter())
+    pending.update(deltas)
+
+
+@event.listens_for(Session, "before_commit")
+def _flush_counters(session: Session) -> None:
+    """Пишет накопленные приращения счётчиков в той же транзакции."""
+
+    pending = session.info.pop(COUNTER_DELTAS, None)
+    values = [{"name": name, "value": delta} for name, delta in sorted((pending or {}).items()) if delta]
+    if not values:
+        return
+    session.execute(cached_upsert(session, _counter_upsert), values)
+
+
+def _counter_upsert(insert):
+    """Прибавление к счётчику сводки (для cached_upsert)."""
+
+    counters = DashboardCounter.__table__
+    stmt = insert(counters)
+    return stmt.on_conflict_do_update(
+        index_elements=[counters.c.name], set_={"value": counters.c.value + stmt.excluded.value}
+    )
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_counters(session: Session, previous_transaction) -> None:  # pylint: disable=unused-argument
+    """Откат транзакции отменяет и накопленные приращения."""
+
+    session.info.pop(COUNTER_DELTAS, None)
+
+
+def user_cache_key(telegram_id: int) -> str:
+    """Ключ кэша пользователя по Telegram ID (см. KeyService.ensure_user).
+
+    :param telegram_id: Telegram ID.
+    :return: ключ для InvalidationBus.
+    """
+
+    return f"user:{telegram_id}"
+
+
+def keys_cache_key(user_id: int) -> str:
+    """Ключ кэша списка ключей пользователя (см. KeyService.list_keys).
+
+    :param user_id: id пользователя.
+    :return: ключ для InvalidationBus.
+    """
+
+    return f"keys:{user_id}"
+
+
+def utc_day(moment: dt.datetime) -> str:
+    """День (UTC) в формате имён счётчиков.
+
+    :param moment: время.
+    :return: строка YYYY-MM-DD.
+    """
+
+    return moment.astimezone(dt.timezone.utc).strftime("%Y-%m-%d")
+
+
+# Операторы горячего пути собраны один раз с bindparam: ключ кэша компиляции у
+# готовой конструкции мемоизирован, на вызов остаются привязка параметров и выполнение.
+_USER_BY_TELEGRAM_ID = select(User).where(User.telegram_id == bindparam("telegram_id"))
+_USER_BY_ID = select(User).where(User.id == bindparam("user_id"))
+_RESERVE_SLOT = (
+    update(User)
+    .where(User.id == bindparam("user_id"))
+    .values(active_key_count=User.active_key_count + 1)
+    .execution_options(synchronize_session=False)
+)
+_RESERVE_SLOT_LIMITED = _RESERVE_SLOT.where(User.active_key_count < bindparam("limit"))
+
+
+def _user_upsert(insert):
+    """Upsert пользователя для get_or_create (для cached_upsert)."""
+
+    users = User.__table__
+    stmt = insert(users)
+    return stmt.on_conflict_do_update(
+        index_elements=[users.c.telegram_id],
+        set_={
+            "username": stmt.excluded.username,
+            "is_admin": or_(users.c.is_admin, stmt.excluded.is_admin),
+            "blocked_at": None,
+        },
+    ).returning(users.c.id, users.c.is_admin, users.c.created_at)
 
 
 class UserRepository:
@@ -22,44 +188,131 @@ class UserRepository:
         self.session = session
 
     async def get_or_create(
-        self, telegram_id: int, username: str | None, initial_balance: int = 0
-    ) -> User:
-        """Возвращает пользователя или создаёт нового.
+        self,
+        telegram_id: int,
+        username: str | None,
+        initial_balance: int = 0,
+        is_admin: bool = False,
+    ) -> tuple[int, bool]:
+        """Возвращает пользователя или создаёт нового одним INSERT ... ON CONFLICT.
+
+        Конкурентные первые нажатия не конфликтуют по уникальному telegram_id:
+        проигравший INSERT превращается в UPDATE той же строки. Username
+        обновляется, флаг админа только выставляется, но не снимается.
 
         :param telegram_id: Telegram ID.
         :param username: username (может быть None).
-        :return: экземпляр User.
+        :param initial_balance: стартовый баланс нового пользователя.
+        :param is_admin: пометить пользователя админом.
+        :return: (id пользователя, is_admin).
         """
 
+        now = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc)
         result = await self.session.execute(
-            select(User).where(User.telegram_id == telegram_id)
+            cached_upsert(self.session, _user_upsert),
+            {
+                "telegram_id": telegram_id,
+                "username": username,
+                "balance": initial_balance,
+                "is_admin": is_admin,
+                "created_at": now,
+            },
         )
-        user = result.scalar_one_or_none()
-        if user:
-            return user
-        user = User(telegram_id=telegram_id, username=username, balance=initial_balance)
-        self.session.add(user)
-        await self.session.flush()
-        return user
+        user_id, admin, created_at = result.one()
+        if created_at == now:
+            # created_at при конфликте не меняется: совпадение с нашим значением — это INSERT.
+            track_counters(self.session, {CounterRepository.USERS: 1})
+        return user_id, bool(admin)
 
     async def mark_admins(self, admin_ids: Iterable[int]) -> None:
-        """Помечает админов на основании списка ID.
+        """Помечает админов одним многострочным upsert (недостающие создаются).
 
         :param admin_ids: Telegram ID администраторов.
         :return: None.
         """
 
-        if not admin_ids:
+        ids = sorted(set(admin_ids))
+        if not ids:
             return
-        result = await self.session.execute(select(User).where(User.telegram_id.in_(admin_ids)))
-        existing_users = result.scalars().all()
-        existing = {user.telegram_id for user in existing_users}
-        for user in existing_users:
-            user.is_admin = True
-        missing_ids = set(admin_ids) - existing
-        for telegram_id in missing_ids:
-            self.session.add(User(telegram_id=telegram_id, username=None, is_admin=True))
-        await self.session.flush()
+        now = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc)
+        stmt = dialect_insert(self.session, User).values(
+            [{"telegram_id": telegram_id, "username": None, "is_admin": True, "created_at": now} for telegram_id in ids]
+        )
+        result = await self.session.execute(
+            stmt.on_conflict_do_update(index_elements=[User.telegram_id], set_={"is_admin": True}).returning(
+                User.created_at
+            )
+        )
+        created = sum(1 for created_at in result.scalars() if created_at == now)
+        track_counters(self.session, {CounterRepository.USERS: created})
+        invalidate(self.session, *(user_cache_key(telegram_id) for telegram_id in ids))
+
+    async def get_by_telegram_id(self, telegram_id: int) -> User | None:
+        """Возвращает пользователя по Telegram ID.
+
+        :param telegram_id: Telegram ID.
+        :return: User или None.
+        """
+
+        result = await self.session.execute(_USER_BY_TELEGRAM_ID, {"telegram_id": telegram_id})
+        return result.scalar_one_or_none()
+
+    async def reserve_key_slot(self, user_id: int, limit: int | None) -> bool:
+        """Занимает слот под новый ключ условным UPDATE счётчика активных ключей.
+
+        Проверка лимита и инкремент — одна операция, поэтому параллельные
+        создания не превысят лимит.
+
+        :param user_id: id пользователя.
+        :param limit: максимум активных ключей (None — без лимита, для админов).
+        :return: False, если лимит исчерпан.
+        """
+
+        if limit is None:
+            result = await self.session.execute(_RESERVE_SLOT, {"user_id": user_id})
+        else:
+            result = await self.session.execute(_RESERVE_SLOT_LIMITED, {"user_id": user_id, "limit": limit})
+        return result.rowcount == 1
+
+    async def release_key_slots(self, released: Counter[int]) -> None:
+        """Уменьшает счётчики активных ключей после отзыва (executemany по id).
+
+        :param released: id пользователя -> число отозванных ключей.
+        :return: None.
+        """
+
+        if not released:
+            return
+        users = User.__table__
+        await self.session.execute(
+            update(users)
+            .where(users.c.id == bindparam("user_id"))
+            .values(active_key_count=users.c.active_key_count - bindparam("released")),
+            [{"user_id": user_id, "released": count} for user_id, count in released.items()],
+        )
+
+    async def stream_recipients(self, after: int, limit: int):
+        """Потоково отдаёт получателей рассылки (серверный курсор), не заблокировавших бота.
+
+        :param after: последний обработанный users.id.
+        :param limit: максимум строк в этом проходе курсора.
+        :return: AsyncResult со строками (id, telegram_id) по возрастанию id.
+        """
+
+        return await self.session.stream(
+            select(User.id, User.telegram_id)
+            .where(User.id > after, User.blocked_at.is_(None))
+            .order_by(User.id)
+            .limit(limit)
+        )
+
+    async def count(self) -> int:
+        """Число пользователей (для сверки счётчиков сводки).
+
+        :return: количество.
+        """
+
+        return (await self.session.execute(select(func.count()).select_from(User))).scalar_one()
 
     async def get_by_id(self, user_id: int) -> User | None:
         """Возвращает пользователя по id.
@@ -68,10 +321,19 @@ class UserRepository:
         :return: User или None.
         """
 
-        result = await self.session.execute(select(User).where(User.id == user_id))
+        result = await self.session.execute(_USER_BY_ID, {"user_id": user_id})
         return result.scalar_one_or_none()
 
 
+_KEYS_FOR_USER = select(VpnKey).where(VpnKey.user_id == bindparam("user_id")).order_by(VpnKey.created_at.desc())
+_KEY_BY_ID = select(VpnKey).where(VpnKey.id == bindparam("key_id"))
+_KEY_BY_ID_AND_USER = _KEY_BY_ID.where(VpnKey.user_id == bindparam("user_id"))
+_LIVE_KEY = and_(VpnKey.revoked_at.is_(None), VpnKey.expires_at > bindparam("now"))
+_ACTIVE_ADDRESSES = select(VpnKey.client_address).where(_LIVE_KEY, VpnKey.server_id == bindparam("server_id"))
+_ACTIVE_ADDRESSES_DEFAULT = select(VpnKey.client_address).where(_LIVE_KEY, VpnKey.server_id.is_(None))
+_ACTIVE_COUNTS_BY_SERVER = select(VpnKey.server_id, func.count()).where(_LIVE_KEY).group_by(VpnKey.server_id)
+
+
 class VpnKeyRepository:
     """Работа с временными ключами."""
 
@@ -90,9 +352,7 @@ class VpnKeyRepository:
         :return: список ключей.
         """
 
-        result = await self.session.execute(
-            select(VpnKey).where(VpnKey.user_id == user_id).order_by(VpnKey.created_at.desc())
-        )
+        result = await self.session.execute(_KEYS_FOR_USER, {"user_id": user_id})
         return result.scalars().all()
 
     async def create(
@@ -104,6 +364,7 @@ class VpnKeyRepository:
         client_address: str,
         preshared_key: str | None,
         rotated_from_id: uuid.UUID | None = None,
+        server_id: int | None = None,
     ) -> VpnKey:
         """Создаёт новый ключ.
 
@@ -114,11 +375,13 @@ class VpnKeyRepository:
         :param client_address: адрес клиента в туннеле.
         :param preshared_key: предварительно разделяемый ключ.
         :param rotated_from_id: ссылка на предыдущий ключ.
+        :param server_id: сервер из пула (None — сервер из Settings).
         :return: созданный ключ.
         """
 
         key = VpnKey(
             user_id=user_id,
+            server_id=server_id,
             name=name,
             expires_at=expires_at,
             public_key=public_key,
@@ -128,25 +391,76 @@ class VpnKeyRepository:
         )
         self.session.add(key)
         await self.session.flush()
+        track_counters(self.session, CounterRepository.key_deltas([(server_id, expires_at)], sign=1))
+        invalidate(self.session, keys_cache_key(user_id))
         return key
 
+    async def replace(
+        self,
+        predecessor: VpnKey,
+        public_key: str,
+        preshared_key: str | None,
+        expires_at: dt.datetime,
+    ) -> VpnKey | None:
+        """Отзывает ключ и вставляет преемника с тем же адресом, сервером и именем в одном flush.
+
+        Счётчик активных ключей не меняется: один отозван, один добавлен.
+
+        :param predecessor: ротируемый ключ.
+        :param public_key: публичный ключ преемника.
+        :param preshared_key: PSK преемника.
+        :param expires_at: срок действия преемника.
+        :return: новый ключ или None, если предшественник уже отозван.
+        """
+
+        now = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc)
+        result = await self.session.execute(
+            update(VpnKey)
+            .where(VpnKey.id == predecessor.id, VpnKey.revoked_at.is_(None))
+            .values(revoked_at=now)
+        )
+        if result.rowcount != 1:
+            return None
+        successor = VpnKey(
+            user_id=predecessor.user_id,
+            server_id=predecessor.server_id,
+            name=predecessor.name,
+            expires_at=expires_at,
+            public_key=public_key,
+            client_address=predecessor.client_address,
+            preshared_key=preshared_key,
+            rotated_from_id=predecessor.id,
+        )
+        self.session.add(successor)
+        await self.session.flush()
+        if utc_day(expires_at) != utc_day(predecessor.expires_at):
+            track_counters(
+                self.session,
+                {
+                    CounterRepository.expiring(predecessor.expires_at): -1,
+                    CounterRepository.expiring(expires_at): 1,
+                },
+            )
+        invalidate(self.session, keys_cache_key(predecessor.user_id))
+        return successor
+
     async def revoke(self, key_id: uuid.UUID, user_id: int | None = None) -> VpnKey | None:
-        """Отзывает ключ.
+        """Отзывает ключ и освобождает слот владельца (повторный отзыв ничего не меняет).
 
         :param key_id: идентификатор ключа.
         :param user_id: опциональный фильтр по владельцу.
         :return: ключ или None, если не найден.
         """
 
-        stmt = select(VpnKey).where(VpnKey.id == key_id)
-        if user_id is not None:
-            stmt = stmt.where(VpnKey.user_id == user_id)
-        result = await self.session.execute(stmt)
-        key = result.scalar_one_or_none()
+        key = await self.get(key_id, user_id=user_id)
         if key is None:
             return None
-        key.revoked_at = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc)
-        await self.session.flush()
+        if key.revoked_at is None:
+            key.revoked_at = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc)
+            await self.session.flush()
+            await UserRepository(self.session).release_key_slots(Counter({key.user_id: 1}))
+            track_counters(self.session, CounterRepository.key_deltas([(key.server_id, key.expires_at)], sign=-1))
+            invalidate(self.session, keys_cache_key(key.user_id))
         return key
 
     async def list_all(self) -> Sequence[VpnKey]:
@@ -158,19 +472,58 @@ class VpnKeyRepository:
         result = await self.session.execute(select(VpnKey).order_by(VpnKey.created_at.desc()))
         return result.scalars().all()
 
-    async def active_addresses(self) -> set[str]:
-        """Возвращает адреса, занятые активными ключами.
+    async def active_addresses(self, server_id: int | None = None) -> set[str]:
+        """Возвращает адреса, занятые активными ключами на сервере.
+
+        Пулы адресов серверов независимы, поэтому выборка всегда по одному серверу.
 
+        :param server_id: сервер из пула (None — сервер из Settings).
         :return: множество адресов.
         """
 
         now = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc)
+        if server_id is None:
+            result = await self.session.execute(_ACTIVE_ADDRESSES_DEFAULT, {"now": now})
+        else:
+            result = await self.session.execute(_ACTIVE_ADDRESSES, {"now": now, "server_id": server_id})
+        return {row[0] for row in result if row[0]}
+
+    async def active_counts_by_server(self) -> dict[int | None, int]:
+        """Число активных ключей на каждом сервере одним агрегатным запросом.
+
+        :return: словарь server_id -> количество (None — сервер из Settings).
+        """
+
+        now = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc)
+        result = await self.session.execute(_ACTIVE_COUNTS_BY_SERVER, {"now": now})
+        return {server_id: count for server_id, count in result}
+
+    async def peer_index(self) -> dict[str, uuid.UUID]:
+        """Публичный ключ -> id для неотозванных ключей (индекс для сборщика статистики).
+
+        :return: словарь.
+        """
+
         result = await self.session.execute(
-            select(VpnKey.client_address).where(
-                VpnKey.revoked_at.is_(None), VpnKey.expires_at > now
+            select(VpnKey.public_key, VpnKey.id).where(
+                VpnKey.revoked_at.is_(None), VpnKey.public_key.is_not(None)
             )
         )
-        return {row[0] for row in result if row[0]}
+        return {public_key: key_id for public_key, key_id in result}
+
+    async def set_last_handshakes(self, handshakes: dict[uuid.UUID, dt.datetime]) -> None:
+        """Обновляет last_handshake_at пачкой (executemany по первичному ключу).
+
+        :param handshakes: id ключа -> время последнего handshake.
+        :return: None.
+        """
+
+        if not handshakes:
+            return
+        await self.session.execute(
+            update(VpnKey),
+            [{"id": key_id, "last_handshake_at": at} for key_id, at in handshakes.items()],
+        )
 
     async def get(self, key_id: uuid.UUID, user_id: int | None = None) -> VpnKey | None:
         """Возвращает ключ по идентификатору.
@@ -180,27 +533,714 @@ class VpnKeyRepository:
         :return: VpnKey или None.
         """
 
-        stmt = select(VpnKey).where(VpnKey.id == key_id)
-        if user_id is not None:
-            stmt = stmt.where(VpnKey.user_id == user_id)
-        result = await self.session.execute(stmt)
+        if user_id is None:
+            result = await self.session.execute(_KEY_BY_ID, {"key_id": key_id})
+        else:
+            result = await self.session.execute(_KEY_BY_ID_AND_USER, {"key_id": key_id, "user_id": user_id})
         return result.scalar_one_or_none()
 
-    async def revoke_expired(self) -> int:
+    async def find_idle(self, idle_before: dt.datetime, limit: int) -> list[tuple[uuid.UUID, str, int]]:
+        """Действующие ключи без handshake с момента idle_before.
+
+        Ключ, к которому ни разу не подключались, считается простаивающим от даты создания.
+
+        :param idle_before: граница простоя (UTC).
+        :param limit: размер пачки.
+        :return: список (id ключа, имя, telegram_id владельца).
+        """
+
+        now = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc)
+        result = await self.session.execute(
+            select(VpnKey.id, VpnKey.name, User.telegram_id)
+            .join(User, User.id == VpnKey.user_id)
+            .where(
+                VpnKey.revoked_at.is_(None),
+                VpnKey.expires_at > now,
+                or_(
+                    VpnKey.last_handshake_at < idle_before,
+                    and_(VpnKey.last_handshake_at.is_(None), VpnKey.created_at < idle_before),
+                ),
+            )
+            .order_by(VpnKey.id)
+            .limit(limit)
+        )
+        return [tuple(row) for row in result]
+
+    def _due_for_rotation(self, created_before: dt.datetime):
+        """Условия отбора действующих ключей старше created_before."""
+
+        now = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc)
+        return (VpnKey.revoked_at.is_(None), VpnKey.expires_at > now, VpnKey.created_at < created_before)
+
+    async def count_due_for_rotation(self, created_before: dt.datetime) -> int:
+        """Сколько действующих ключей создано раньше created_before.
+
+        :param created_before: граница возраста (UTC).
+        :return: количество.
+        """
+
+        result = await self.session.execute(
+            select(func.count()).select_from(VpnKey).where(*self._due_for_rotation(created_before))
+        )
+        return int(result.scalar() or 0)
+
+    async def due_for_rotation(
+        self, created_before: dt.datetime, after: uuid.UUID | None, limit: int
+    ) -> list[tuple[uuid.UUID, int, int]]:
+        """Следующая пачка ключей к ротации (keyset по id, без OFFSET).
+
+        :param created_before: граница возраста (UTC).
+        :param after: id последнего обработанного ключа.
+        :param limit: размер пачки.
+        :return: список (id ключа, id владельца, telegram_id владельца).
+        """
+
+        stmt = (
+            select(VpnKey.id, VpnKey.user_id, User.telegram_id)
+            .join(User, User.id == VpnKey.user_id)
+            .where(*self._due_for_rotation(created_before))
+            .order_by(VpnKey.id)
+            .limit(limit)
+        )
+        if after is not None:
+            stmt = stmt.where(VpnKey.id > after)
+        return [tuple(row) for row in await self.session.execute(stmt)]
+
+    async def claim_expiring(
+        self, until: dt.datetime, created_before: dt.datetime, limit: int
+    ) -> list[tuple[uuid.UUID, str, dt.datetime, int]]:
+        """Забирает пачку ключей, истекающих до until, для напоминания (ставит notified_at).
+
+        Выборка идёт по индексу expires_at; условный UPDATE не даёт напомнить дважды,
+        даже если напоминания рассылают несколько процессов.
+
+        :param until: конец окна напоминаний (UTC).
+        :param created_before: напоминать только о ключах, созданных раньше (короткие ключи не трогаем).
+        :param limit: размер пачки.
+        :return: список (id ключа, имя, expires_at, telegram_id владельца).
+        """
+
+        now = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc)
+        result = await self.session.execute(
+            select(VpnKey.id, VpnKey.name, VpnKey.expires_at, User.telegram_id)
+            .join(User, User.id == VpnKey.user_id)
+            .where(
+                VpnKey.expires_at > now,
+                VpnKey.expires_at <= until,
+                VpnKey.revoked_at.is_(None),
+                VpnKey.notified_at.is_(None),
+                VpnKey.created_at < created_before,
+            )
+            .order_by(VpnKey.expires_at)
+            .limit(limit)
+        )
+        rows = [tuple(row) for row in result]
+        if not rows:
+            return []
+        claimed = await self.session.execute(
+            update(VpnKey)
+            .where(VpnKey.id.in_([row[0] for row in rows]), VpnKey.notified_at.is_(None))
+            .values(notified_at=now)
+            .returning(VpnKey.id)
+            .execution_options(synchronize_session=False)
+        )
+        ids = set(claimed.scalars().all())
+        return [row for row in rows if row[0] in ids]
+
+    async def release_expiring(self, key_ids: Sequence[uuid.UUID]) -> None:
+        """Снимает отметку claim_expiring с ключей, напоминание о которых не доставлено.
+
+        :param key_ids: идентификаторы ключей.
+        :return: None.
+        """
+
+        if not key_ids:
+            return
+        await self.session.execute(
+            update(VpnKey)
+            .where(VpnKey.id.in_(list(key_ids)), VpnKey.notified_at.is_not(None))
+            .values(notified_at=None)
+            .execution_options(synchronize_session=False)
+        )
+
+    async def renew(self, key_id: uuid.UUID, user_id: int) -> VpnKey | None:
+        """Продлевает действующий ключ на исходный срок (expires_at - created_at).
+
+        Срок отсчитывается от текущего окончания; напоминание снова станет возможным.
+
+        :param key_id: идентификатор ключа.
+        :param user_id: владелец.
+        :return: ключ или None, если он не найден или отозван.
+        """
+
+        key = await self.get(key_id, user_id=user_id)
+        if key is None or key.revoked_at is not None:
+            return None
+        now = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc)
+        term = max(key.expires_at - key.created_at, dt.timedelta(hours=1))
+        previous = key.expires_at
+        key.expires_at = max(key.expires_at, now) + term
+        key.notified_at = None
+        await self.session.flush()
+        track_counters(
+            self.session,
+            {CounterRepository.expiring(previous): -1, CounterRepository.expiring(key.expires_at): 1},
+        )
+        invalidate(self.session, keys_cache_key(user_id))
+        return key
+
+    async def revoke_many(self, key_ids: Iterable[uuid.UUID]) -> set[uuid.UUID]:
+        """Отзывает ключи одним UPDATE; уже отозванные не трогает.
+
+        :param key_ids: идентификаторы ключей.
+        :return: id ключей, отозванных этим вызовом.
+        """
+
+        ids = list(key_ids)
+        if not ids:
+            return set()
+        rows = await self._revoke_where(VpnKey.id.in_(ids))
+        return {key_id for key_id, _ in rows}
+
+    async def _revoke_where(self, *criteria) -> list[tuple[uuid.UUID, int]]:
+        """Отзывает неотозванные ключи по условию одним UPDATE ... RETURNING и освобождает слоты.
+
+        :param criteria: условия отбора ключей.
+        :return: список (id ключа, id владельца).
+        """
+
+        now = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc)
+        result = await self.session.execute(
+            update(VpnKey)
+            .where(VpnKey.revoked_at.is_(None), *criteria)
+            .values(revoked_at=now)
+            .returning(VpnKey.id, VpnKey.user_id, VpnKey.server_id, VpnKey.expires_at)
+            .execution_options(synchronize_session=False)
+        )
+        revoked = result.all()
+        await UserRepository(self.session).release_key_slots(Counter(row.user_id for row in revoked))
+        track_counters(
+            self.session,
+            CounterRepository.key_deltas([(row.server_id, row.expires_at) for row in revoked], sign=-1),
+        )
+        invalidate(self.session, *{keys_cache_key(row.user_id) for row in revoked})
+        return [(row.id, row.user_id) for row in revoked]
+
+    async def search(self, query: KeyQuery, limit: int, offset: int = 0) -> list[tuple[VpnKey, int, str | None]]:
+        """Поиск ключей для админа; каждый вид запроса идёт по своему индексу.
+
+        telegram_id — уникальный индекс users и ix_vpn_keys_user_id; username —
+        ix_users_username_lower (LIKE с text_pattern_ops в Postgres, диапазон в
+        SQLite); address — ix_vpn_keys_client_address; key_id — диапазон по
+        первичному ключу.
+
+        :param query: разобранный запрос.
+        :param limit: размер страницы.
+        :param offset: смещение страницы.
+        :return: список (ключ, Telegram ID владельца, username владельца).
+        """
+
+        stmt = select(VpnKey, User.telegram_id, User.username).join(User, VpnKey.user_id == User.id)
+        order = [VpnKey.created_at.desc(), VpnKey.id]
+        if query.kind == "telegram_id":
+            stmt = stmt.where(User.telegram_id == int(query.value))
+        elif query.kind == "username":
+            username = func.lower(User.username)
+            if self.session.bind.dialect.name == "postgresql":
+                stmt = stmt.where(username.startswith(query.value, autoescape=True))
+            else:
+                stmt = stmt.where(username >= query.value, username < query.value + "\uffff")
+            order.insert(0, username)
+        elif query.kind == "address":
+            stmt = stmt.where(VpnKey.client_address == query.value)
+        elif query.kind == "key_id":
+            low, high = query.key_id_range()
+            stmt = stmt.where(VpnKey.id.between(low, high))
+            order = [VpnKey.id]
+        else:
+            raise ValueError(f"Неизвестный вид запроса: {query.kind}")
+        result = await self.session.execute(stmt.order_by(*order).limit(limit).offset(offset))
+        return [tuple(row) for row in result]
+
+    async def unrevoked_by_server(self) -> dict[int | None, int]:
+        """Неотозванные ключи по серверам (для сверки счётчиков сводки).
+
+        :return: server_id -> количество (None — сервер из Settings).
+        """
+
+        result = await self.session.execute(
+            select(VpnKey.server_id, func.count()).where(VpnKey.revoked_at.is_(None)).group_by(VpnKey.server_id)
+        )
+        return {server_id: count for server_id, count in result}
+
+    async def unrevoked_by_expiry_day(self) -> dict[str, int]:
+        """Неотозванные ключи по дню истечения (UTC) одним агрегатом.
+
+        :return: YYYY-MM-DD -> количество.
+        """
+
+        if self.session.bind.dialect.name == "postgresql":
+            day = func.to_char(func.timezone("UTC", VpnKey.expires_at), "YYYY-MM-DD")
+        else:
+            day = func.date(VpnKey.expires_at)
+        result = await self.session.execute(
+            select(day, func.count()).where(VpnKey.revoked_at.is_(None)).group_by(day)
+        )
+        return {str(value): count for value, count in result}
+
+    async def latest_handshake(self) -> dt.datetime | None:
+        """Самый свежий handshake среди всех ключей.
+
+        :return: время или None, если статистики ещё нет.
+        """
+
+        result = await self.session.execute(select(func.max(VpnKey.last_handshake_at)))
+        value = result.scalar()
+        if value is not None and value.tzinfo is None:
+            value = value.replace(tzinfo=dt.timezone.utc)
+        return value
+
+    async def revoke_expired(self, user_id: int | None = None) -> int:
         """Отзывает просроченные ключи.
 
+        :param user_id: ограничить одним пользователем.
         :return: количество отозванных ключей.
         """
 
         now = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc)
+        criteria = [VpnKey.expires_at <= now]
+        if user_id is not None:
+            criteria.append(VpnKey.user_id == user_id)
+        return len(await self._revoke_where(*criteria))
+
+
+_ACTIVE_SERVERS = select(Server).where(Server.is_active.is_(True)).order_by(Server.id)
+
+
+class ServerRepository:
+    """Пул WireGuard-серверов."""
+
+    def __init__(self, session: AsyncSession):
+        """Инициализация репозитория.
+
+        :param session: активная AsyncSession.
+        """
+
+        self.session = session
+
+    async def list_active(self) -> Sequence[Server]:
+        """Возвращает серверы, доступные для размещения новых ключей.
+
+        :return: список серверов.
+        """
+
+        result = await self.session.execute(_ACTIVE_SERVERS)
+        return result.scalars().all()
+
+    async def list_all(self) -> Sequence[Server]:
+        """Возвращает все серверы.
+
+        :return: список серверов.
+        """
+
+        result = await self.session.execute(select(Server).order_by(Server.id))
+        return result.scalars().all()
+
+    async def get(self, server_id: int) -> Server | None:
+        """Возвращает сервер по id.
+
+        :param server_id: идентификатор.
+        :return: Server или None.
+        """
+
+        return await self.session.get(Server, server_id)
+
+    async def get_by_name(self, name: str) -> Server | None:
+        """Возвращает сервер по имени.
+
+        :param name: уникальное имя сервера.
+        :return: Server или None.
+        """
+
+        result = await self.session.execute(select(Server).where(Server.name == name))
+        return result.scalar_one_or_none()
+
+    async def add(
+        self,
+        name: str,
+        endpoint: str,
+        public_key: str,
+        address_cidr: str,
+        interface: str = "wg0",
+        capacity: int | None = None,
+    ) -> Server:
+        """Добавляет сервер в пул.
+
+        :param name: уникальное имя.
+        :param endpoint: публичный адрес:порт.
+        :param public_key: публичный ключ сервера.
+        :param address_cidr: подсеть клиентов этого сервера.
+        :param interface: имя интерфейса WireGuard.
+        :param capacity: максимум пиров (None — размер подсети).
+        :return: созданный сервер.
+        """
+
+        server = Server(
+            name=name,
+            endpoint=endpoint,
+            public_key=public_key,
+            address_cidr=address_cidr,
+            interface=interface,
+            capacity=capacity,
+        )
+        self.session.add(server)
+        await self.session.flush()
+        return server
+
+
+def _usage_upsert(insert):
+    """Прибавление дельт трафика к агрегатам (для cached_upsert)."""
+
+    usage = KeyUsage.__table__
+    stmt = insert(usage)
+    return stmt.on_conflict_do_update(
+        index_elements=[usage.c.key_id, usage.c.resolution, usage.c.bucket_start],
+        set_={
+            "rx_bytes": usage.c.rx_bytes + stmt.excluded.rx_bytes,
+            "tx_bytes": usage.c.tx_bytes + stmt.excluded.tx_bytes,
+        },
+    )
+
+
+class UsageRepository:
+    """Агрегаты трафика по ключам."""
+
+    def __init__(self, session: AsyncSession):
+        """Инициализация репозитория.
+
+        :param session: активная AsyncSession.
+        """
+
+        self.session = session
+
+    async def add(self, rows: Sequence[dict]) -> None:
+        """Прибавляет дельты трафика к агрегатам одним upsert (executemany).
+
+        :param rows: словари key_id, resolution, bucket_start, rx_bytes, tx_bytes.
+        :return: None.
+        """
+
+        if not rows:
+            return
+        await self.session.execute(cached_upsert(self.session, _usage_upsert), list(rows))
+
+    async def prune(self, resolution: int, before: dt.datetime) -> int:
+        """Удаляет агрегаты заданного разрешения старше порога.
+
+        :param resolution: длина интервала в секундах.
+        :param before: граница (UTC).
+        :return: число удалённых строк.
+        """
+
         result = await self.session.execute(
-            select(VpnKey).where(VpnKey.revoked_at.is_(None), VpnKey.expires_at <= now)
+            delete(KeyUsage).where(KeyUsage.resolution == resolution, KeyUsage.bucket_start < before)
         )
-        keys = result.scalars().all()
-        for key in keys:
-            key.revoked_at = now
+        return result.rowcount or 0
+
+    async def totals(self, key_ids: Iterable[uuid.UUID], since: dt.datetime) -> dict[uuid.UUID, tuple[int, int]]:
+        """Суммарный трафик ключей с момента since по часовым агрегатам.
+
+        :param key_ids: идентификаторы ключей.
+        :param since: начало периода (UTC).
+        :return: id -> (rx, tx).
+        """
+
+        ids = list(key_ids)
+        if not ids:
+            return {}
+        result = await self.session.execute(
+            select(KeyUsage.key_id, func.sum(KeyUsage.rx_bytes), func.sum(KeyUsage.tx_bytes))
+            .where(
+                KeyUsage.key_id.in_(ids),
+                KeyUsage.resolution == 3600,
+                KeyUsage.bucket_start >= since,
+            )
+            .group_by(KeyUsage.key_id)
+        )
+        return {key_id: (int(rx or 0), int(tx or 0)) for key_id, rx, tx in result}
+
+
+class RotationJobRepository:
+    """Проходы плановой ротации ключей."""
+
+    def __init__(self, session: AsyncSession):
+        """Инициализация репозитория.
+
+        :param session: активная AsyncSession.
+        """
+
+        self.session = session
+
+    async def current(self) -> RotationJob | None:
+        """Незавершённый проход, если он есть.
+
+        :return: RotationJob или None.
+        """
+
+        result = await self.session.execute(
+            select(RotationJob).where(RotationJob.finished_at.is_(None)).order_by(RotationJob.id.desc()).limit(1)
+        )
+        return result.scalar_one_or_none()
+
+    async def start(self, created_before: dt.datetime, total: int) -> RotationJob:
+        """Создаёт новый проход.
+
+        :param created_before: граница возраста ключей.
+        :param total: число ключей к ротации.
+        :return: RotationJob.
+        """
+
+        job = RotationJob(created_before=created_before, total=total, rotated=0, failed=0)
+        self.session.add(job)
         await self.session.flush()
-        return len(keys)
+        return job
+
+    async def advance(self, job_id: int, cursor: uuid.UUID, rotated: int, failed: int) -> None:
+        """Сохраняет курсор и счётчики после пачки.
+
+        :param job_id: id прохода.
+        :param cursor: id последнего обработанного ключа.
+        :param rotated: ротировано в пачке.
+        :param failed: ошибок в пачке.
+        :return: None.
+        """
+
+        await self.session.execute(
+            update(RotationJob)
+            .where(RotationJob.id == job_id)
+            .values(
+                cursor=cursor,
+                rotated=RotationJob.rotated + rotated,
+                failed=RotationJob.failed + failed,
+            )
+        )
+
+    async def finish(self, job_id: int) -> None:
+        """Отмечает проход завершённым.
+
+        :param job_id: id прохода.
+        :return: None.
+        """
+
+        now = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc)
+        await self.session.execute(update(RotationJob).where(RotationJob.id == job_id).values(finished_at=now))
+
+
+class BroadcastRepository:
+    """Рассылки админов."""
+
+    def __init__(self, session: AsyncSession):
+        """Инициализация репозитория.
+
+        :param session: активная AsyncSession.
+        """
+
+        self.session = session
+
+    async def add(self, text: str, created_by: int) -> Broadcast:
+        """Создаёт черновик рассылки (статус draft, до подтверждения админом).
+
+        :param text: текст сообщения.
+        :param created_by: Telegram ID админа.
+        :return: Broadcast.
+        """
+
+        broadcast = Broadcast(text=text, created_by=created_by, status="draft", cursor=0, sent=0, failed=0, blocked=0)
+        self.session.add(broadcast)
+        await self.session.flush()
+        return broadcast
+
+    async def get(self, broadcast_id: int) -> Broadcast | None:
+        """Возвращает рассылку по id.
+
+        :param broadcast_id: идентификатор.
+        :return: Broadcast или None.
+        """
+
+        return await self.session.get(Broadcast, broadcast_id)
+
+    async def latest(self, limit: int = 5) -> Sequence[Broadcast]:
+        """Последние рассылки.
+
+        :param limit: количество.
+        :return: список рассылок.
+        """
+
+        result = await self.session.execute(select(Broadcast).order_by(Broadcast.id.desc()).limit(limit))
+        return result.scalars().all()
+
+    async def running_ids(self) -> list[int]:
+        """Рассылки, которые нужно продолжить (например, после рестарта).
+
+        :return: список id.
+        """
+
+        result = await self.session.execute(select(Broadcast.id).where(Broadcast.status == "running"))
+        return list(result.scalars().all())
+
+    async def set_status(self, broadcast_id: int, status: str, expected: str) -> bool:
+        """Меняет статус, если текущий совпадает с ожидаемым.
+
+        :param broadcast_id: идентификатор.
+        :param status: новый статус.
+        :param expected: ожидаемый текущий статус.
+        :return: True, если статус изменён.
+        """
+
+        values: dict = {"status": status}
+        if status == "done":
+            values["finished_at"] = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc)
+        result = await self.session.execute(
+            update(Broadcast).where(Broadcast.id == broadcast_id, Broadcast.status == expected).values(**values)
+        )
+        return result.rowcount == 1
+
+    async def checkpoint(
+        self, broadcast_id: int, cursor: int, sent: int, failed: int, blocked_user_ids: Sequence[int]
+    ) -> str | None:
+        """Сохраняет курсор и статистику пачки, помечает заблокировавших бота.
+
+        :param broadcast_id: идентификатор.
+        :param cursor: последний обработанный users.id.
+        :param sent: доставлено в пачке.
+        :param failed: ошибок в пачке.
+        :param blocked_user_ids: users.id тех, кто заблокировал бота.
+        :return: текущий статус рассылки (админ мог поставить её на паузу).
+        """
+
+        if blocked_user_ids:
+            now = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc)
+            blocked = await self.session.execute(
+                update(User).where(User.id.in_(blocked_user_ids)).values(blocked_at=now).returning(User.telegram_id)
+            )
+            # Кэш пользователя пропускает upsert, который снимает blocked_at при следующем нажатии.
+            invalidate(self.session, *(user_cache_key(telegram_id) for telegram_id in blocked.scalars()))
+        result = await self.session.execute(
+            update(Broadcast)
+            .where(Broadcast.id == broadcast_id)
+            .values(
+                cursor=cursor,
+                sent=Broadcast.sent + sent,
+                failed=Broadcast.failed + failed,
+                blocked=Broadcast.blocked + len(blocked_user_ids),
+            )
+            .returning(Broadcast.status)
+        )
+        return result.scalar_one_or_none()
+
+
+_COUNTERS_BY_NAME = select(DashboardCounter.name, DashboardCounter.value).where(
+    DashboardCounter.name.in_(bindparam("names", expanding=True))
+)
+
+
+class CounterRepository:
+    """Счётчики сводки админ-панели (dashboard_counters).
+
+    Имена: users, keys_active, keys_expiring:<день UTC>, pool_used:<id сервера,
+    0 — сервер из Settings>, spend:<день UTC>. «Активный» здесь — неотозванный:
+    просроченный ключ выбывает из счётчиков, когда его отзовёт зачистка.
+    """
+
+    USERS = "users"
+    KEYS_ACTIVE = "keys_active"
+    EXPIRING = "keys_expiring:"
+    POOL_USED = "pool_used:"
+    SPEND = "spend:"
+    FAMILIES = (EXPIRING, POOL_USED, SPEND)
+
+    def __init__(self, session: AsyncSession):
+        """Инициализация.
+
+        :param session: активная AsyncSession.
+        """
+
+        self.session = session
+
+    @staticmethod
+    def expiring(moment: dt.datetime) -> str:
+        """Имя счётчика ключей, истекающих в день moment."""
+
+        return CounterRepository.EXPIRING + utc_day(moment)
+
+    @staticmethod
+    def pool_used(server_id: int | None) -> str:
+        """Имя счётчика занятых адресов сервера."""
+
+        return f"{CounterRepository.POOL_USED}{server_id or 0}"
+
+    @staticmethod
+    def spend(moment: dt.datetime) -> str:
+        """Имя счётчика списаний за день moment."""
+
+        return CounterRepository.SPEND + utc_day(moment)
+
+    @classmethod
+    def key_deltas(cls, keys: Iterable[tuple[int | None, dt.datetime]], sign: int) -> Counter[str]:
+        """Приращения счётчиков при выдаче (sign=1) или отзыве (sign=-1) ключей.
+
+        :param keys: пары (server_id, expires_at).
+        :param sign: 1 или -1.
+        :return: имя счётчика -> приращение.
+        """
+
+        deltas: Counter[str] = Counter()
+        for server_id, expires_at in keys:
+            deltas[cls.KEYS_ACTIVE] += sign
+            deltas[cls.expiring(expires_at)] += sign
+            deltas[cls.pool_used(server_id)] += sign
+        return deltas
+
+    async def get_many(self, names: Iterable[str]) -> dict[str, int]:
+        """Значения счётчиков по именам (выборка по первичному ключу).
+
+        :param names: имена.
+        :return: имя -> значение (отсутствующие не возвращаются).
+        """
+
+        result = await self.session.execute(_COUNTERS_BY_NAME, {"names": list(names)})
+        return {name: value for name, value in result}
+
+    async def all(self) -> dict[str, int]:
+        """Все счётчики (для сверки).
+
+        :return: имя -> значение.
+        """
+
+        result = await self.session.execute(select(DashboardCounter.name, DashboardCounter.value))
+        return {name: value for name, value in result}
+
+    async def replace(self, values: Mapping[str, int]) -> None:
+        """Записывает сверенные значения; счётчики семейств, которых нет в values, удаляются.
+
+        :param values: имя -> точное значение.
+        :return: None.
+        """
+
+        stale = [
+            name for name in await self.all() if name not in values and name.startswith(self.FAMILIES)
+        ]
+        if stale:
+            await self.session.execute(delete(DashboardCounter).where(DashboardCounter.name.in_(stale)))
+        if values:
+            stmt = dialect_insert(self.session, DashboardCounter).values(
+                [{"name": name, "value": value} for name, value in sorted(values.items())]
+            )
+            await self.session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=[DashboardCounter.name], set_={"value": stmt.excluded.value}
+                )
+            )
 
 
 class BillingRepository:
@@ -232,6 +1272,22 @@ class BillingRepository:
         )
         self.session.add(event)
         await self.session.flush()
+        if amount < 0:
+            track_counters(self.session, {CounterRepository.spend(dt.datetime.now(dt.timezone.utc)): -amount})
+
+    async def spend_since(self, since: dt.datetime) -> int:
+        """Сумма списаний с момента since (для сверки счётчиков сводки).
+
+        :param since: начало периода (UTC).
+        :return: сумма списаний (положительная).
+        """
+
+        result = await self.session.execute(
+            select(func.coalesce(func.sum(-BillingEvent.amount), 0)).where(
+                BillingEvent.amount < 0, BillingEvent.created_at >= since
+            )
+        )
+        return int(result.scalar_one())
 
 
 class AlertRepository:
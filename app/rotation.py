@@ -0,0 +1,159 @@
+"""Плановая ротация долгоживущих ключей.
+
+Ключи старше ROTATION_MAX_AGE_DAYS ротируются на месте (тот же адрес и срок),
+новый конфиг уходит владельцу через очередь исходящих сообщений. Проход
+растягивается на ROTATION_WINDOW_MINUTES: ключи берутся пачками по
+ROTATION_BATCH (keyset по id), пачка ротируется параллельно с общим лимитом
+KEYGEN_CONCURRENCY на запуски wg, между пачками — пауза с джиттером. Курсор
+прохода хранится в rotation_jobs, после рестарта проход продолжается.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import logging
+import random
+import uuid
+
+from app.config import Settings
+from app.metrics import registry
+from app.repositories import RotationJobRepository, VpnKeyRepository
+from app.services import KeyService
+
+logger = logging.getLogger(__name__)
+
+PACE_JITTER = 0.5
+ROTATION_CAPTION = (
+    "Плановая ротация: ключ «{name}» заменён новым, адрес и срок действия прежние. "
+    "Импортируйте этот конфиг — старый перестанет работать."
+)
+
+
+class RotationScheduler:
+    """Ведёт проходы плановой ротации ключей."""
+
+    def __init__(self, settings: Settings, session_maker, bot=None, delivery=None):
+        """Инициализация.
+
+        :param settings: конфигурация приложения.
+        :param session_maker: фабрика сессий primary.
+        :param bot: aiogram Bot для выдачи конфигов (None — без выдачи).
+        :param delivery: ConfigDelivery для отправки конфига и QR.
+        """
+
+        self.settings = settings
+        self.session_maker = session_maker
+        self.bot = bot
+        self.delivery = delivery
+        self.batch_size = max(settings.rotation_batch, 1)
+        self.rotations = registry.counter(
+            "bot_scheduled_rotations_total", "Плановые ротации ключей.", labels=("result",)
+        )
+
+    async def _job(self, now: dt.datetime) -> tuple[int, dt.datetime, uuid.UUID | None, int] | None:
+        """Возвращает незавершённый проход или начинает новый.
+
+        :param now: текущее время (UTC).
+        :return: (id, created_before, курсор, всего ключей) или None, если ротировать нечего.
+        """
+
+        async with self.session_maker() as session:
+            jobs = RotationJobRepository(session)
+            job = await jobs.current()
+            if job is None:
+                created_before = now - dt.timedelta(days=self.settings.rotation_max_age_days)
+                total = await VpnKeyRepository(session).count_due_for_rotation(created_before)
+                if not total:
+                    return None
+                job = await jobs.start(created_before, total)
+                await session.commit()
+                logger.info("Rotation job %s started: %s keys", job.id, total)
+            else:
+                logger.info("Rotation job %s resumed: %s/%s done", job.id, job.rotated + job.failed, job.total)
+            return job.id, job.created_before, job.cursor, job.total
+
+    async def _rotate(self, key_id: uuid.UUID, user_id: int, telegram_id: int) -> bool:
+        """Ротирует один ключ в своей транзакции и отправляет конфиг владельцу.
+
+        :return: True, если ключ ротирован.
+        """
+
+        try:
+            async with self.session_maker() as session:
+                service = KeyService(session=session, settings=self.settings)
+                result = await service.rotate_key(key_id, user_id)
+                await session.commit()
+                if not await service.apply_peer_swap(result):
+                    logger.warning("Scheduled rotation of %s committed but wg set failed", key_id)
+                await session.commit()
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.warning("Scheduled rotation of %s failed: %s", key_id, exc)
+            self.rotations.inc(1, "failed")
+            return False
+        self.rotations.inc(1, "rotated")
+        if self.bot is not None and self.delivery is not None:
+            try:
+                await self.delivery.send_config_to(
+                    self.bot,
+                    telegram_id,
+                    filename=f"wg-{result.key.id}.conf",
+                    config_text=result.credentials.config_text,
+                    caption=ROTATION_CAPTION.format(name=result.key.name),
+                )
+            except Exception as exc:  # pylint: disable=broad-except
+                # Ключ уже ротирован: пользователь может ротировать его ещё раз вручную.
+                logger.warning("Rotated config for %s not delivered: %s", telegram_id, exc)
+        return True
+
+    async def run_once(self, now: dt.datetime | None = None) -> int:
+        """Проводит (или продолжает) проход ротации до конца.
+
+        :param now: текущее время (UTC).
+        :return: число ротированных ключей в этом запуске.
+        """
+
+        if self.settings.rotation_max_age_days <= 0:
+            return 0
+        job = await self._job(now or dt.datetime.now(dt.timezone.utc))
+        if job is None:
+            return 0
+        job_id, created_before, cursor, total = job
+        pace = self.settings.rotation_window_minutes * 60 / max(total, 1)
+
+        rotated_total = 0
+        while True:
+            async with self.session_maker() as session:
+                batch = await VpnKeyRepository(session).due_for_rotation(created_before, cursor, self.batch_size)
+            if not batch:
+                break
+            results = await asyncio.gather(*(self._rotate(*row) for row in batch))
+            rotated = sum(results)
+            rotated_total += rotated
+            cursor = batch[-1][0]
+            async with self.session_maker() as session:
+                await RotationJobRepository(session).advance(job_id, cursor, rotated, len(batch) - rotated)
+                await session.commit()
+            if len(batch) < self.batch_size:
+                break
+            await asyncio.sleep(pace * len(batch) * random.uniform(1 - PACE_JITTER, 1 + PACE_JITTER))
+
+        async with self.session_maker() as session:
+            await RotationJobRepository(session).finish(job_id)
+            await session.commit()
+        logger.info("Rotation job %s finished: %s keys rotated in this run", job_id, rotated_total)
+        return rotated_total
+
+    async def run(self, interval: int) -> None:
+        """Бесконечный цикл: раз в interval проверяет, не пора ли ротировать.
+
+        :param interval: пауза между проверками, секунды.
+        :return: None.
+        """
+
+        while True:
+            try:
+                await self.run_once()
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.exception("Rotation scheduler failed: %s", exc)
+            await asyncio.sleep(interval)
@@ -0,0 +1,74 @@
+"""Разбор поисковых запросов админа: Telegram ID, username, адрес клиента, начало id ключа."""
+
+from __future__ import annotations
+
+import ipaddress
+import re
+import uuid
+from dataclasses import dataclass
+
+MAX_QUERY_LENGTH = 40
+USERNAME_RE = re.compile(r"^[a-z0-9_]{1,32}$")
+KEY_PREFIX_RE = re.compile(r"^[0-9a-f-]{4,36}$")
+
+
+@dataclass(frozen=True)
+class KeyQuery:
+    """Разобранный запрос поиска ключей.
+
+    :param kind: telegram_id, username, address или key_id.
+    :param value: нормализованное значение (username в нижнем регистре, адрес в виде ip/32,
+        начало id ключа — hex без дефисов).
+    """
+
+    kind: str
+    value: str
+
+    @classmethod
+    def parse(cls, text: str) -> "KeyQuery":
+        """Определяет вид запроса.
+
+        Только цифры — Telegram ID; IP (с маской или без) — адрес клиента;
+        hex от 8 символов с цифрой (дефисы допустимы) — начало id ключа;
+        остальное — начало username. Префикс `@` явно задаёт поиск по username.
+
+        :param text: строка запроса.
+        :return: KeyQuery.
+        :raises ValueError: если запрос пустой, слишком длинный или не подходит ни под один вид.
+        """
+
+        text = text.strip()
+        if not text or len(text) > MAX_QUERY_LENGTH:
+            raise ValueError(f"Запрос должен быть от 1 до {MAX_QUERY_LENGTH} символов")
+        if text.startswith("@"):
+            return cls._username(text[1:])
+        if text.isdigit():
+            return cls("telegram_id", text)
+        if "." in text or ":" in text:
+            try:
+                interface = ipaddress.ip_interface(text)
+            except ValueError:
+                raise ValueError("Не похоже на IP-адрес") from None
+            return cls("address", f"{interface.ip}/{interface.ip.max_prefixlen}")
+        lowered = text.lower()
+        hex_digits = lowered.replace("-", "")
+        if KEY_PREFIX_RE.match(lowered) and 8 <= len(hex_digits) <= 32 and any(ch.isdigit() for ch in hex_digits):
+            return cls("key_id", hex_digits)
+        return cls._username(text)
+
+    @classmethod
+    def _username(cls, text: str) -> "KeyQuery":
+        """Запрос по началу username."""
+
+        value = text.lower()
+        if not USERNAME_RE.match(value):
+            raise ValueError("Username: латиница, цифры и _, до 32 символов")
+        return cls("username", value)
+
+    def key_id_range(self) -> tuple[uuid.UUID, uuid.UUID]:
+        """Диапазон id ключей с заданным началом (поиск по первичному ключу).
+
+        :return: (наименьший, наибольший) UUID с этим префиксом.
+        """
+
+        return uuid.UUID(self.value.ljust(32, "0")), uuid.UUID(self.value.ljust(32, "f"))
@@ -0,0 +1,188 @@
+"""Пул WireGuard-серверов: выбор сервера для нового ключа и CLI управления.
+
+    python -m app.servers list
+    python -m app.servers add --name fra-1 --endpoint fra1.example.com:51820 \\
+        --public-key <server_pub> --cidr 10.9.0.0/22 [--interface wg0] [--capacity 900]
+    python -m app.servers disable fra-1
+    python -m app.servers enable fra-1
+
+Пока таблица servers пуста, все ключи выдаются на сервер из WG_* в .env.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import ipaddress
+from dataclasses import dataclass
+from typing import Mapping, Sequence
+
+from app.config import Settings
+from app.models import Server
+
+
+@dataclass(frozen=True)
+class ServerTarget:
+    """Сервер, на который можно разместить пир.
+
+    :param id: id в таблице servers (None — сервер из Settings).
+    :param name: имя сервера.
+    :param endpoint: публичный адрес:порт.
+    :param public_key: публичный ключ сервера.
+    :param address_cidr: подсеть клиентов.
+    :param capacity: максимум пиров (None — размер подсети).
+    :param interface: интерфейс WireGuard на сервере.
+    """
+
+    id: int | None
+    name: str
+    endpoint: str
+    public_key: str
+    address_cidr: str
+    capacity: int | None = None
+    interface: str = "wg0"
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "ServerTarget":
+        """Сервер по умолчанию из WG_* настроек.
+
+        :param settings: конфигурация приложения.
+        :return: ServerTarget.
+        """
+
+        return cls(
+            id=None,
+            name="default",
+            endpoint=settings.wg_endpoint,
+            public_key=settings.wg_server_public_key,
+            address_cidr=settings.wg_client_address_cidr,
+            interface=settings.wg_interface,
+        )
+
+    @classmethod
+    def from_model(cls, server: Server) -> "ServerTarget":
+        """Сервер из таблицы servers.
+
+        :param server: модель сервера.
+        :return: ServerTarget.
+        """
+
+        return cls(
+            id=server.id,
+            name=server.name,
+            endpoint=server.endpoint,
+            public_key=server.public_key,
+            address_cidr=server.address_cidr,
+            capacity=server.capacity,
+            interface=server.interface,
+        )
+
+    @property
+    def pool_size(self) -> int:
+        """Число адресов для клиентов: хосты подсети, не больше capacity."""
+
+        network = ipaddress.ip_network(self.address_cidr, strict=False)
+        if network.version == 4:
+            hosts = network.num_addresses - 2 if network.prefixlen < 31 else network.num_addresses
+        else:
+            hosts = network.num_addresses - 1
+        return min(hosts, self.capacity) if self.capacity is not None else hosts
+
+    def free(self, active: int) -> int:
+        """Сколько ещё пиров помещается на сервер.
+
+        :param active: число активных ключей на сервере.
+        :return: свободные слоты.
+        """
+
+        return self.pool_size - active
+
+
+def choose_server(targets: Sequence[ServerTarget], active_counts: Mapping[int | None, int]) -> ServerTarget:
+    """Выбирает сервер с наибольшим запасом адресов, при равенстве — с меньшим числом пиров.
+
+    :param targets: доступные серверы.
+    :param active_counts: активные ключи по server_id.
+    :return: выбранный сервер.
+    :raises ValueError: если свободных адресов нет ни на одном сервере.
+    """
+
+    if not targets:
+        raise ValueError("Нет доступных серверов WireGuard")
+    best = max(
+        targets,
+        key=lambda target: (
+            target.free(active_counts.get(target.id, 0)),
+            -active_counts.get(target.id, 0),
+        ),
+    )
+    if best.free(active_counts.get(best.id, 0)) <= 0:
+        raise ValueError("Нет свободных адресов в пуле WireGuard")
+    return best
+
+
+async def _run_cli(args: argparse.Namespace) -> None:
+    """Выполняет команду CLI в одной транзакции."""
+
+    from app.config import load_settings
+    from app.db import get_session_maker
+    from app.repositories import ServerRepository, VpnKeyRepository
+
+    session_maker = get_session_maker(load_settings())
+    try:
+        async with session_maker() as session:
+            repo = ServerRepository(session)
+            if args.command == "add":
+                ipaddress.ip_network(args.cidr, strict=False)
+                server = await repo.add(
+                    name=args.name,
+                    endpoint=args.endpoint,
+                    public_key=args.public_key,
+                    address_cidr=args.cidr,
+                    interface=args.interface,
+                    capacity=args.capacity,
+                )
+                print(f"Добавлен сервер {server.name} (id={server.id})")
+            elif args.command in ("enable", "disable"):
+                server = await repo.get_by_name(args.name)
+                if server is None:
+                    raise SystemExit(f"Сервер {args.name} не найден")
+                server.is_active = args.command == "enable"
+            else:
+                counts = await VpnKeyRepository(session).active_counts_by_server()
+                for server in await repo.list_all():
+                    target = ServerTarget.from_model(server)
+                    active = counts.get(server.id, 0)
+                    state = "on " if server.is_active else "off"
+                    print(
+                        f"[{state}] {server.id:>3} {server.name:<16} {server.endpoint:<28} "
+                        f"{server.address_cidr:<18} {server.interface:<6} пиров {active}/{target.pool_size}"
+                    )
+                if None in counts:
+                    print(f"Ключей на сервере из .env (WG_*): {counts[None]}")
+            await session.commit()
+    finally:
+        await session_maker.kw["bind"].dispose()
+
+
+def main() -> None:
+    """CLI управления пулом серверов."""
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="Серверы и их загрузка.")
+    add = commands.add_parser("add", help="Добавить сервер в пул.")
+    add.add_argument("--name", required=True)
+    add.add_argument("--endpoint", required=True, help="Публичный адрес:порт.")
+    add.add_argument("--public-key", required=True)
+    add.add_argument("--cidr", required=True, help="Подсеть клиентов этого сервера.")
+    add.add_argument("--interface", default="wg0")
+    add.add_argument("--capacity", type=int, help="Максимум пиров (по умолчанию — размер подсети).")
+    for command in ("enable", "disable"):
+        toggle = commands.add_parser(command, help=f"{'Включить' if command == 'enable' else 'Выключить'} размещение.")
+        toggle.add_argument("name")
+    asyncio.run(_run_cli(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
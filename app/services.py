@@ -8,16 +8,52 @@ from typing import Sequence
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import Settings
+from app.db import invalidation_bus
 from app.models import VpnKey
-from app.repositories import AlertRepository, BillingRepository, UserRepository, VpnKeyRepository
+from app.repositories import (
+    AlertRepository,
+    BillingRepository,
+    ServerRepository,
+    UserRepository,
+    VpnKeyRepository,
+    keys_cache_key,
+    user_cache_key,
+)
+from app.servers import ServerTarget, choose_server
 from app.wireguard import (
     WireGuardCredentials,
     allocate_client_address,
     build_client_config,
-    generate_keypair,
-    generate_preshared_key,
+    generate_keys,
+    swap_peer,
 )
 
+# (id пользователя, username) по Telegram ID и списки ключей по id пользователя;
+# репозитории вытесняют записи через invalidate() при изменениях.
+user_cache = invalidation_bus.cache("users", max_entries=50_000)
+key_list_cache = invalidation_bus.cache("key_lists", max_entries=10_000)
+
+# (private, public, psk) из KeyService.generate_keys.
+KeyMaterial = tuple[str, str, str | None]
+
+
+@dataclass
+class PeerSwap:
+    """Замена пира на интерфейсе, которую ротация применяет после коммита.
+
+    :param interface: интерфейс WireGuard.
+    :param old_public_key: ключ удаляемого пира.
+    :param new_public_key: ключ нового пира.
+    :param allowed_ip: адрес клиента.
+    :param preshared_key: PSK нового пира.
+    """
+
+    interface: str
+    old_public_key: str | None
+    new_public_key: str
+    allowed_ip: str
+    preshared_key: str | None
+
 
 @dataclass
 class KeyCreationResult:
@@ -25,10 +61,12 @@ class KeyCreationResult:
 
     :param key: модель ключа.
     :param credentials: реквизиты WireGuard.
+    :param peer_swap: замена пира после коммита ротации (None — не нужна).
     """
 
     key: VpnKey
     credentials: WireGuardCredentials
+    peer_swap: PeerSwap | None = None
 
 
 class AlertService:
@@ -140,23 +178,49 @@ class KeyService:
         self.settings = settings
         self.user_repo = UserRepository(session)
         self.key_repo = VpnKeyRepository(session)
+        self.server_repo = ServerRepository(session)
         self.billing_repo = BillingRepository(session)
         self.alert_repo = AlertRepository(session)
         self.alerts = AlertService(self.alert_repo)
         self.billing = BillingService(session, self.billing_repo, self.user_repo)
 
     async def ensure_user(self, telegram_id: int, username: str | None) -> int:
-        """Создаёт или возвращает пользователя.
+        """Создаёт или возвращает пользователя одним upsert; админы из ADMIN_IDS сразу помечаются.
+
+        Известный пользователь с тем же username берётся из кэша без записи в БД.
 
         :param telegram_id: Telegram ID.
         :param username: username.
         :return: id пользователя в БД.
         """
 
-        user = await self.user_repo.get_or_create(
-            telegram_id=telegram_id, username=username, initial_balance=self.settings.initial_balance
+        key = user_cache_key(telegram_id)
+        cached = user_cache.get(key)
+        if cached is not None and cached[1] == username:
+            return cached[0]
+        version = user_cache.version
+        user_id, _ = await self.user_repo.get_or_create(
+            telegram_id=telegram_id,
+            username=username,
+            initial_balance=self.settings.initial_balance,
+            is_admin=telegram_id in self.settings.admin_ids,
         )
-        return user.id
+        # Новый пользователь существует только после коммита.
+        user_cache.put_after_commit(self.session, key, (user_id, username), version)
+        return user_id
+
+    async def find_user(self, telegram_id: int) -> int | None:
+        """Ищет пользователя без создания (годится для сессии реплики).
+
+        :param telegram_id: Telegram ID.
+        :return: id пользователя в БД или None.
+        """
+
+        cached = user_cache.get(user_cache_key(telegram_id))
+        if cached is not None:
+            return cached[0]
+        user = await self.user_repo.get_by_telegram_id(telegram_id)
+        return user.id if user else None
 
     async def set_admins(self, admin_ids: set[int]) -> None:
         """Маркирует администраторов.
@@ -167,33 +231,94 @@ class KeyService:
 
         await self.user_repo.mark_admins(admin_ids)
 
-    async def list_keys(self, user_id: int) -> Sequence[VpnKey]:
-        """Список ключей пользователя.
+    async def list_keys(self, user_id: int, staleness: float = 0.0) -> Sequence[VpnKey]:
+        """Список ключей пользователя (из кэша, если он не вытеснен изменением ключей).
 
         :param user_id: id пользователя.
-        :return: последовательность ключей.
+        :param staleness: отставание источника сессии (SessionRouter.staleness).
+        :return: последовательность ключей (только для чтения: объекты общие для запросов).
         """
 
-        return await self.key_repo.list_for_user(user_id)
+        key = keys_cache_key(user_id)
+        cached = key_list_cache.get(key)
+        if cached is not None:
+            return cached
+        version = key_list_cache.version
+        keys = tuple(await self.key_repo.list_for_user(user_id))
+        key_list_cache.put(key, keys, version, staleness=staleness)
+        return keys
 
-    async def _build_credentials(self, occupied: set[str]) -> WireGuardCredentials:
-        """Генерирует ключи и конфиг.
+    def _expires_at(self, ttl_hours: int | None) -> dt.datetime:
+        """Срок действия ключа по TTL.
 
-        :param occupied: занятые адреса.
-        :return: креды WireGuard.
+        :param ttl_hours: часы (None — DEFAULT_KEY_TTL_HOURS, 0 и меньше — «Безлимит», ~10 лет).
+        :return: момент истечения (UTC).
+        """
+
+        hours = ttl_hours if ttl_hours is not None else self.settings.default_key_ttl_hours
+        now = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc)
+        if hours <= 0:
+            return now + dt.timedelta(days=3650)
+        return now + dt.timedelta(hours=hours)
+
+    async def place(self, server_id: int | None = None) -> ServerTarget:
+        """Выбирает сервер для нового ключа.
+
+        :param server_id: предпочтительный сервер, если он ещё в пуле.
+        :return: сервер с наибольшим запасом адресов; сервер из Settings, если пул пуст.
+        :raises ValueError: если свободных адресов нет нигде.
+        """
+
+        servers = await self.server_repo.list_active()
+        if not servers:
+            return ServerTarget.from_settings(self.settings)
+        targets = [ServerTarget.from_model(server) for server in servers]
+        preferred = next((target for target in targets if server_id is not None and target.id == server_id), None)
+        if preferred is None and len(targets) == 1:
+            preferred = targets[0]
+        if preferred is not None and preferred.capacity is None:
+            return preferred
+        counts = await self.key_repo.active_counts_by_server()
+        if preferred is not None and preferred.free(counts.get(preferred.id, 0)) > 0:
+            return preferred
+        return choose_server(targets, counts)
+
+    async def generate_keys(self) -> KeyMaterial:
+        """Генерирует пару ключей и PSK (если он не задан в настройках). Не обращается к БД.
+
+        :return: кортеж (private, public, psk).
+        :raises ValueError: если wg недоступен.
         """
 
         try:
-            private_key, public_key = generate_keypair()
+            private_key, public_key, generated_psk = await generate_keys(
+                with_preshared=not self.settings.wg_preshared_key,
+                concurrency=self.settings.keygen_concurrency,
+            )
         except Exception as exc:  # pylint: disable=broad-except
             raise ValueError("Не удалось сгенерировать WireGuard-ключи (wg)") from exc
-        preshared = self.settings.wg_preshared_key or generate_preshared_key()
-        client_address = allocate_client_address(self.settings.wg_client_address_cidr, occupied)
+        return private_key, public_key, self.settings.wg_preshared_key or generated_psk
+
+    def _build_credentials(
+        self, keys: KeyMaterial, occupied: set[str], server: ServerTarget
+    ) -> WireGuardCredentials:
+        """Выделяет адрес и собирает конфиг.
+
+        :param keys: сгенерированные ключи.
+        :param occupied: занятые адреса на сервере.
+        :param server: сервер, на котором размещается пир.
+        :return: креды WireGuard.
+        """
+
+        private_key, public_key, preshared = keys
+        client_address = allocate_client_address(server.address_cidr, occupied)
         config_text = build_client_config(
             private_key=private_key,
             client_address=client_address,
             settings=self.settings,
             preshared_key=preshared,
+            endpoint=server.endpoint,
+            server_public_key=server.public_key,
         )
         return WireGuardCredentials(
             private_key=private_key,
@@ -208,37 +333,44 @@ class KeyService:
         user_id: int,
         name: str,
         ttl_hours: int | None = None,
+        server_id: int | None = None,
+        keys: KeyMaterial | None = None,
     ) -> KeyCreationResult:
         """Создаёт новый временный ключ с учётом лимитов и биллинга.
 
+        wg запускается до первого запроса к БД: транзакция (а на SQLite —
+        единственное соединение writer'а) не держится на время генерации.
+
         :param user_id: id пользователя.
         :param name: имя ключа.
         :param ttl_hours: срок жизни в часах.
+        :param server_id: предпочтительный сервер (см. place).
+        :param keys: заранее сгенерированные ключи (None — сгенерировать здесь).
         :return: результат с моделью и конфигом.
         :raises ValueError: если превышен лимит или нет средств.
         """
 
+        if keys is None:
+            keys = await self.generate_keys()
         user = await self.user_repo.get_by_id(user_id)
         is_admin = bool(user and user.is_admin)
-
-        existing = await self.key_repo.list_for_user(user_id)
-        active = [k for k in existing if k.is_active]
-        if not is_admin and len(active) >= self.settings.max_keys_per_user:
+        limit = None if is_admin else self.settings.max_keys_per_user
+        if limit is not None and user is not None and user.active_key_count >= limit:
+            # Счётчик включает просроченные ключи, которые ещё не зачистил cleanup_worker.
+            if await self.key_repo.revoke_expired(user_id=user_id):
+                await self.session.refresh(user, ["active_key_count"])
+            if user.active_key_count >= limit:
+                raise ValueError("Превышен лимит устройств")
+
+        expires_at = self._expires_at(ttl_hours)
+
+        server = await self.place(server_id)
+        occupied = await self.key_repo.active_addresses(server.id)
+        credentials = self._build_credentials(keys, occupied, server)
+
+        # Окончательная проверка лимита — атомарно вместе с записью.
+        if not await self.user_repo.reserve_key_slot(user_id, limit):
             raise ValueError("Превышен лимит устройств")
-
-        hours = ttl_hours if ttl_hours is not None else self.settings.default_key_ttl_hours
-        if hours <= 0:
-            expires_at = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc) + dt.timedelta(
-                days=3650
-            )
-        else:
-            expires_at = dt.datetime.utcnow().replace(tzinfo=dt.timezone.utc) + dt.timedelta(
-                hours=hours
-            )
-
-        occupied = await self.key_repo.active_addresses()
-        credentials = await self._build_credentials(occupied)
-
         key = await self.key_repo.create(
             user_id=user_id,
             name=name,
@@ -246,6 +378,7 @@ class KeyService:
             public_key=credentials.public_key,
             client_address=credentials.client_address,
             preshared_key=credentials.preshared_key,
+            server_id=server.id,
         )
         return KeyCreationResult(key=key, credentials=credentials)
 
@@ -269,27 +402,138 @@ class KeyService:
         key_id: uuid.UUID,
         user_id: int,
         ttl_hours: int | None = None,
+        keys: KeyMaterial | None = None,
     ) -> KeyCreationResult:
-        """Ротирует ключ: отзывает старый и создаёт новый.
+        """Ротирует ключ на месте: новая пара ключей, тот же адрес и сервер.
+
+        Лимит устройств не проверяется и адрес не выделяется заново — старый ключ
+        отзывается, а преемник вставляется в той же транзакции. При WG_MANAGE_PEERS
+        для сервера из Settings результат несёт peer_swap: после коммита вызывающий
+        применяет его через apply_peer_swap, чтобы откат транзакции не оставил на
+        интерфейсе ключ, которого нет в БД. Для сервера из пула `wg set` на хосте
+        бота ничего не даст — вместо замены создаётся алерт для ручной замены пира.
 
         :param key_id: идентификатор текущего ключа.
         :param user_id: владелец.
-        :param ttl_hours: срок жизни нового ключа.
+        :param ttl_hours: новый срок жизни в часах (None — сохранить прежний срок действия).
+        :param keys: заранее сгенерированные ключи (None — сгенерировать до первого запроса к БД).
         :return: KeyCreationResult.
-        :raises ValueError: если ключ не найден.
+        :raises ValueError: если ключ не найден, отозван или истёк.
         """
 
+        private_key, public_key, preshared = keys or await self.generate_keys()
         existing = await self.key_repo.get(key_id, user_id=user_id)
         if existing is None:
             raise ValueError("Ключ не найден")
-        await self.key_repo.revoke(key_id, user_id=user_id)
-        result = await self.create_key(
-            user_id=user_id,
-            name=f"{existing.name}-rotated",
-            ttl_hours=ttl_hours,
+        if existing.revoked_at is not None:
+            raise ValueError("Ключ уже отозван")
+        if not existing.is_active:
+            raise ValueError("Ключ истёк — продлите его или создайте новый")
+        server = await self._server_of(existing)
+        if ttl_hours is None:
+            expires_at = existing.expires_at
+        else:
+            expires_at = self._expires_at(ttl_hours)
+
+        key = await self.key_repo.replace(
+            existing, public_key=public_key, preshared_key=preshared, expires_at=expires_at
+        )
+        if key is None:
+            raise ValueError("Ключ уже отозван")
+        peer_swap = None
+        if self.settings.wg_manage_peers and server.id is not None:
+            # `wg set` выполняется на хосте бота: пиры серверов пула меняет админ.
+            await self.alerts.emit(
+                level="warn",
+                message=(
+                    f"Ключ {existing.id} ротирован на сервере {server.name}: замените пир вручную "
+                    f"({server.interface}: {existing.public_key} -> {public_key}, {existing.client_address})"
+                ),
+                user_id=user_id,
+            )
+        elif self.settings.wg_manage_peers:
+            peer_swap = PeerSwap(
+                interface=server.interface,
+                old_public_key=existing.public_key,
+                new_public_key=public_key,
+                allowed_ip=existing.client_address,
+                preshared_key=preshared,
+            )
+
+        config_text = build_client_config(
+            private_key=private_key,
+            client_address=existing.client_address,
+            settings=self.settings,
+            preshared_key=preshared,
+            endpoint=server.endpoint,
+            server_public_key=server.public_key,
+        )
+        credentials = WireGuardCredentials(
+            private_key=private_key,
+            public_key=public_key,
+            client_address=existing.client_address,
+            preshared_key=preshared,
+            config_text=config_text,
         )
-        result.key.rotated_from_id = key_id
-        return result
+        return KeyCreationResult(key=key, credentials=credentials, peer_swap=peer_swap)
+
+    async def apply_peer_swap(self, result: KeyCreationResult) -> bool:
+        """Применяет замену пира после коммита ротации.
+
+        Ротация уже зафиксирована, поэтому ошибка wg не откатывает её: создаётся
+        алерт для админа (нужен коммит сессии), а пир можно поправить вручную
+        или повторной ротацией.
+
+        :param result: результат rotate_key.
+        :return: False, если `wg set` завершился ошибкой.
+        """
+
+        swap = result.peer_swap
+        if swap is None:
+            return True
+        try:
+            await swap_peer(
+                swap.interface,
+                old_public_key=swap.old_public_key,
+                new_public_key=swap.new_public_key,
+                allowed_ip=swap.allowed_ip,
+                preshared_key=swap.preshared_key,
+            )
+        except Exception as exc:  # pylint: disable=broad-except
+            await self.alerts.emit(
+                level="error",
+                message=f"wg set не применил ротацию ключа {result.key.id} на {swap.interface}: {exc}",
+                user_id=result.key.user_id,
+            )
+            return False
+        return True
+
+    async def renew_key(self, key_id: uuid.UUID, user_id: int) -> VpnKey:
+        """Продлевает ключ на исходный срок.
+
+        :param key_id: идентификатор ключа.
+        :param user_id: владелец.
+        :return: продлённый ключ.
+        :raises ValueError: если ключ не найден или уже отозван.
+        """
+
+        key = await self.key_repo.renew(key_id, user_id)
+        if key is None:
+            raise ValueError("Ключ не найден или уже отозван")
+        return key
+
+    async def _server_of(self, key: VpnKey) -> ServerTarget:
+        """Сервер, на котором размещён ключ (в том числе выведенный из размещения).
+
+        :param key: ключ.
+        :return: ServerTarget.
+        """
+
+        if key.server_id is not None:
+            server = await self.server_repo.get(key.server_id)
+            if server is not None:
+                return ServerTarget.from_model(server)
+        return ServerTarget.from_settings(self.settings)
 
     async def cleanup_expired(self) -> int:
         """Отзывает просроченные ключи и создаёт алерт.
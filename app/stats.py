@@ -0,0 +1,234 @@
+"""Сбор статистики пиров WireGuard: трафик и время последнего handshake.
+
+Раз в STATS_INTERVAL_SECONDS читается `wg show all dump` (или файл WG_DUMP_FILE
+в том же формате — для тестов и стендов без wg). Пиры сопоставляются с ключами
+по публичному ключу через индекс в памяти, дельты счётчиков пишутся пачкой в
+key_usage: минутные агрегаты (хранятся STATS_MINUTE_RETENTION_HOURS) и часовые.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import logging
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+from app.config import Settings
+from app.metrics import registry
+from app.repositories import UsageRepository, VpnKeyRepository
+
+logger = logging.getLogger(__name__)
+
+MINUTE = 60
+HOUR = 3600
+RESOLUTIONS = (MINUTE, HOUR)
+
+
+@dataclass(frozen=True)
+class PeerSample:
+    """Строка пира из `wg show all dump`.
+
+    :param interface: интерфейс WireGuard.
+    :param public_key: публичный ключ пира.
+    :param latest_handshake: время последнего handshake (None — ещё не было).
+    :param rx_bytes: принято байт с момента поднятия интерфейса.
+    :param tx_bytes: отправлено байт с момента поднятия интерфейса.
+    """
+
+    interface: str
+    public_key: str
+    latest_handshake: dt.datetime | None
+    rx_bytes: int
+    tx_bytes: int
+
+
+def parse_dump(text: str) -> list[PeerSample]:
+    """Разбирает вывод `wg show all dump`.
+
+    Строки интерфейсов (5 полей) пропускаются; строки пиров содержат 9 полей:
+    интерфейс, ключ, psk, endpoint, allowed-ips, handshake (epoch, 0 — не было),
+    rx, tx, keepalive.
+
+    :param text: вывод команды.
+    :return: список пиров.
+    """
+
+    samples: list[PeerSample] = []
+    for line in text.splitlines():
+        fields = line.split("\t")
+        if len(fields) != 9:
+            continue
+        interface, public_key, _psk, _endpoint, _allowed, handshake, rx, tx, _keepalive = fields
+        try:
+            epoch, rx_bytes, tx_bytes = int(handshake), int(rx), int(tx)
+        except ValueError:
+            logger.warning("Stats: skipping malformed dump line for %s", interface)
+            continue
+        samples.append(
+            PeerSample(
+                interface=interface,
+                public_key=public_key,
+                latest_handshake=dt.datetime.fromtimestamp(epoch, dt.timezone.utc) if epoch else None,
+                rx_bytes=rx_bytes,
+                tx_bytes=tx_bytes,
+            )
+        )
+    return samples
+
+
+async def read_dump(dump_file: str | None = None) -> str:
+    """Возвращает дамп пиров: из файла, если он задан, иначе из `wg show all dump`.
+
+    :param dump_file: путь к файлу с дампом.
+    :return: текст дампа.
+    :raises RuntimeError: если wg завершился с ошибкой.
+    """
+
+    if dump_file:
+        return await asyncio.to_thread(Path(dump_file).read_text)
+    process = await asyncio.create_subprocess_exec(
+        "wg",
+        "show",
+        "all",
+        "dump",
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode:
+        raise RuntimeError(f"wg show all dump: {stderr.decode().strip()}")
+    return stdout.decode()
+
+
+def bucket_start(moment: dt.datetime, resolution: int) -> dt.datetime:
+    """Начало интервала агрегата, в который попадает момент.
+
+    :param moment: время (UTC).
+    :param resolution: длина интервала в секундах.
+    :return: начало интервала.
+    """
+
+    epoch = int(moment.timestamp())
+    return dt.datetime.fromtimestamp(epoch - epoch % resolution, dt.timezone.utc)
+
+
+class PeerStatsCollector:
+    """Периодически снимает счётчики пиров и пишет дельты в key_usage."""
+
+    def __init__(self, settings: Settings, session_maker):
+        """Инициализация.
+
+        :param settings: конфигурация приложения.
+        :param session_maker: фабрика сессий primary.
+        """
+
+        self.settings = settings
+        self.session_maker = session_maker
+        self._baselines: dict[str, tuple[int, int]] = {}
+        self._handshakes: dict[str, dt.datetime] = {}
+        self._index: dict[str, uuid.UUID] = {}
+        self._index_loaded_at = float("-inf")
+        self._pruned_at = float("-inf")
+        self.duration = registry.histogram("bot_stats_collect_seconds", "Длительность сбора статистики пиров.")
+
+    async def _refresh_index(self, session) -> None:
+        """Перечитывает индекс публичный ключ -> id ключа."""
+
+        self._index = await VpnKeyRepository(session).peer_index()
+        self._index_loaded_at = time.monotonic()
+
+    async def collect_once(self, now: dt.datetime | None = None) -> int:
+        """Один проход: дамп, дельты, пакетная запись.
+
+        :param now: момент снятия (по умолчанию — текущее время UTC).
+        :return: число ключей, по которым записан трафик.
+        """
+
+        started = time.perf_counter()
+        now = now or dt.datetime.now(dt.timezone.utc)
+        samples = parse_dump(await read_dump(self.settings.wg_dump_file))
+
+        deltas: dict[str, tuple[int, int]] = {}
+        handshakes: dict[str, dt.datetime] = {}
+        for sample in samples:
+            previous = self._baselines.get(sample.public_key)
+            counters = (sample.rx_bytes, sample.tx_bytes)
+            self._baselines[sample.public_key] = counters
+            if previous is not None:
+                # Счётчики сбрасываются при перезапуске интерфейса: тогда весь текущий объём — дельта.
+                rx = counters[0] - previous[0] if counters[0] >= previous[0] else counters[0]
+                tx = counters[1] - previous[1] if counters[1] >= previous[1] else counters[1]
+                if rx or tx:
+                    deltas[sample.public_key] = (rx, tx)
+            if sample.latest_handshake and self._handshakes.get(sample.public_key) != sample.latest_handshake:
+                handshakes[sample.public_key] = sample.latest_handshake
+        seen = {sample.public_key for sample in samples}
+        for public_key in self._baselines.keys() - seen:
+            del self._baselines[public_key]
+            self._handshakes.pop(public_key, None)
+
+        written = 0
+        if deltas or handshakes:
+            async with self.session_maker() as session:
+                wanted = deltas.keys() | handshakes.keys()
+                interval = max(self.settings.stats_interval_seconds, 1)
+                if any(key not in self._index for key in wanted) and time.monotonic() - self._index_loaded_at >= interval:
+                    await self._refresh_index(session)
+                rows = [
+                    {
+                        "key_id": self._index[public_key],
+                        "resolution": resolution,
+                        "bucket_start": bucket_start(now, resolution),
+                        "rx_bytes": rx,
+                        "tx_bytes": tx,
+                    }
+                    for public_key, (rx, tx) in deltas.items()
+                    if public_key in self._index
+                    for resolution in RESOLUTIONS
+                ]
+                await UsageRepository(session).add(rows)
+                await VpnKeyRepository(session).set_last_handshakes(
+                    {self._index[key]: at for key, at in handshakes.items() if key in self._index}
+                )
+                await session.commit()
+            written = len(rows) // len(RESOLUTIONS)
+            for public_key in handshakes.keys() & self._index.keys():
+                self._handshakes[public_key] = handshakes[public_key]
+        self.duration.observe(time.perf_counter() - started)
+        return written
+
+    async def prune(self, now: dt.datetime | None = None) -> int:
+        """Удаляет минутные агрегаты старше срока хранения.
+
+        :param now: текущее время (UTC).
+        :return: число удалённых строк.
+        """
+
+        now = now or dt.datetime.now(dt.timezone.utc)
+        before = now - dt.timedelta(hours=self.settings.stats_minute_retention_hours)
+        async with self.session_maker() as session:
+            removed = await UsageRepository(session).prune(MINUTE, before)
+            await session.commit()
+        self._pruned_at = time.monotonic()
+        return removed
+
+    async def run(self) -> None:
+        """Бесконечный цикл сбора с интервалом STATS_INTERVAL_SECONDS.
+
+        :return: None.
+        """
+
+        interval = self.settings.stats_interval_seconds
+        while True:
+            try:
+                written = await self.collect_once()
+                if written:
+                    logger.debug("Stats: recorded traffic for %s keys", written)
+                if time.monotonic() - self._pruned_at >= HOUR:
+                    await self.prune()
+            except Exception as exc:  # pylint: disable=broad-except
+                logger.exception("Stats collector failed: %s", exc)
+            await asyncio.sleep(interval)
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+import asyncio
 import ipaddress
 import subprocess
+import weakref
 from dataclasses import dataclass
 from typing import Iterable
 
@@ -58,11 +60,83 @@ def generate_preshared_key() -> str:
     return _run_cmd(["wg", "genpsk"])
 
 
+_keygen_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[int, asyncio.Semaphore]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _keygen_semaphore(limit: int) -> asyncio.Semaphore:
+    """Общий на процесс (в рамках event loop) семафор генерации ключей.
+
+    :param limit: максимум одновременных запусков wg.
+    :return: семафор.
+    """
+
+    per_loop = _keygen_slots.setdefault(asyncio.get_running_loop(), {})
+    semaphore = per_loop.get(limit)
+    if semaphore is None:
+        semaphore = per_loop[limit] = asyncio.Semaphore(max(limit, 1))
+    return semaphore
+
+
+async def generate_keys(with_preshared: bool, concurrency: int) -> tuple[str, str, str | None]:
+    """Генерирует ключи в пуле потоков, ограничивая число параллельных запусков wg.
+
+    :param with_preshared: генерировать ли ещё и PSK.
+    :param concurrency: глобальный лимит параллельной генерации.
+    :return: кортеж (private, public, psk или None).
+    :raises CalledProcessError: если утилита wg недоступна.
+    """
+
+    def _generate() -> tuple[str, str, str | None]:
+        private_key, public_key = generate_keypair()
+        return private_key, public_key, generate_preshared_key() if with_preshared else None
+
+    async with _keygen_semaphore(concurrency):
+        return await asyncio.to_thread(_generate)
+
+
+async def swap_peer(
+    interface: str,
+    old_public_key: str | None,
+    new_public_key: str,
+    allowed_ip: str,
+    preshared_key: str | None = None,
+) -> None:
+    """Заменяет пира на интерфейсе одним вызовом `wg set` (удаление старого и добавление нового).
+
+    :param interface: интерфейс WireGuard.
+    :param old_public_key: ключ удаляемого пира (None — только добавить).
+    :param new_public_key: ключ нового пира.
+    :param allowed_ip: адрес клиента (ip/32 или ip/128).
+    :param preshared_key: PSK нового пира, передаётся через stdin.
+    :return: None.
+    :raises CalledProcessError: если wg вернул ошибку.
+    """
+
+    args = ["wg", "set", interface]
+    if old_public_key and old_public_key != new_public_key:
+        args += ["peer", old_public_key, "remove"]
+    args += ["peer", new_public_key, "allowed-ips", allowed_ip]
+    if preshared_key:
+        args += ["preshared-key", "/dev/stdin"]
+    await asyncio.to_thread(
+        subprocess.run,
+        args,
+        input=f"{preshared_key}\n" if preshared_key else None,
+        text=True,
+        check=True,
+        capture_output=True,
+    )
+
+
 def build_client_config(
     private_key: str,
     client_address: str,
     settings: Settings,
     preshared_key: str | None,
+    endpoint: str | None = None,
+    server_public_key: str | None = None,
 ) -> str:
     """Формирует конфиг клиента WireGuard.
 
@@ -70,6 +144,8 @@ def build_client_config(
     :param client_address: адрес клиента в туннеле.
     :param settings: конфигурация приложения.
     :param preshared_key: опциональный PSK.
+    :param endpoint: адрес:порт сервера (по умолчанию settings.wg_endpoint).
+    :param server_public_key: ключ сервера (по умолчанию settings.wg_server_public_key).
     :return: текст конфигурации.
     """
 
@@ -83,8 +159,8 @@ def build_client_config(
         f"DNS = {dns_line}\n"
         "\n"
         "[Peer]\n"
-        f"PublicKey = {settings.wg_server_public_key}\n"
-        f"Endpoint = {settings.wg_endpoint}\n"
+        f"PublicKey = {server_public_key or settings.wg_server_public_key}\n"
+        f"Endpoint = {endpoint or settings.wg_endpoint}\n"
         f"AllowedIPs = {allowed_ips}\n"
         f"{psk_line}"
         "PersistentKeepalive = 25\n"
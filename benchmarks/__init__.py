@@ -0,0 +1 @@
+# Benchmarks for the key lifecycle hot path (python -m benchmarks.bench_keys).
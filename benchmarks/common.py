@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import dataclasses
+import datetime as dt
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from pathlib import Path
+from typing import Awaitable, Callable
+
+import sqlalchemy
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker
+
+from app.config import Settings, load_settings
+from app.db import create_engine_for_url
+from app.models import Base
+
+BENCH_DIR = Path(__file__).resolve().parent
+FAKE_WG_DIR = BENCH_DIR / "fake_wg"
+RESULTS_DIR = BENCH_DIR / "results"
+DEFAULT_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
+
+
+def use_fake_wg() -> None:
+    """Подкладывает фейковый бинарь wg в начало PATH.
+
+    :return: None.
+    """
+
+    os.environ["PATH"] = f"{FAKE_WG_DIR}{os.pathsep}{os.environ.get('PATH', '')}"
+
+
+def bench_settings(database_url: str, **overrides) -> Settings:
+    """Возвращает конфигурацию для бенчмарков.
+
+    :param database_url: строка подключения к БД.
+    :param overrides: переопределения полей Settings.
+    :return: Settings.
+    """
+
+    base = dict(
+        database_url=database_url,
+        max_keys_per_user=1_000_000,
+        wg_client_address_cidr="10.8.0.0/16",
+        wg_preshared_key=None,
+        slow_query_ms=0,
+        repeated_query_threshold=0,
+    )
+    base.update(overrides)
+    return dataclasses.replace(load_settings(), **base)
+
+
+async def fresh_schema(database_url: str) -> AsyncEngine:
+    """Создаёт движок и пересоздаёт схему с нуля.
+
+    :param database_url: строка подключения (для Postgres — отдельная база под бенчмарки!).
+    :return: асинхронный движок.
+    """
+
+    engine = create_engine_for_url(database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    return engine
+
+
+def session_maker_for(engine: AsyncEngine):
+    """Фабрика сессий для бенчмарков.
+
+    :param engine: движок.
+    :return: async_sessionmaker.
+    """
+
+    return async_sessionmaker(engine, expire_on_commit=False)
+
+
+def summarize(samples: list[float]) -> dict[str, float]:
+    """Сводит замеры в статистику.
+
+    :param samples: длительности операций в секундах.
+    :return: словарь с n, ops_per_sec и перцентилями в мс.
+    """
+
+    ordered = sorted(samples)
+
+    def percentile(q: float) -> float:
+        index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+        return ordered[index] * 1000
+
+    total = sum(ordered)
+    return {
+        "n": len(ordered),
+        "ops_per_sec": len(ordered) / total if total else 0.0,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+    }
+
+
+async def measure(
+    iterations: int, operation: Callable[[int], Awaitable[object]]
+) -> dict[str, float]:
+    """Выполняет операцию iterations раз и меряет каждую.
+
+    :param iterations: число повторов.
+    :param operation: корутина от номера итерации.
+    :return: статистика summarize().
+    """
+
+    samples = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        await operation(i)
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def measure_sync(iterations: int, operation: Callable[[int], object]) -> dict[str, float]:
+    """Синхронный вариант measure().
+
+    :param iterations: число повторов.
+    :param operation: функция от номера итерации.
+    :return: статистика summarize().
+    """
+
+    samples = []
+    for i in range(iterations):
+        started = time.perf_counter()
+        operation(i)
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def _git_revision() -> str | None:
+    """Возвращает текущий коммит, если доступен git."""
+
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(results: dict[str, dict], database_url: str, output: str | None) -> Path:
+    """Сохраняет результаты в JSON.
+
+    :param results: имя кейса -> статистика.
+    :param database_url: использованная БД (без пароля).
+    :param output: путь файла; по умолчанию benchmarks/results/<timestamp>.json.
+    :return: путь к файлу.
+    """
+
+    now = dt.datetime.now(dt.timezone.utc)
+    path = Path(output) if output else RESULTS_DIR / f"{now:%Y%m%d-%H%M%S}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "meta": {
+            "timestamp": now.isoformat(),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "database": sqlalchemy.engine.make_url(database_url).render_as_string(hide_password=True),
+        },
+        "results": results,
+    }
+    path.write_text(json.dumps(payload, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+    return path
@@ -0,0 +1,83 @@
+"""Сравнение двух прогонов бенчмарков.
+
+    python -m benchmarks.compare benchmarks/results/old.json benchmarks/results/new.json --threshold 10
+
+Код выхода 1, если p50 или пропускная способность хоть одного кейса ухудшились больше порога (%).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def load(path: str) -> dict[str, dict]:
+    """Читает результаты прогона.
+
+    :param path: путь к JSON.
+    :return: имя кейса -> статистика.
+    """
+
+    return json.loads(Path(path).read_text(encoding="utf-8"))["results"]
+
+
+def change(old: float, new: float) -> float:
+    """Относительное изменение в процентах.
+
+    :param old: базовое значение.
+    :param new: новое значение.
+    :return: (new - old) / old * 100.
+    """
+
+    if not old:
+        return 0.0
+    return (new - old) / old * 100
+
+
+def compare(baseline: dict[str, dict], candidate: dict[str, dict], threshold: float) -> list[str]:
+    """Печатает таблицу сравнения и возвращает регрессии.
+
+    :param baseline: результаты базового прогона.
+    :param candidate: результаты нового прогона.
+    :param threshold: допустимое ухудшение в процентах.
+    :return: имена кейсов с регрессией.
+    """
+
+    regressions = []
+    print(f"{'case':<48} {'ops/s old':>11} {'ops/s new':>11} {'Δ%':>7} {'p50 old':>9} {'p50 new':>9} {'Δ%':>7}")
+    for name in sorted(set(baseline) | set(candidate)):
+        if name not in baseline or name not in candidate:
+            print(f"{name:<48} {'только в одном прогоне':>40}")
+            continue
+        old, new = baseline[name], candidate[name]
+        ops_delta = change(old["ops_per_sec"], new["ops_per_sec"])
+        p50_delta = change(old["p50_ms"], new["p50_ms"])
+        regressed = ops_delta < -threshold or p50_delta > threshold
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:<48} {old['ops_per_sec']:>11.1f} {new['ops_per_sec']:>11.1f} {ops_delta:>+7.1f} "
+            f"{old['p50_ms']:>9.3f} {new['p50_ms']:>9.3f} {p50_delta:>+7.1f}"
+            + ("  REGRESSION" if regressed else "")
+        )
+    return regressions
+
+
+def main() -> None:
+    """CLI сравнения."""
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Допустимое ухудшение, %.")
+    args = parser.parse_args()
+    regressions = compare(load(args.baseline), load(args.candidate), args.threshold)
+    if regressions:
+        print(f"Регрессии ({len(regressions)}): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""Нагрузочный генератор: синтетические апдейты Telegram прямо в Dispatcher.
+
+    python -m benchmarks.load --rate 50 --duration 30 --users 500 \\
+        --mix start=1,menu=3,create=1,list=3,rotate=1,revoke=1
+
+Сеть не нужна: Bot работает через подменённую сессию, wg — через benchmarks/fake_wg.
+По умолчанию используется временная SQLite-база; Postgres — --database-url
+(схема создаётся через create_all, берите отдельную базу).
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import datetime as dt
+import itertools
+import logging
+import os
+import random
+import re
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import Chat, Message, Update
+
+from app.bot.callbacks import KeyCreateAction, KeyRevokeAction, KeyRotateAction, MenuAction, render_nonce
+from app.db import get_session_router, init_models
+from app.main import build_dispatcher
+from app.metrics import registry
+from benchmarks.common import bench_settings, summarize, use_fake_wg, write_results
+
+DEFAULT_MIX = "start=1,menu=3,create=1,list=3,rotate=1,revoke=1"
+_CONFIG_NAME_RE = re.compile(r"wg-([0-9a-f-]{36})\.conf")
+
+
+class MockSession(BaseSession):
+    """Сессия Bot API без сети: отвечает правдоподобными объектами и запоминает выданные ключи."""
+
+    def __init__(self) -> None:
+        """Инициализация."""
+
+        super().__init__()
+        self.calls: dict[str, int] = defaultdict(int)
+        self.issued_keys: dict[int, list[str]] = defaultdict(list)
+        self._message_ids = itertools.count(1_000_000)
+
+    async def close(self) -> None:
+        """Нечего закрывать."""
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        """Скачивание файлов в нагрузке не используется."""
+
+        raise NotImplementedError
+        yield b""  # pragma: no cover
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: int | None = None) -> Any:
+        """Возвращает ответ по типу метода.
+
+        :param bot: экземпляр бота.
+        :param method: вызванный метод Bot API.
+        :param timeout: не используется.
+        :return: Message для отправок/правок, True для остального.
+        """
+
+        name = type(method).__name__
+        self.calls[name] += 1
+        chat_id = getattr(method, "chat_id", None)
+        files = [getattr(method, "document", None)]
+        files += [getattr(item, "media", None) for item in getattr(method, "media", None) or []]
+        for input_file in files:
+            match = _CONFIG_NAME_RE.fullmatch(getattr(input_file, "filename", None) or "")
+            if match and chat_id is not None:
+                self.issued_keys[int(chat_id)].append(match.group(1))
+        if method.__returning__ is bool:
+            return True
+        message = Message(
+            message_id=getattr(method, "message_id", None) or next(self._message_ids),
+            date=dt.datetime.now(dt.timezone.utc),
+            chat=Chat(id=int(chat_id or 0), type="private"),
+            text=getattr(method, "text", None),
+        )
+        if isinstance(getattr(method, "media", None), list):
+            return [message]
+        return message
+
+
+class UpdateFactory:
+    """Строит синтетические Update для набора пользователей."""
+
+    def __init__(self, bot: Bot, session: MockSession, users: int):
+        """Инициализация.
+
+        :param bot: бот, к которому монтируются апдейты.
+        :param session: mock-сессия (источник выданных ключей).
+        :param users: размер пула пользователей.
+        """
+
+        self.bot = bot
+        self.session = session
+        self.users = users
+        self._update_ids = itertools.count(1)
+        self._ids = itertools.count(1)
+
+    def _user(self, telegram_id: int) -> dict:
+        return {"id": telegram_id, "is_bot": False, "first_name": "Load", "username": f"load{telegram_id}"}
+
+    def _message(self, telegram_id: int, text: str) -> dict:
+        return {
+            "message_id": next(self._ids),
+            "date": int(time.time()),
+            "chat": {"id": telegram_id, "type": "private"},
+            "from": self._user(telegram_id),
+            "text": text,
+        }
+
+    def _callback(self, telegram_id: int, data: str) -> dict:
+        return {
+            "id": str(next(self._ids)),
+            "from": self._user(telegram_id),
+            "chat_instance": str(telegram_id),
+            "message": self._message(telegram_id, "menu"),
+            "data": data,
+        }
+
+    def build(self, action: str) -> tuple[str, Update]:
+        """Создаёт апдейт для действия.
+
+        rotate/revoke без уже выданного пользователю ключа превращаются в create.
+
+        :param action: start/menu/create/list/rotate/revoke.
+        :return: (фактическое действие, Update).
+        """
+
+        telegram_id = 5_000_000 + random.randrange(self.users)
+        payload: dict[str, Any] = {"update_id": next(self._update_ids)}
+        if action in ("rotate", "revoke") and not self.session.issued_keys.get(telegram_id):
+            action = "create"
+        if action == "start":
+            payload["message"] = self._message(telegram_id, "/start")
+        else:
+            if action == "menu":
+                data = MenuAction(action=random.choice(("home", "help", "create"))).pack()
+            elif action == "create":
+                data = KeyCreateAction(hours=random.choice((24, 24 * 7, 0)), nonce=render_nonce()).pack()
+            elif action == "list":
+                data = MenuAction(action="list").pack()
+            else:
+                key_id = self.session.issued_keys[telegram_id].pop()
+                if action == "rotate":
+                    data = KeyRotateAction(key_id=key_id, nonce=render_nonce()).pack()
+                else:
+                    data = KeyRevokeAction(key_id=key_id).pack()
+            payload["callback_query"] = self._callback(telegram_id, data)
+        return action, Update.model_validate(payload, context={"bot": self.bot})
+
+
+def parse_mix(raw: str) -> dict[str, float]:
+    """Разбирает строку вида start=1,list=3.
+
+    :param raw: описание смеси.
+    :return: действие -> вес.
+    """
+
+    mix = {}
+    for item in raw.split(","):
+        name, _, weight = item.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - {"start", "menu", "create", "list", "rotate", "revoke"}
+    if unknown:
+        raise SystemExit(f"Неизвестные действия в --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def pool_usage(engine) -> tuple[int, int] | None:
+    """Возвращает (занято, ёмкость) пула соединений, если пул это поддерживает.
+
+    :param engine: асинхронный движок.
+    :return: кортеж или None.
+    """
+
+    pool = engine.sync_engine.pool
+    if not all(hasattr(pool, attr) for attr in ("checkedout", "size", "_max_overflow")):
+        return None
+    return pool.checkedout(), pool.size() + max(pool._max_overflow, 0)
+
+
+async def run_load(args: argparse.Namespace) -> dict[str, dict]:
+    """Прогоняет нагрузку и печатает отчёт.
+
+    :param args: аргументы CLI.
+    :return: статистика по действиям (для JSON).
+    """
+
+    overrides: dict[str, Any] = {}
+    if args.no_admission:
+        overrides = {
+            "ratelimit_cheap_rate": 1e6,
+            "ratelimit_cheap_burst": 1e6,
+            "ratelimit_expensive_rate": 1e6,
+            "ratelimit_expensive_burst": 1e6,
+            "ratelimit_global_expensive_rate": 1e6,
+        }
+    settings = bench_settings(args.database_url, bot_token="123456:load-test", admin_ids=set(), **overrides)
+    sessions = get_session_router(settings)
+    session_maker = sessions.primary
+    engine = session_maker.kw["bind"]
+    await init_models(session_maker)
+
+    session = MockSession()
+    bot = Bot(token=settings.bot_token, session=session)
+    dp = build_dispatcher(settings, session_maker, sessions=sessions)
+    factory = UpdateFactory(bot, session, args.users)
+    mix = parse_mix(args.mix)
+    actions, weights = list(mix), list(mix.values())
+
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    pool_samples: list[float] = []
+    in_flight: set[asyncio.Task] = set()
+
+    async def handle(action: str, update: Update) -> None:
+        started = time.perf_counter()
+        try:
+            await dp.feed_update(bot, update)
+        except Exception as exc:  # pylint: disable=broad-except
+            if not errors[action]:
+                logging.warning("First %s failure: %r", action, exc)
+            errors[action] += 1
+        latencies[action].append(time.perf_counter() - started)
+
+    async def sample_pool() -> None:
+        while True:
+            usage = pool_usage(engine)
+            if usage:
+                pool_samples.append(usage[0] / usage[1])
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.create_task(sample_pool())
+    started = time.perf_counter()
+    deadline = started + args.duration
+    while time.perf_counter() < deadline:
+        action, update = factory.build(random.choices(actions, weights)[0])
+        task = asyncio.create_task(handle(action, update))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        await asyncio.sleep(random.expovariate(args.rate))
+    if in_flight:
+        await asyncio.wait(in_flight)
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+    await sessions.close()
+    await engine.dispose()
+
+    all_samples = [value for values in latencies.values() for value in values]
+    results = {f"load[{action}]": summarize(values) for action, values in sorted(latencies.items())}
+    results["load[all]"] = summarize(all_samples)
+    results["load[all]"]["throughput"] = len(all_samples) / elapsed
+
+    print(f"Обработано {len(all_samples)} апдейтов за {elapsed:.1f} с: {len(all_samples) / elapsed:.1f} апд/с")
+    for name, stats in results.items():
+        action = name[5:-1]
+        print(
+            f"{action:<8} n={stats['n']:<6} p50 {stats['p50_ms']:8.1f} ms  p95 {stats['p95_ms']:8.1f} ms  "
+            f"p99 {stats['p99_ms']:8.1f} ms  ошибок {errors.get(action, 0) if action != 'all' else sum(errors.values())}"
+        )
+    if pool_samples:
+        print(
+            f"Пул БД: средняя загрузка {sum(pool_samples) / len(pool_samples):.0%}, "
+            f"пик {max(pool_samples):.0%}, в насыщении {sum(s >= 1 for s in pool_samples) / len(pool_samples):.0%} времени"
+        )
+    else:
+        print("Пул БД: статистика недоступна для этого пула (например, SQLite NullPool/StaticPool).")
+    rejected = registry.counter("bot_ratelimit_rejected_total", "", labels=("kind",))
+    print(
+        "Отклонено admission control:",
+        {kind: int(rejected.value(kind)) for kind in ("cheap", "expensive", "global")},
+    )
+    print("Вызовы Bot API:", dict(session.calls))
+    return results
+
+
+def main() -> None:
+    """CLI нагрузочного генератора."""
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"))
+    parser.add_argument("--rate", type=float, default=20.0, help="Средняя интенсивность, апдейтов/с (Пуассон).")
+    parser.add_argument("--duration", type=float, default=10.0, help="Длительность генерации, с.")
+    parser.add_argument("--users", type=int, default=200, help="Размер пула пользователей.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Веса действий.")
+    parser.add_argument(
+        "--no-admission", action="store_true", help="Снять лимиты RATELIMIT_* (мерить только обработку)."
+    )
+    parser.add_argument("--output", help="Сохранить результаты в JSON (формат benchmarks.compare).")
+    args = parser.parse_args()
+
+    use_fake_wg()
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.database_url:
+            args.database_url = f"sqlite+aiosqlite:///{tmp}/load.db"
+        results = asyncio.run(run_load(args))
+    if args.output:
+        print(f"Saved to {write_results(results, args.database_url, args.output)}")
+
+
+if __name__ == "__main__":
+    main()